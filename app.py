@@ -1,14 +1,24 @@
-import streamlit as st
-import pandas as pd
-import numpy as np
-import joblib
+import os
+import time
 from datetime import datetime
 
-# ==================================================
-# Load model and feature columns
-# ==================================================
-model = joblib.load("car_price_model.pkl")
-model_columns = joblib.load("model_columns.pkl")
+import streamlit as st
+
+import warmup
+from catalogue import (
+    COLORS,
+    ENGINE_RANGE,
+    FUEL_TYPES,
+    KM_RANGE,
+    MIN_YEAR,
+    OWNERS,
+    POWER_RANGE,
+    TANK_RANGE,
+    catalogue,
+    luxury_brands,
+    transmissions_for,
+)
+from metrics import metrics, start_exporters
 
 CURRENT_YEAR = datetime.now().year
 
@@ -24,501 +34,23 @@ st.set_page_config(
 # ==================================================
 # Custom CSS for modern styling (Light + Dark mode)
 # ==================================================
-st.markdown("""
-<style>
-    /* ==================== CSS Variables ==================== */
-    :root {
-        /* Light mode colors */
-        --bg-primary: #ffffff;
-        --bg-secondary: #f8fafc;
-        --bg-tertiary: #f1f5f9;
-        --bg-card: #ffffff;
-        --text-primary: #0f172a;
-        --text-secondary: #475569;
-        --text-muted: #64748b;
-        --border-color: #e2e8f0;
-        --border-light: #cbd5e1;
-        --input-bg: #f8fafc;
-        --input-bg-hover: #ffffff;
-        --shadow-color: rgba(0, 0, 0, 0.08);
-        --info-bg: linear-gradient(135deg, #eff6ff 0%, #dbeafe 100%);
-        --info-border: #bfdbfe;
-        --info-text: #1e40af;
-    }
-
-    /* Dark mode colors */
-    @media (prefers-color-scheme: dark) {
-        :root {
-            --bg-primary: #1e293b;
-            --bg-secondary: #0f172a;
-            --bg-tertiary: #334155;
-            --bg-card: #1e293b;
-            --text-primary: #f1f5f9;
-            --text-secondary: #cbd5e1;
-            --text-muted: #94a3b8;
-            --border-color: #334155;
-            --border-light: #475569;
-            --input-bg: #1e293b;
-            --input-bg-hover: #334155;
-            --shadow-color: rgba(0, 0, 0, 0.3);
-            --info-bg: linear-gradient(135deg, #1e3a5f 0%, #0f172a 100%);
-            --info-border: #1e3a5f;
-            --info-text: #7dd3fc;
-        }
-    }
-
-    /* ==================== Hide Streamlit Elements ==================== */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-
-    /* ==================== Main Container ==================== */
-    .block-container {
-        padding: 1rem 2rem 2rem 2rem;
-        max-width: 1400px;
-    }
-
-    /* ==================== Hero Section ==================== */
-    .hero-section {
-        background: linear-gradient(135deg, #0f172a 0%, #1e3a5f 50%, #0ea5e9 100%);
-        padding: 2rem 2.5rem;
-        border-radius: 24px;
-        margin-bottom: 2rem;
-        text-align: center;
-        box-shadow: 0 20px 60px rgba(15, 23, 42, 0.4);
-        position: relative;
-        overflow: hidden;
-    }
-    .hero-section::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        bottom: 0;
-        background: url("data:image/svg+xml,%3Csvg width='60' height='60' viewBox='0 0 60 60' xmlns='http://www.w3.org/2000/svg'%3E%3Cg fill='none' fill-rule='evenodd'%3E%3Cg fill='%23ffffff' fill-opacity='0.03'%3E%3Cpath d='M36 34v-4h-2v4h-4v2h4v4h2v-4h4v-2h-4zm0-30V0h-2v4h-4v2h4v4h2V6h4V4h-4zM6 34v-4H4v4H0v2h4v4h2v-4h4v-2H6zM6 4V0H4v4H0v2h4v4h2V6h4V4H6z'/%3E%3C/g%3E%3C/g%3E%3C/svg%3E");
-        opacity: 0.5;
-    }
-    .hero-content {
-        position: relative;
-        z-index: 1;
-    }
-    .hero-section h1 {
-        color: white;
-        font-size: 2.5rem;
-        font-weight: 800;
-        margin-bottom: 0.5rem;
-        letter-spacing: -1px;
-        text-shadow: 0 2px 10px rgba(0,0,0,0.2);
-    }
-    .hero-section p {
-        color: rgba(255, 255, 255, 0.9);
-        font-size: 1.05rem;
-        margin: 0;
-        font-weight: 400;
-    }
-    .hero-badge {
-        display: inline-block;
-        background: rgba(255,255,255,0.15);
-        backdrop-filter: blur(10px);
-        padding: 0.4rem 1rem;
-        border-radius: 50px;
-        font-size: 0.8rem;
-        color: white;
-        margin-bottom: 1rem;
-        border: 1px solid rgba(255,255,255,0.2);
-    }
-
-    /* ==================== Section Titles ==================== */
-    .section-title {
-        display: flex;
-        align-items: center;
-        gap: 0.75rem;
-        margin-bottom: 1rem;
-        padding-bottom: 0.75rem;
-        border-bottom: 2px solid var(--border-color);
-    }
-    .section-icon {
-        width: 36px;
-        height: 36px;
-        border-radius: 10px;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        font-size: 1.1rem;
-    }
-    .section-icon.blue { background: linear-gradient(135deg, #dbeafe 0%, #bfdbfe 100%); }
-    .section-icon.green { background: linear-gradient(135deg, #d1fae5 0%, #a7f3d0 100%); }
-    .section-icon.orange { background: linear-gradient(135deg, #fed7aa 0%, #fdba74 100%); }
-    .section-icon.purple { background: linear-gradient(135deg, #e9d5ff 0%, #d8b4fe 100%); }
-    .section-label {
-        font-size: 1rem;
-        font-weight: 600;
-        color: var(--text-primary);
-        margin: 0;
-    }
-
-    /* ==================== Panel Header ==================== */
-    .panel-header {
-        display: flex;
-        align-items: center;
-        gap: 0.75rem;
-        margin-bottom: 1.25rem;
-    }
-    .panel-icon {
-        width: 44px;
-        height: 44px;
-        background: linear-gradient(135deg, #fef3c7 0%, #fde68a 100%);
-        border-radius: 12px;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        font-size: 1.3rem;
-    }
-    .panel-title {
-        font-size: 1.15rem;
-        font-weight: 700;
-        color: var(--text-primary);
-        margin: 0;
-    }
-    .panel-subtitle {
-        font-size: 0.8rem;
-        color: var(--text-muted);
-        margin: 0;
-    }
-
-    /* ==================== Car Summary Card ==================== */
-    .car-summary {
-        background: var(--bg-tertiary);
-        padding: 1.25rem;
-        border-radius: 16px;
-        margin-bottom: 1rem;
-        border: 1px solid var(--border-light);
-    }
-    .car-summary h4 {
-        margin: 0;
-        color: var(--text-primary);
-        font-size: 1.1rem;
-        font-weight: 700;
-    }
-    .car-summary p {
-        margin: 0.5rem 0 0 0;
-        color: var(--text-secondary);
-        font-size: 0.85rem;
-    }
-    .car-specs {
-        display: flex;
-        gap: 0.5rem;
-        margin-top: 0.75rem;
-        flex-wrap: wrap;
-    }
-    .spec-tag {
-        background: var(--bg-card);
-        padding: 0.3rem 0.7rem;
-        border-radius: 6px;
-        font-size: 0.75rem;
-        color: var(--text-secondary);
-        border: 1px solid var(--border-color);
-    }
-
-    /* ==================== Price Display ==================== */
-    .price-display {
-        background: linear-gradient(135deg, #0f172a 0%, #1e3a5f 100%);
-        padding: 1.75rem 1.5rem;
-        border-radius: 20px;
-        text-align: center;
-        color: white;
-        margin: 1rem 0;
-        box-shadow: 0 15px 40px rgba(15, 23, 42, 0.3);
-        position: relative;
-        overflow: hidden;
-    }
-    .price-display::before {
-        content: '';
-        position: absolute;
-        top: -50%;
-        right: -50%;
-        width: 100%;
-        height: 100%;
-        background: radial-gradient(circle, rgba(14,165,233,0.2) 0%, transparent 70%);
-    }
-    .price-content {
-        position: relative;
-        z-index: 1;
-    }
-    .price-label {
-        font-size: 0.8rem;
-        opacity: 0.9;
-        margin-bottom: 0.5rem;
-        text-transform: uppercase;
-        letter-spacing: 2px;
-        font-weight: 500;
-    }
-    .price-value {
-        font-size: 2.75rem;
-        font-weight: 800;
-        margin: 0;
-        line-height: 1.1;
-        letter-spacing: -1px;
-    }
-    .price-currency {
-        font-size: 0.85rem;
-        opacity: 0.7;
-        margin-top: 0.25rem;
-        font-weight: 500;
-    }
-
-    /* ==================== Estimate Cards ==================== */
-    .estimate-row {
-        display: flex;
-        gap: 0.75rem;
-        margin-top: 1rem;
-    }
-    .estimate-card {
-        flex: 1;
-        background: var(--bg-card);
-        padding: 1rem;
-        border-radius: 14px;
-        text-align: center;
-        border: 1px solid var(--border-color);
-        transition: all 0.2s ease;
-    }
-    .estimate-card:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 4px 12px var(--shadow-color);
-    }
-    .estimate-card.low {
-        border-bottom: 3px solid #f59e0b;
-    }
-    .estimate-card.high {
-        border-bottom: 3px solid #10b981;
-    }
-    .estimate-label {
-        font-size: 0.7rem;
-        color: var(--text-muted);
-        text-transform: uppercase;
-        letter-spacing: 0.5px;
-        margin-bottom: 0.25rem;
-        font-weight: 600;
-    }
-    .estimate-value {
-        font-size: 1.3rem;
-        font-weight: 700;
-        color: var(--text-primary);
-    }
-
-    /* ==================== Placeholder Card ==================== */
-    .placeholder-card {
-        background: var(--bg-tertiary);
-        padding: 2.5rem 2rem;
-        border-radius: 20px;
-        text-align: center;
-        border: 2px dashed var(--border-light);
-        margin: 1rem;
-    }
-    .placeholder-icon {
-        font-size: 3rem;
-        margin-bottom: 0.75rem;
-        filter: grayscale(0.3);
-    }
-    .placeholder-text {
-        color: var(--text-muted);
-        font-size: 0.95rem;
-        line-height: 1.7;
-    }
-    .placeholder-text strong {
-        color: #0ea5e9;
-    }
-
-    /* ==================== Button Styling ==================== */
-    .stButton > button {
-        background: linear-gradient(135deg, #0ea5e9 0%, #0284c7 100%);
-        color: white;
-        border: none;
-        padding: 0.9rem 2rem;
-        font-size: 1rem;
-        font-weight: 600;
-        border-radius: 14px;
-        width: 100%;
-        transition: all 0.3s ease;
-        box-shadow: 0 8px 25px rgba(14, 165, 233, 0.35);
-        text-transform: uppercase;
-        letter-spacing: 0.5px;
-    }
-    .stButton > button:hover {
-        transform: translateY(-3px);
-        box-shadow: 0 12px 35px rgba(14, 165, 233, 0.45);
-        background: linear-gradient(135deg, #38bdf8 0%, #0ea5e9 100%);
-    }
-    .stButton > button:active {
-        transform: translateY(-1px);
-    }
-
-    /* ==================== Input Styling (Light Mode) ==================== */
-    .stSelectbox > div > div,
-    .stNumberInput > div > div > input {
-        border-radius: 12px !important;
-        border-color: var(--border-color) !important;
-        background: var(--input-bg) !important;
-        color: var(--text-primary) !important;
-        transition: all 0.2s ease;
-    }
-    .stSelectbox > div > div:hover,
-    .stNumberInput > div > div:hover {
-        border-color: var(--border-light) !important;
-        background: var(--input-bg-hover) !important;
-    }
-    .stSelectbox > div > div:focus-within,
-    .stNumberInput > div > div:focus-within {
-        border-color: #0ea5e9 !important;
-        box-shadow: 0 0 0 3px rgba(14, 165, 233, 0.15) !important;
-        background: var(--input-bg-hover) !important;
-    }
-
-    /* Selectbox dropdown text */
-    .stSelectbox [data-baseweb="select"] span {
-        color: var(--text-primary) !important;
-    }
-
-    /* Labels */
-    .stSelectbox label, .stNumberInput label {
-        color: var(--text-secondary) !important;
-        font-weight: 600 !important;
-        font-size: 0.85rem !important;
-        margin-bottom: 0.3rem !important;
-    }
-
-    /* ==================== Streamlit Container Borders ==================== */
-    [data-testid="stVerticalBlock"] > div:has(> div.stMarkdown) {
-        border-color: var(--border-color) !important;
-    }
-
-    /* ==================== Divider ==================== */
-    .divider {
-        height: 1px;
-        background: linear-gradient(90deg, transparent, var(--border-color), transparent);
-        margin: 1.25rem 0;
-    }
-
-    /* ==================== Footer ==================== */
-    .footer {
-        text-align: center;
-        padding: 2.5rem 0 5rem 0;
-        color: var(--text-muted);
-        font-size: 0.85rem;
-    }
-    .footer-content {
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        gap: 0.5rem;
-    }
-
-    /* ==================== Info Tip ==================== */
-    .info-tip {
-        background: var(--info-bg);
-        border: 1px solid var(--info-border);
-        border-radius: 12px;
-        padding: 0.85rem 1rem;
-        font-size: 0.85rem;
-        color: var(--info-text);
-        margin: 1rem;
-        display: flex;
-        align-items: flex-start;
-        gap: 0.5rem;
-    }
-    .info-tip-icon {
-        flex-shrink: 0;
-    }
-
-    /* ==================== Dark Mode Specific Overrides ==================== */
-    @media (prefers-color-scheme: dark) {
-        /* Streamlit native elements */
-        .stApp {
-            background-color: var(--bg-secondary);
-        }
-
-        /* Container borders */
-        [data-testid="stVerticalBlockBorderWrapper"] {
-            background-color: var(--bg-card) !important;
-            border-color: var(--border-color) !important;
-        }
-
-        /* Selectbox dropdown menu */
-        [data-baseweb="popover"] {
-            background-color: var(--bg-card) !important;
-        }
-        [data-baseweb="popover"] li {
-            background-color: var(--bg-card) !important;
-            color: var(--text-primary) !important;
-        }
-        [data-baseweb="popover"] li:hover {
-            background-color: var(--bg-tertiary) !important;
-        }
-
-        /* Number input */
-        .stNumberInput input {
-            color: var(--text-primary) !important;
-        }
-
-        /* Selectbox SVG arrow */
-        .stSelectbox svg {
-            fill: var(--text-muted) !important;
-        }
-
-        /* Warning box */
-        .stAlert {
-            background-color: rgba(251, 191, 36, 0.1) !important;
-            border-color: #f59e0b !important;
-        }
-
-        /* Section icons - slightly muted in dark mode */
-        .section-icon.blue { background: linear-gradient(135deg, #1e3a5f 0%, #1e40af 100%); }
-        .section-icon.green { background: linear-gradient(135deg, #064e3b 0%, #065f46 100%); }
-        .section-icon.orange { background: linear-gradient(135deg, #78350f 0%, #92400e 100%); }
-        .section-icon.purple { background: linear-gradient(135deg, #4c1d95 0%, #5b21b6 100%); }
-    }
-
-    /* ==================== Responsive Adjustments ==================== */
-    @media (max-width: 768px) {
-        .hero-section h1 { font-size: 1.8rem; }
-        .price-value { font-size: 2.2rem; }
-        .block-container { padding: 1rem; }
-    }
-</style>
-""", unsafe_allow_html=True)
+CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "app.css")
 
-# ==================================================
-# Brand → Model mapping
-# ==================================================
-brand_model_map = {
-    "Maruti": ["Swift", "Baleno", "Alto"],
-    "Hyundai": ["i10", "i20", "Creta"],
-    "Honda": ["City", "Amaze", "Civic"],
-    "Toyota": ["Corolla", "Innova", "Fortuner"],
-    "Mercedes-Benz": ["C-Class", "E-Class", "S-Class"],
-    "BMW": ["3 Series", "5 Series", "X5"],
-    "Audi": ["A4", "A6", "Q7"],
-    "Ferrari": ["488 Gtb"],
-    "Rolls-Royce": ["Ghost"],
-}
 
-# ==================================================
-# Smart defaults by brand
-# ==================================================
-brand_defaults = {
-    "Maruti": {"engine": 1200, "power": 82, "tank": 37},
-    "Hyundai": {"engine": 1200, "power": 83, "tank": 37},
-    "Honda": {"engine": 1500, "power": 119, "tank": 40},
-    "Toyota": {"engine": 2700, "power": 201, "tank": 80},
-    "BMW": {"engine": 3000, "power": 258, "tank": 68},
-    "Mercedes-Benz": {"engine": 3000, "power": 258, "tank": 66},
-    "Audi": {"engine": 3000, "power": 245, "tank": 65},
-    "Ferrari": {"engine": 3900, "power": 660, "tank": 78},
-    "Rolls-Royce": {"engine": 6600, "power": 563, "tank": 82},
-}
+@st.cache_resource
+def inline_css():
+    with open(CSS_PATH) as fh:
+        return f"<style>{fh.read()}</style>"
 
-luxury_brands = ["BMW", "Mercedes-Benz", "Audi", "Ferrari", "Rolls-Royce"]
+
+if st.get_option("server.enableStaticServing"):
+    # Served as a static file (see .streamlit/config.toml): the browser
+    # fetches and caches it once instead of every rerun re-sending it.
+    st.markdown(
+        '<style>@import url("app/static/app.css");</style>', unsafe_allow_html=True
+    )
+else:
+    st.markdown(inline_css(), unsafe_allow_html=True)
 
 # ==================================================
 # Hero Section
@@ -550,15 +82,23 @@ with left_col:
         </div>
         """, unsafe_allow_html=True)
 
-        col1, col2, col3 = st.columns(3)
+        # Every variant the model knows (see catalogue.py); the variant list
+        # is a prefix search of the precomputed index
+        col1, col2, col3, col4 = st.columns([2, 2, 3, 2])
         with col1:
-            brand = st.selectbox("Brand", list(brand_model_map.keys()))
+            brand = st.selectbox(
+                "Brand",
+                catalogue.brands,
+                index=catalogue.brands.index(catalogue.most_listed_brand()),
+            )
         with col2:
-            model_name = st.selectbox("Model", brand_model_map[brand])
+            family = st.selectbox("Model", catalogue.families(brand))
         with col3:
+            model_name = st.selectbox("Variant", catalogue.variants(brand, family))
+        with col4:
             year = st.number_input(
                 "Manufacturing Year",
-                min_value=1995,
+                min_value=MIN_YEAR,
                 max_value=CURRENT_YEAR,
                 value=2018,
                 step=1
@@ -577,32 +117,32 @@ with left_col:
         </div>
         """, unsafe_allow_html=True)
 
-        defaults = brand_defaults[brand]
+        defaults = catalogue.defaults(brand, model_name)
         col1, col2, col3 = st.columns(3)
 
         with col1:
             engine_cc = st.number_input(
                 "Engine Capacity (CC)",
-                min_value=800,
-                max_value=7000,
+                min_value=ENGINE_RANGE[0],
+                max_value=ENGINE_RANGE[1],
                 value=defaults["engine"],
-                step=100
+                step=ENGINE_RANGE[2]
             )
         with col2:
             max_power = st.number_input(
                 "Max Power (BHP)",
-                min_value=50,
-                max_value=800,
+                min_value=POWER_RANGE[0],
+                max_value=POWER_RANGE[1],
                 value=defaults["power"],
-                step=5
+                step=POWER_RANGE[2]
             )
         with col3:
             fuel_tank = st.number_input(
                 "Fuel Tank Capacity (Liters)",
-                min_value=30,
-                max_value=100,
+                min_value=TANK_RANGE[0],
+                max_value=TANK_RANGE[1],
                 value=defaults["tank"],
-                step=1
+                step=TANK_RANGE[2]
             )
 
     st.markdown("<div style='height: 0.75rem'></div>", unsafe_allow_html=True)
@@ -623,18 +163,18 @@ with left_col:
         with col1:
             km_driven = st.number_input(
                 "Kilometers Driven",
-                min_value=0,
-                max_value=300_000,
+                min_value=KM_RANGE[0],
+                max_value=KM_RANGE[1],
                 value=50_000,
-                step=5_000
+                step=KM_RANGE[2]
             )
         with col2:
             transmission = st.selectbox(
                 "Transmission",
-                ["Automatic"] if brand in luxury_brands else ["Manual", "Automatic"]
+                transmissions_for(brand)
             )
         with col3:
-            fuel = st.selectbox("Fuel Type", ["Petrol", "Diesel", "Electric", "CNG"])
+            fuel = st.selectbox("Fuel Type", FUEL_TYPES)
 
     st.markdown("<div style='height: 0.75rem'></div>", unsafe_allow_html=True)
 
@@ -654,12 +194,12 @@ with left_col:
         with col1:
             owner = st.selectbox(
                 "Owner",
-                ["First Owner", "Second Owner", "Third Owner"]
+                OWNERS
             )
         with col2:
             color = st.selectbox(
                 "Color",
-                ["White", "Black", "Silver", "Grey", "Red", "Blue"]
+                COLORS
             )
 
 # ==================================================
@@ -670,49 +210,21 @@ if engine_cc < 1000 and brand in luxury_brands:
     st.stop()
 
 # ==================================================
-# Build input vector (one-hot safe)
+# Listing as entered
 # ==================================================
-input_data = {col: 0 for col in model_columns}
-
-input_data["Year"] = year
-input_data["Kilometer"] = km_driven
-input_data["engine_cc"] = engine_cc
-input_data["max_power"] = max_power
-input_data["Fuel_Tank_Capacity"] = fuel_tank
-
-def set_feature(prefix, value):
-    key = f"{prefix}_{value}"
-    if key in input_data:
-        input_data[key] = 1
-
-set_feature("Make", brand)
-set_feature("Model", model_name)
-set_feature("Fuel Type", fuel)
-set_feature("Transmission", transmission)
-set_feature("Owner", owner)
-set_feature("Color", color)
-
-input_df = pd.DataFrame([input_data])[model_columns]
-
-# ==================================================
-# Market price caps (REALISTIC)
-# ==================================================
-def get_price_cap_usd(brands, engine):
-    if engine <= 1200:
-        return 20_000
-    if 1200 < engine <= 2000:
-        return 25_000
-    if 2000 < engine <= 3500:
-        return 60_000
-
-    luxury_caps = {
-        "BMW": 120_000,
-        "Mercedes-Benz": 150_000,
-        "Audi": 140_000,
-        "Ferrari": 600_000,
-        "Rolls-Royce": 350_000,
-    }
-    return luxury_caps.get(brands, 80_000)
+listing = {
+    "year": year,
+    "km": km_driven,
+    "engine_cc": engine_cc,
+    "max_power": max_power,
+    "fuel_tank": fuel_tank,
+    "brand": brand,
+    "model": model_name,
+    "fuel": fuel,
+    "transmission": transmission,
+    "owner": owner,
+    "color": color,
+}
 
 # ==================================================
 # Prediction Panel (Right Column)
@@ -744,38 +256,70 @@ with right_col:
 
         predict_button = st.button("🔮 Predict Price", type="primary", use_container_width=True)
 
+        # The result stays up while the what-if controls below rerun the
+        # script, until an input changes
         if predict_button:
-            with st.spinner("Analyzing market data..."):
-                predictions = np.array([
-                    tree.predict(input_df)[0]
-                    for tree in model.estimators_
-                ])
-
-                mean_price = predictions.mean()
-                std = predictions.std()
+            st.session_state["predicted_listing"] = listing
+
+        if predict_button or st.session_state.get("predicted_listing") == listing:
+            car_age = CURRENT_YEAR - year
+
+            # Per-stage latency histograms (see metrics.py)
+            load_start = time.perf_counter()
+            with st.spinner("Loading the pricing model..."):
+                warmup.wait()
+
+            from batching import get_batcher
+            from calibration import calibration_version
+            from encoder import CATEGORICAL_FIELDS, get_encoder
+            from forest import serving_version
+            from model_registry import load_model_columns
+            from prediction_cache import canonical_key, predictions as prediction_cache
+            from price_table import get_price_table
+            from pricing import calibrate
+
+            # One-hot safe input vector (cached per process, reloaded only
+            # when the column file changes)
+            encoder = get_encoder(load_model_columns())
+            metrics.observe("stage_seconds", time.perf_counter() - load_start, stage="load")
+            with metrics.timed("encode"):
+                input_row, unknown_inputs = encoder.encode_one(listing)
+
+            def predict_listing():
+                # Precomputed grid first (see price_table.py), then the forest
+                with metrics.timed("infer"):
+                    table = get_price_table(version=served_version)
+                    hit = table.lookup(listing) if table is not None else None
+                    if hit is not None:
+                        mean, low, high = [hit[0]], [hit[1]], [hit[2]]
+                    else:
+                        # Batched with other sessions' requests (see batching.py);
+                        # the band comes from the same forest pass
+                        stats = get_batcher().predict(input_row)
+                        mean, low, high = stats["mean"], stats["low"], stats["high"]
+                metrics.inc("predictions_total", source="table" if hit is not None else "forest")
+
+                # Market depreciation and price caps (see calibration.json)
+                with metrics.timed("calibrate"):
+                    return tuple(
+                        float(v[0]) for v in calibrate(
+                            mean, low, high,
+                            [brand], [year], [km_driven], [engine_cc],
+                            CURRENT_YEAR,
+                        )
+                    )
 
-                lower = mean_price - std
-                upper = mean_price + std
-
-                # Market depreciation
-                car_age = CURRENT_YEAR - year
-                depreciation = max(0.35, 1 - (car_age * 0.06))
-
-                if km_driven > 150_000:
-                    depreciation *= 0.7
-                elif km_driven > 100_000:
-                    depreciation *= 0.8
-                elif km_driven > 60_000:
-                    depreciation *= 0.9
-
-                mean_price *= depreciation
-                lower *= depreciation
-                upper *= depreciation
+            with st.spinner("Analyzing market data..."):
+                # Shared across sessions, dropped when the model or the
+                # calibration rules change
+                served_version = f"{serving_version()}:{calibration_version()}"
+                mean_price, lower, upper = prediction_cache.get_or_compute(
+                    canonical_key(listing, CURRENT_YEAR),
+                    predict_listing,
+                    version=served_version,
+                )
 
-                cap = get_price_cap_usd(brand, engine_cc)
-                mean_price = min(mean_price, cap)
-                lower = max(lower, cap * 0.6)
-                upper = min(upper, cap)
+            render_start = time.perf_counter()
 
             # Main Price Display
             st.markdown(f"""
@@ -802,6 +346,16 @@ with right_col:
             </div>
             """, unsafe_allow_html=True)
 
+            # Inputs the model has no feature for
+            if unknown_inputs:
+                st.caption(
+                    "Not recognised by the model (priced as its reference category): "
+                    + ", ".join(
+                        f"{CATEGORICAL_FIELDS[field]} = {value}"
+                        for field, value in unknown_inputs
+                    )
+                )
+
             # Warning for low mileage
             if km_driven < car_age * 3000:
                 st.markdown("<div style='height: 0.75rem'></div>", unsafe_allow_html=True)
@@ -816,6 +370,53 @@ with right_col:
                 <span>Prices are estimated using Indian used-car market data with market calibration. Actual prices may vary based on condition, location, and market demand.</span>
             </div>
             """, unsafe_allow_html=True)
+            metrics.observe("stage_seconds", time.perf_counter() - render_start, stage="render")
+
+            # What-if curve: the whole sweep is one forest pass (see sensitivity.py)
+            with st.expander("📈 What if…"):
+                import pandas as pd
+                from sensitivity import SWEEP_LABELS, default_values, sweep
+
+                field = st.selectbox(
+                    "Vary", list(SWEEP_LABELS), format_func=SWEEP_LABELS.get,
+                    key="sweep_field",
+                )
+                with metrics.timed("sensitivity"):
+                    curve = sweep(listing, field, default_values(field))
+                st.line_chart(
+                    pd.DataFrame(
+                        {"Low": curve["low"], "Estimate": curve["mean"], "High": curve["high"]},
+                        index=pd.Index(curve["values"][0], name=SWEEP_LABELS[field]),
+                    ),
+                    y_label="USD",
+                )
+
+            # Nearest training listings (see comparables.py); skipped until
+            # the index has been built
+            from comparables import get_comparables
+
+            comparables_index = get_comparables()
+            if comparables_index is not None:
+                with st.expander("🔎 Comparable listings"):
+                    import pandas as pd
+
+                    with metrics.timed("comparables"):
+                        found = comparables_index.query(listing)
+                    st.dataframe(
+                        pd.DataFrame(found)[
+                            ["year", "make", "model", "km", "engine_cc", "max_power",
+                             "fuel", "transmission", "price_usd", "match"]
+                        ].rename(columns={
+                            "year": "Year", "make": "Brand", "model": "Model",
+                            "km": "Kilometers", "engine_cc": "CC", "max_power": "BHP",
+                            "fuel": "Fuel", "transmission": "Transmission",
+                            "price_usd": "Asking price (USD)", "match": "Match",
+                        }),
+                        hide_index=True,
+                        use_container_width=True,
+                    )
+                    st.caption("Asking prices from the training data, converted at "
+                               "83 INR per USD, before market calibration.")
 
         else:
             # Placeholder when no prediction made yet
@@ -842,3 +443,12 @@ st.markdown("""
     </div>
 </div>
 """, unsafe_allow_html=True)
+
+# ==================================================
+# Load the model stack in the background
+# (once per process, after the page above has been sent; a click on
+# "Predict Price" waits for it only if it has not finished yet)
+# ==================================================
+warmup.start()
+# Optional /metrics port and periodic summary log (CAR_PRICE_METRICS_*)
+start_exporters()
@@ -0,0 +1,247 @@
+"""
+Headless batch valuation.
+
+Prices a CSV or Parquet file of listings with the same encoding, forest,
+depreciation and price caps as the Streamlit app, one vectorized chunk at a
+time.
+
+    python batch.py listings.csv -o priced.csv
+
+Input columns: brand, model, year, km, engine_cc, max_power, fuel_tank,
+transmission, fuel, owner, color. The output keeps them and adds
+mean_price, low_price and high_price (USD). Rows the UI would refuse to price
+(luxury brand with an engine under 1000 cc) get empty prices.
+
+With ``--comparables K`` (needs ``python comparables.py build``) each row
+also gets the median asking price of its K nearest training listings,
+comparables_median_usd, and comparables_match, the broadest level the
+search had to fall back to (model, make or any).
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from encoder import CATEGORICAL_FIELDS, LISTING_FIELDS, NUMERIC_FIELDS, get_encoder
+from forest import compile_forest, get_forest
+from model_registry import load_model_columns
+from pricing import CURRENT_YEAR, calibrate, is_unrealistic, predict_interval
+
+DEFAULT_CHUNK_SIZE = 4096
+PRICE_COLUMNS = ["mean_price", "low_price", "high_price"]
+COMPARABLES_COLUMNS = ["comparables_median_usd", "comparables_match"]
+
+
+def read_listings(path):
+    if os.path.splitext(path)[1].lower() in (".parquet", ".pq"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def write_prices(frame, path):
+    if os.path.splitext(path)[1].lower() in (".parquet", ".pq"):
+        frame.to_parquet(path, index=False)
+    else:
+        frame.to_csv(path, index=False)
+
+
+def check_listings(listings):
+    missing = [field for field in LISTING_FIELDS if field not in listings.columns]
+    if missing:
+        raise ValueError(f"Listings are missing columns: {', '.join(missing)}")
+
+
+def price_chunk(listings, forest, encoder, current_year=CURRENT_YEAR, out=None):
+    """Calibrated (mean, low, high) arrays for one chunk of listings, plus
+    the categories the encoder did not recognise."""
+    X, unknown = encoder.encode(listings, out=out)
+    stats = predict_interval(forest, X)
+    mean, low, high = calibrate(
+        stats["mean"],
+        stats["low"],
+        stats["high"],
+        listings["brand"].to_numpy(dtype=object),
+        listings["year"].to_numpy(),
+        listings["km"].to_numpy(),
+        listings["engine_cc"].to_numpy(),
+        current_year,
+    )
+    rejected = is_unrealistic(listings["brand"], listings["engine_cc"])
+    for prices in (mean, low, high):
+        prices[rejected] = np.nan
+    return (mean, low, high), unknown
+
+
+def check_record(record):
+    """ValueError naming the missing or mistyped fields of a listing dict."""
+    missing = [field for field in LISTING_FIELDS if field not in record]
+    if missing:
+        raise ValueError(f"Listing is missing fields: {', '.join(missing)}")
+    for field in NUMERIC_FIELDS:
+        value = record[field]
+        # NaN passes: a missing number, as in an empty CSV cell
+        if isinstance(value, bool) or not isinstance(value, (int, float, np.number)):
+            raise ValueError(f"{field} must be a number, got {value!r}")
+    for field in CATEGORICAL_FIELDS:
+        if not isinstance(record[field], str):
+            raise ValueError(f"{field} must be a string, got {record[field]!r}")
+
+
+def encode_records(records, encoder=None):
+    """(X, unknown) for a list of listing dicts; ``unknown`` holds one list
+    of unrecognised (field, value) pairs per record."""
+    for record in records:
+        check_record(record)
+    encoder = encoder if encoder is not None else get_encoder(load_model_columns())
+    X = np.empty((len(records), encoder.n_columns), dtype=np.float32)
+    unknown = []
+    for i, record in enumerate(records):
+        unknown.append(encoder.encode_one(record, out=X[i:i + 1])[1])
+    return X, unknown
+
+
+def records_from_stats(records, stats, unknown, current_year=CURRENT_YEAR):
+    """Calibrated result dicts from the forest's raw mean and band per record.
+
+    Prices are None for listings the UI would refuse to price.
+    """
+    mean, low, high = calibrate(
+        stats["mean"],
+        stats["low"],
+        stats["high"],
+        [r["brand"] for r in records],
+        [r["year"] for r in records],
+        [r["km"] for r in records],
+        [r["engine_cc"] for r in records],
+        current_year,
+    )
+    rejected = is_unrealistic(
+        [r["brand"] for r in records], [r["engine_cc"] for r in records]
+    )
+
+    results = []
+    for i in range(len(records)):
+        prices = (None, None, None) if rejected[i] else (
+            float(mean[i]), float(low[i]), float(high[i])
+        )
+        results.append({
+            **dict(zip(PRICE_COLUMNS, prices)),
+            "unknown_categories": dict(unknown[i]),
+        })
+    return results
+
+
+def price_records(records, forest=None, encoder=None, current_year=CURRENT_YEAR):
+    """Price a list of listing dicts; returns one result dict per record."""
+    X, unknown = encode_records(records, encoder)
+    forest = forest if forest is not None else get_forest()
+    return records_from_stats(records, predict_interval(forest, X), unknown, current_year)
+
+
+def price_listings(listings, model=None, model_columns=None,
+                   chunk_size=DEFAULT_CHUNK_SIZE, current_year=CURRENT_YEAR):
+    """Return ``listings`` with mean_price, low_price and high_price added.
+
+    Categories that matched no model column are listed per field in
+    ``priced.attrs["unknown_categories"]``.
+    """
+    check_listings(listings)
+    forest = compile_forest(model) if model is not None else get_forest()
+    encoder = get_encoder(
+        model_columns if model_columns is not None else load_model_columns()
+    )
+
+    prices = np.empty((len(listings), 3))
+    buffer = np.empty((min(chunk_size, len(listings)), encoder.n_columns), np.float32)
+    unknown = {}
+    for start in range(0, len(listings), chunk_size):
+        chunk = listings.iloc[start:start + chunk_size]
+        chunk_prices, chunk_unknown = price_chunk(
+            chunk, forest, encoder, current_year, out=buffer
+        )
+        prices[start:start + len(chunk)] = np.column_stack(chunk_prices)
+        for field, values in chunk_unknown.items():
+            unknown.setdefault(field, set()).update(values)
+
+    priced = listings.copy()
+    priced[PRICE_COLUMNS] = prices
+    priced.attrs["unknown_categories"] = {
+        field: sorted(values) for field, values in unknown.items()
+    }
+    return priced
+
+
+def report_unknown(unknown, file=sys.stderr, shown=10):
+    """One line per field of ``{field: [unrecognised categories]}``."""
+    for field, values in unknown.items():
+        listed = ", ".join(values[:shown]) + (" ..." if len(values) > shown else "")
+        print(f"Unknown {field} ({len(values)}): {listed}", file=file)
+
+
+def add_comparables(priced, index, k):
+    """``priced`` with COMPARABLES_COLUMNS from ``index.query`` per row."""
+    from comparables import MATCH_LEVELS
+
+    medians, matches = [], []
+    for listing in priced[LISTING_FIELDS].to_dict(orient="records"):
+        found = index.query(listing, k)
+        medians.append(float(np.median([c["price_usd"] for c in found])) if found else np.nan)
+        matches.append(max((c["match"] for c in found), key=MATCH_LEVELS.index,
+                           default=None))
+    priced[COMPARABLES_COLUMNS[0]] = medians
+    priced[COMPARABLES_COLUMNS[1]] = matches
+    return priced
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Price a file of car listings.")
+    parser.add_argument("listings", help="CSV or Parquet file of listings")
+    parser.add_argument("-o", "--output", required=True, help="CSV or Parquet output")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int,
+                        help="price on this many processes (see sharded.py)")
+    parser.add_argument("--comparables", type=int, metavar="K",
+                        help="add the median price of the K nearest training listings")
+    args = parser.parse_args(argv)
+
+    if args.comparables:
+        from comparables import COMPARABLES_PATH, get_comparables
+
+        index = get_comparables()
+        if index is None:
+            parser.error(f"{COMPARABLES_PATH} not found; run `python comparables.py build`")
+
+    if args.workers and args.workers > 1:
+        if args.comparables:
+            parser.error("--comparables is not supported with --workers")
+        from sharded import price_file, report
+
+        stats = price_file(args.listings, args.output, args.workers, args.chunk_size)
+        report_unknown(stats["unknown_categories"])
+        report(stats)
+        return
+
+    listings = read_listings(args.listings)
+    get_forest()  # keep the one-off model load out of the throughput figure
+
+    start = time.perf_counter()
+    priced = price_listings(listings, chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+    if args.comparables:
+        add_comparables(priced, index, args.comparables)
+    write_prices(priced, args.output)
+
+    report_unknown(priced.attrs["unknown_categories"])
+
+    rate = len(priced) / elapsed if elapsed else float("inf")
+    print(
+        f"Priced {len(priced):,} listings in {elapsed:.2f}s ({rate:,.0f} rows/s)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
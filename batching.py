@@ -0,0 +1,231 @@
+"""
+In-process micro-batching in front of the forest.
+
+Every caller (a Streamlit session thread, a service request) submits its
+encoded row(s) and gets a future back. One worker thread collects whatever
+arrives within ``max_wait_ms`` of the oldest waiting request, or until
+``max_batch`` rows are queued, runs the lot as a single matrix through
+the forest and hands each caller its slice of the mean and price band
+(``pricing.predict_interval``).
+
+    from batching import get_batcher
+    stats = get_batcher().predict(row)      # {"mean", "std", "low", "high"}
+
+The process-wide batcher is configured through CAR_PRICE_BATCH_WAIT_MS,
+CAR_PRICE_BATCH_MAX_ROWS and CAR_PRICE_BATCH_QUEUE; ``stats()`` reports
+batch sizes, queue depth and waiting times.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+DEFAULT_MAX_WAIT_MS = float(os.environ.get("CAR_PRICE_BATCH_WAIT_MS", 2.0))
+DEFAULT_MAX_BATCH = int(os.environ.get("CAR_PRICE_BATCH_MAX_ROWS", 64))
+DEFAULT_MAX_QUEUE = int(os.environ.get("CAR_PRICE_BATCH_QUEUE", 1024))
+
+_STOP = object()
+
+
+class QueueFull(RuntimeError):
+    """Raised by ``submit`` when ``max_queue`` requests are already waiting."""
+
+
+def forest_interval(X):
+    from forest import get_forest
+    from pricing import predict_interval
+
+    # Looked up per batch so a new model file is picked up between batches.
+    return predict_interval(get_forest(), X)
+
+
+class _Request:
+    __slots__ = ("rows", "future", "enqueued")
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class MicroBatcher:
+    """Coalesces concurrent ``submit`` calls into one ``predict_fn`` call.
+
+    ``predict_fn`` takes an (n, n_features) float32 matrix and returns a dict
+    of length-n arrays; each caller receives the same dict restricted to its
+    own rows. A batch holds at most ``max_batch`` rows unless a single
+    request is larger, in which case it runs on its own.
+    """
+
+    def __init__(self, predict_fn=forest_interval, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 max_batch=DEFAULT_MAX_BATCH, max_queue=DEFAULT_MAX_QUEUE):
+        self.predict_fn = predict_fn
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._counters = {
+            "requests": 0, "rows": 0, "batches": 0, "rejected": 0, "errors": 0,
+            "max_batch_rows": 0, "max_queue_depth": 0,
+            "wait_seconds": 0.0, "max_wait_seconds": 0.0, "run_seconds": 0.0,
+        }
+
+    # ----------------------------------------------
+    # Callers
+    # ----------------------------------------------
+    def submit(self, rows):
+        """Future resolving to ``predict_fn``'s dict for ``rows`` (1-D or 2-D)."""
+        rows = np.asarray(rows, dtype=np.float32)
+        if rows.ndim == 1:
+            rows = rows[None, :]
+        request = _Request(rows)
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            with self._lock:
+                self._counters["rejected"] += 1
+            raise QueueFull(f"{self.max_queue} prediction requests already waiting")
+        with self._lock:
+            depth = self._queue.qsize()
+            if depth > self._counters["max_queue_depth"]:
+                self._counters["max_queue_depth"] = depth
+        return request.future
+
+    def predict(self, rows, timeout=None):
+        return self.submit(rows).result(timeout)
+
+    def stats(self):
+        with self._lock:
+            c = dict(self._counters)
+        batches, requests = c["batches"], c["requests"]
+        return {
+            "requests": requests,
+            "rows": c["rows"],
+            "batches": batches,
+            "rejected": c["rejected"],
+            "errors": c["errors"],
+            "mean_batch_rows": c["rows"] / batches if batches else 0.0,
+            "max_batch_rows": c["max_batch_rows"],
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": c["max_queue_depth"],
+            "mean_wait_ms": c["wait_seconds"] / requests * 1e3 if requests else 0.0,
+            "max_wait_ms": c["max_wait_seconds"] * 1e3,
+            "mean_run_ms": c["run_seconds"] / batches * 1e3 if batches else 0.0,
+            "config": {
+                "max_wait_ms": self.max_wait * 1e3,
+                "max_batch": self.max_batch,
+                "max_queue": self.max_queue,
+            },
+        }
+
+    def close(self, timeout=None):
+        """Stop the worker after it has served everything already queued."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    # ----------------------------------------------
+    # Worker
+    # ----------------------------------------------
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._worker, name="micro-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _worker(self):
+        carry = None
+        while True:
+            first = carry if carry is not None else self._queue.get()
+            carry = None
+            if first is _STOP:
+                return
+
+            batch, n_rows = [first], len(first.rows)
+            deadline = first.enqueued + self.max_wait
+            stop = False
+            while n_rows < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = (self._queue.get(timeout=remaining) if remaining > 0
+                            else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                if n_rows + len(item.rows) > self.max_batch:
+                    carry = item
+                    break
+                batch.append(item)
+                n_rows += len(item.rows)
+
+            self._run(batch, n_rows)
+            if stop:
+                return
+
+    def _run(self, batch, n_rows):
+        start = time.perf_counter()
+        waits = [start - request.enqueued for request in batch]
+        try:
+            X = batch[0].rows if len(batch) == 1 else np.concatenate(
+                [request.rows for request in batch]
+            )
+            result = self.predict_fn(X)
+        except Exception as exc:
+            for request in batch:
+                request.future.set_exception(exc)
+            with self._lock:
+                self._counters["errors"] += 1
+            return
+        elapsed = time.perf_counter() - start
+
+        offset = 0
+        for request in batch:
+            end = offset + len(request.rows)
+            request.future.set_result({k: v[offset:end] for k, v in result.items()})
+            offset = end
+
+        with self._lock:
+            c = self._counters
+            c["requests"] += len(batch)
+            c["rows"] += n_rows
+            c["batches"] += 1
+            c["max_batch_rows"] = max(c["max_batch_rows"], n_rows)
+            c["wait_seconds"] += sum(waits)
+            c["max_wait_seconds"] = max(c["max_wait_seconds"], max(waits))
+            c["run_seconds"] += elapsed
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """The process-wide batcher in front of ``get_forest()``."""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher()
+    return _batcher
+
+
+def set_batcher(batcher):
+    """Install ``batcher`` (or None) as the process-wide one; the service
+    configures its own, and ``metrics`` reports only this one."""
+    global _batcher
+    with _batcher_lock:
+        _batcher = batcher
@@ -0,0 +1,121 @@
+"""
+Cold-start benchmark for the Streamlit app.
+
+    python bench_startup.py                          # print timings
+    python bench_startup.py --save startup.json      # record a baseline
+    python bench_startup.py --baseline startup.json  # exit 1 on regression
+
+Every measurement runs in a fresh interpreter, so nothing is already
+imported or loaded:
+
+* import_ms      - importing what app.py imports before its first paint;
+* first_paint_ms - first script run of app.py (AppTest): the form is ready;
+* ready_ms       - until the background warm-up has loaded the model stack;
+* predict_ms     - the first "Predict Price" run after that;
+* eager_load_ms  - importing and loading the prediction stack synchronously,
+                   i.e. what the first paint used to wait for.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import streamlit, warmup, catalogue
+print(time.perf_counter() - start)
+"""
+
+APP_SNIPPET = """
+import json, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=600)
+start = time.perf_counter()
+at.run()
+first_paint = time.perf_counter() - start
+assert not at.exception, at.exception
+import warmup
+warmup.wait()
+ready = time.perf_counter() - start
+at.button[0].click()
+start = time.perf_counter()
+at.run()
+predict = time.perf_counter() - start
+assert not at.exception, at.exception
+print(json.dumps({"first_paint": first_paint, "ready": ready, "predict": predict}))
+"""
+
+EAGER_SNIPPET = """
+import time
+start = time.perf_counter()
+import warmup
+warmup.load_prediction_stack()
+print(time.perf_counter() - start)
+"""
+
+METRICS = ["import_ms", "first_paint_ms", "ready_ms", "predict_ms", "eager_load_ms"]
+
+
+def run_snippet(snippet):
+    out = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=APP_DIR, check=True,
+        capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def measure(repeat=3):
+    samples = {metric: [] for metric in METRICS}
+    for _ in range(repeat):
+        samples["import_ms"].append(run_snippet(IMPORT_SNIPPET) * 1e3)
+        app = run_snippet(APP_SNIPPET)
+        samples["first_paint_ms"].append(app["first_paint"] * 1e3)
+        samples["ready_ms"].append(app["ready"] * 1e3)
+        samples["predict_ms"].append(app["predict"] * 1e3)
+        samples["eager_load_ms"].append(run_snippet(EAGER_SNIPPET) * 1e3)
+    return {metric: statistics.median(values) for metric, values in samples.items()}
+
+
+def regressions(result, baseline, tolerance):
+    """Metrics slower than the baseline by more than ``tolerance`` (fraction)."""
+    slower = {}
+    for metric in ("import_ms", "first_paint_ms"):
+        if metric in baseline and result[metric] > baseline[metric] * (1 + tolerance):
+            slower[metric] = (baseline[metric], result[metric])
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the app's cold start.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="write the timings to this JSON file")
+    parser.add_argument("--baseline", help="JSON file from an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown vs the baseline (default 25%%)")
+    args = parser.parse_args(argv)
+
+    result = measure(args.repeat)
+    for metric in METRICS:
+        print(f"{metric:<16} {result[metric]:10.1f}")
+
+    if args.save:
+        with open(args.save, "w") as fh:
+            json.dump(result, fh, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        slower = regressions(result, baseline, args.tolerance)
+        for metric, (before, after) in slower.items():
+            print(f"REGRESSION {metric}: {before:.1f} -> {after:.1f} ms")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
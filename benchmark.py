@@ -0,0 +1,293 @@
+"""
+Inference benchmark suite.
+
+    python benchmark.py                              # print timings
+    python benchmark.py --save bench.json            # record a baseline
+    python benchmark.py --baseline bench.json        # exit 1 on regression
+    python benchmark.py --only encode,end_to_end --batch-sizes 1,64
+
+Times every stage a price goes through, on batches of 1, 64 and 4096
+listings:
+
+* load          - joblib.load of the pickle, load_flat of the flat export
+                  (memory-mapped) and of model_columns.pkl;
+* encode        - FeatureEncoder.encode_one (batch 1, the app's path) or
+                  .encode on a DataFrame;
+* infer_trees   - the per-tree loop over the sklearn estimators;
+* infer_flat    - pricing.predict_interval on the served forest (mean and
+                  price band in one pass);
+* calibrate     - pricing.calibrate on the raw mean and band;
+* end_to_end    - batch.price_records, i.e. a full /predict request from
+                  listing dicts to calibrated prices.
+
+Inputs are seeded: half are drawn from the UI catalogue (brand_model_map,
+brand_defaults and the form options), half are real listings from the
+bundled CSV. Results are written as JSON together with the model, rules
+and library versions they were measured with, so a change on the inference
+path can be checked against a stored baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from itertools import zip_longest
+
+import numpy as np
+import pandas as pd
+
+from catalogue import (
+    COLORS, ENGINE_RANGE, FUEL_TYPES, KM_RANGE, MIN_YEAR, OWNERS,
+    brand_defaults, brand_model_map, transmissions_for,
+)
+from encoder import CATEGORICAL_FIELDS, NUMERIC_FIELDS
+from pricing import CURRENT_YEAR
+
+BENCHMARKS = ["load", "encode", "infer_trees", "infer_flat", "calibrate", "end_to_end"]
+BATCH_SIZES = (1, 64, 4096)
+MIN_SECONDS = 0.5           # keep repeating a case for at least this long ...
+MIN_REPEAT = 5              # ... and at least this many times
+MAX_REPEAT = 1000
+LOAD_REPEAT = 3
+DEFAULT_SEED = 0
+
+
+# ==================================================
+# Inputs
+# ==================================================
+def catalogue_listings(n, rng):
+    """Listings a user could enter in the form."""
+    brands = list(brand_model_map)
+    listings = []
+    for _ in range(n):
+        brand = brands[rng.integers(len(brands))]
+        defaults = brand_defaults[brand]
+        models = brand_model_map[brand]
+        transmissions = transmissions_for(brand)
+        listings.append({
+            "brand": brand,
+            "model": models[rng.integers(len(models))],
+            "year": int(rng.integers(MIN_YEAR, CURRENT_YEAR + 1)),
+            "km": int(rng.integers(KM_RANGE[0], KM_RANGE[1] // KM_RANGE[2] + 1)) * KM_RANGE[2],
+            "engine_cc": int(np.clip(defaults["engine"] + 100 * rng.integers(-3, 4),
+                                     ENGINE_RANGE[0], ENGINE_RANGE[1])),
+            "max_power": defaults["power"],
+            "fuel_tank": defaults["tank"],
+            "transmission": transmissions[rng.integers(len(transmissions))],
+            "fuel": FUEL_TYPES[rng.integers(len(FUEL_TYPES))],
+            "owner": OWNERS[rng.integers(len(OWNERS))],
+            "color": COLORS[rng.integers(len(COLORS))],
+        })
+    return listings
+
+
+def csv_listings(n, rng):
+    """Listings resampled from the bundled training CSV (empty if missing)."""
+    from train import DATA_PATH, parse_listings
+
+    if not os.path.exists(DATA_PATH):
+        return []
+    parsed = parse_listings(pd.read_csv(DATA_PATH))
+    fields = {column: field for field, column in
+              {**NUMERIC_FIELDS, **CATEGORICAL_FIELDS}.items()}
+    frame = parsed[list(fields)].rename(columns=fields)
+    rows = frame.iloc[rng.integers(len(frame), size=n)]
+    return rows.to_dict(orient="records")
+
+
+def make_listings(n, seed=DEFAULT_SEED):
+    """``n`` listings, alternating catalogue and CSV ones."""
+    rng = np.random.default_rng(seed)
+    from_csv = csv_listings(n // 2, rng)
+    from_catalogue = catalogue_listings(n - len(from_csv), rng)
+    mixed = []
+    for pair in zip_longest(from_catalogue, from_csv):
+        mixed.extend(listing for listing in pair if listing is not None)
+    return mixed
+
+
+# ==================================================
+# Timing
+# ==================================================
+def time_case(fn, min_seconds=MIN_SECONDS, min_repeat=MIN_REPEAT, max_repeat=MAX_REPEAT):
+    """Per-call timings in milliseconds after one warm-up call."""
+    fn()
+    samples = []
+    deadline = time.perf_counter() + min_seconds
+    while len(samples) < max_repeat and (
+        len(samples) < min_repeat or time.perf_counter() < deadline
+    ):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e3)
+    return samples
+
+
+def summarize(samples, rows):
+    p50 = statistics.median(samples)
+    return {
+        "rows": rows,
+        "repeat": len(samples),
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": p50,
+        "p99_ms": float(np.percentile(samples, 99)),
+        "min_ms": min(samples),
+        "rows_per_s": rows / p50 * 1e3 if p50 else float("inf"),
+    }
+
+
+# ==================================================
+# Cases
+# ==================================================
+def load_cases():
+    import joblib
+
+    from forest import FLAT_PATH, load_flat
+    from model_registry import COLUMNS_PATH, MODEL_PATH
+
+    cases = {
+        "load/pickle": lambda: joblib.load(MODEL_PATH),
+        "load/columns": lambda: joblib.load(COLUMNS_PATH),
+    }
+    if os.path.exists(FLAT_PATH):
+        cases["load/flat_mmap"] = lambda: load_flat(FLAT_PATH)
+    return cases
+
+
+def batch_case(benchmark, listings, batch_size):
+    """Zero-argument callable running ``benchmark`` on ``batch_size`` listings."""
+    from batch import price_records
+    from encoder import get_encoder
+    from forest import get_forest
+    from model_registry import load_model, load_model_columns
+    from pricing import calibrate, predict_interval
+
+    records = listings[:batch_size]
+    frame = pd.DataFrame(records)
+    encoder = get_encoder(load_model_columns())
+    X, _ = encoder.encode(frame)
+
+    if benchmark == "encode":
+        if batch_size == 1:
+            return lambda: encoder.encode_one(records[0])
+        return lambda: encoder.encode(frame)
+    if benchmark == "infer_trees":
+        estimators = load_model().estimators_
+        return lambda: np.stack([tree.predict(X) for tree in estimators])
+    if benchmark == "infer_flat":
+        forest = get_forest()
+        return lambda: predict_interval(forest, X)
+    if benchmark == "calibrate":
+        stats = predict_interval(get_forest(), X)
+        brand, year = frame["brand"].to_numpy(dtype=object), frame["year"].to_numpy()
+        km, engine = frame["km"].to_numpy(), frame["engine_cc"].to_numpy()
+        return lambda: calibrate(stats["mean"], stats["low"], stats["high"],
+                                 brand, year, km, engine)
+    if benchmark == "end_to_end":
+        return lambda: price_records(records)
+    raise ValueError(f"Unknown benchmark {benchmark!r}")
+
+
+def run(benchmarks=BENCHMARKS, batch_sizes=BATCH_SIZES, seed=DEFAULT_SEED,
+        min_seconds=MIN_SECONDS, verbose=True):
+    listings = make_listings(max(batch_sizes), seed)
+    results = {}
+
+    def record(name, samples, rows):
+        results[name] = summarize(samples, rows)
+        if verbose:
+            r = results[name]
+            print(f"  {name:<22} p50 {r['p50_ms']:10.3f} ms  p99 {r['p99_ms']:10.3f} ms  "
+                  f"{r['rows_per_s']:>14,.0f} rows/s  (x{r['repeat']})")
+
+    for benchmark in benchmarks:
+        if benchmark == "load":
+            for name, fn in load_cases().items():
+                record(name, time_case(fn, 0, LOAD_REPEAT, LOAD_REPEAT), 1)
+            continue
+        for batch_size in batch_sizes:
+            fn = batch_case(benchmark, listings, batch_size)
+            record(f"{benchmark}/{batch_size}", time_case(fn, min_seconds), batch_size)
+    return {"meta": environment(seed), "results": results}
+
+
+def environment(seed):
+    import sklearn
+
+    from calibration import calibration_version
+    from forest import serving_version
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "model_version": serving_version(),
+        "calibration_version": calibration_version(),
+        "seed": seed,
+    }
+
+
+# ==================================================
+# Baselines
+# ==================================================
+def compare(result, baseline, tolerance):
+    """(name, before p50, after p50, ratio) for every case in both runs,
+    plus the names that got slower by more than ``tolerance`` (fraction)."""
+    rows, slower = [], []
+    for name, after in result["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        ratio = after["p50_ms"] / before["p50_ms"] if before["p50_ms"] else float("inf")
+        rows.append((name, before["p50_ms"], after["p50_ms"], ratio))
+        if ratio > 1 + tolerance:
+            slower.append(name)
+    return rows, slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the inference path.")
+    parser.add_argument("--only", help=f"comma-separated subset of {','.join(BENCHMARKS)}")
+    parser.add_argument("--batch-sizes", default=",".join(map(str, BATCH_SIZES)))
+    parser.add_argument("--min-seconds", type=float, default=MIN_SECONDS)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file from an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed p50 slowdown vs the baseline (default 25%%)")
+    args = parser.parse_args(argv)
+
+    benchmarks = args.only.split(",") if args.only else BENCHMARKS
+    unknown = set(benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    batch_sizes = [int(n) for n in args.batch_sizes.split(",")]
+
+    result = run(benchmarks, batch_sizes, args.seed, args.min_seconds)
+
+    if args.save:
+        with open(args.save, "w") as fh:
+            json.dump(result, fh, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        if baseline["meta"].get("model_version") != result["meta"]["model_version"]:
+            print("Note: the baseline was measured on a different model version")
+        rows, slower = compare(result, baseline, args.tolerance)
+        print(f"\n  {'case':<22} {'baseline':>10} {'now':>10}  ratio")
+        for name, before, after, ratio in rows:
+            flag = "  REGRESSION" if name in slower else ""
+            print(f"  {name:<22} {before:10.3f} {after:10.3f}  x{ratio:.2f}{flag}")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Market calibration engine.
+
+Turns the forest's raw USD mean and (low, high) band into the (mean, lower,
+upper) prices shown to users. The rules live in a versioned JSON file
+(calibration.json, or CAR_PRICE_CALIBRATION_PATH) rather than in code:
+
+* interval - how the raw band is computed (``FlatForest.predict_interval``:
+  "std", per-tree "trees" quantiles or "qrf" leaf quantiles) and at which
+  percentile levels;
+* depreciation - ``max(floor, 1 - age * per_year)``, times the factor of the
+  highest km tier the mileage is above;
+* price cap - the first engine tier whose ``max_cc`` the engine fits under;
+  above the last tier, the brand's cap or ``default_cap_usd``;
+* lower estimate floored at ``cap * lower_floor_of_cap``, and optionally
+  (``clamp_lower_to_mean``) never above the mean itself.
+
+Every rule is applied to whole arrays; tier lookups are ``np.searchsorted``
+over the sorted thresholds. The file is loaded through a ModelRegistry, so an
+edited rule table is picked up without a restart.
+
+    python calibration.py bench --rows 100000
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from encoder import normalize_category
+from model_registry import BASE_DIR, ModelRegistry
+
+RULES_PATH = os.environ.get(
+    "CAR_PRICE_CALIBRATION_PATH", os.path.join(BASE_DIR, "calibration.json")
+)
+
+
+class Calibrator:
+    """Vectorized calibration for one rule table."""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.version = str(rules["version"])
+
+        interval = rules.get("interval", {"method": "std", "levels": [16, 84]})
+        self.interval_method = interval["method"]
+        self.interval_levels = [float(level) for level in interval["levels"]]
+
+        depreciation = rules["depreciation"]
+        self.per_year = float(depreciation["per_year"])
+        self.age_floor = float(depreciation["floor"])
+
+        km_tiers = sorted(rules["km_tiers"], key=lambda t: t["above_km"])
+        self.km_thresholds = np.array([t["above_km"] for t in km_tiers], dtype=float)
+        self.km_factors = np.array([1.0] + [t["factor"] for t in km_tiers])
+
+        engine_caps = sorted(rules["engine_caps"], key=lambda t: t["max_cc"])
+        self.engine_thresholds = np.array([t["max_cc"] for t in engine_caps], dtype=float)
+        self.engine_caps = np.array([t["cap_usd"] for t in engine_caps], dtype=float)
+
+        self.brand_caps = {b: float(c) for b, c in rules["brand_caps"].items()}
+        self.default_cap = float(rules["default_cap_usd"])
+        self.lower_floor = float(rules["lower_floor_of_cap"])
+        self.clamp_lower = bool(rules.get("clamp_lower_to_mean", False))
+        self.luxury_brands = list(rules["luxury_brands"])
+        self.min_luxury_engine = float(rules["min_luxury_engine_cc"])
+
+        # Lookups by normalized brand, as the encoder sees it ("bmw" == "BMW")
+        self._brand_caps = {normalize_category(b): c for b, c in self.brand_caps.items()}
+        self._luxury = {normalize_category(b) for b in self.luxury_brands}
+
+    @classmethod
+    def load(cls, path=RULES_PATH):
+        with open(path) as fh:
+            return cls(json.load(fh))
+
+    def depreciation(self, year, km, current_year):
+        car_age = current_year - np.asarray(year, dtype=float)
+        km = np.asarray(km, dtype=float)
+        factor = np.maximum(self.age_floor, 1 - car_age * self.per_year)
+        # Number of thresholds strictly below km == index of its tier
+        # (a missing km is in no tier, as with the original comparisons).
+        tier = np.searchsorted(self.km_thresholds, km)
+        return factor * self.km_factors[np.where(np.isnan(km), 0, tier)]
+
+    def caps(self, brand, engine_cc):
+        engine_cc = np.asarray(engine_cc, dtype=float)
+        tier = np.searchsorted(self.engine_thresholds, engine_cc)
+        over = tier == len(self.engine_thresholds)
+        caps = np.array(self.engine_caps[np.minimum(tier, len(self.engine_caps) - 1)])
+        if over.any():
+            brands = np.asarray(brand, dtype=object)
+            brands = np.broadcast_to(brands, engine_cc.shape)[over]
+            names, inverse = np.unique(brands.astype(str), return_inverse=True)
+            brand_caps = np.array([self._brand_caps.get(normalize_category(n), self.default_cap)
+                                   for n in names])
+            caps[over] = brand_caps[inverse]
+        return caps
+
+    def apply(self, mean, low, high, brand, year, km, engine_cc, current_year):
+        """Raw forest mean and band -> calibrated (mean, lower, upper) in USD."""
+        depreciation = self.depreciation(year, km, current_year)
+        lower = np.asarray(low, dtype=float) * depreciation
+        upper = np.asarray(high, dtype=float) * depreciation
+        mean = np.asarray(mean, dtype=float) * depreciation
+
+        cap = self.caps(brand, engine_cc)
+        mean = np.minimum(mean, cap)
+        lower = np.maximum(lower, cap * self.lower_floor)
+        if self.clamp_lower:
+            lower = np.minimum(lower, mean)
+        return mean, lower, np.minimum(upper, cap)
+
+    def is_unrealistic(self, brand, engine_cc):
+        """Inputs the UI refuses to price (tiny engines on luxury brands)."""
+        engine_cc = np.asarray(engine_cc, dtype=float)
+        brands = np.broadcast_to(np.asarray(brand, dtype=object), engine_cc.shape)
+        names, inverse = np.unique(brands.astype(str), return_inverse=True)
+        luxury = np.array([normalize_category(n) in self._luxury for n in names], dtype=bool)
+        return (engine_cc < self.min_luxury_engine) & luxury[inverse].reshape(engine_cc.shape)
+
+
+rule_tables = ModelRegistry(loader=Calibrator.load)
+
+
+def get_calibrator(path=RULES_PATH):
+    return rule_tables.get(path)
+
+
+def calibration_version(path=RULES_PATH):
+    """Content hash of the rule table; part of every cached price's key."""
+    return rule_tables.version(path)
+
+
+# ==================================================
+# Scalar reference and benchmark
+# ==================================================
+def calibrate_scalar(calibrator, mean, low, high, brand, year, km, engine_cc, current_year):
+    """One listing at a time, as the app's button handler used to do it."""
+    car_age = current_year - year
+    depreciation = max(calibrator.age_floor, 1 - car_age * calibrator.per_year)
+    for threshold, factor in zip(calibrator.km_thresholds[::-1], calibrator.km_factors[:0:-1]):
+        if km > threshold:
+            depreciation *= factor
+            break
+
+    for max_cc, tier_cap in zip(calibrator.engine_thresholds, calibrator.engine_caps):
+        if engine_cc <= max_cc:
+            cap = tier_cap
+            break
+    else:
+        cap = calibrator._brand_caps.get(normalize_category(brand), calibrator.default_cap)
+
+    mean = min(mean * depreciation, cap)
+    lower = max(low * depreciation, cap * calibrator.lower_floor)
+    if calibrator.clamp_lower:
+        lower = min(lower, mean)
+    return mean, lower, min(high * depreciation, cap)
+
+
+def random_inputs(n, calibrator, seed=0, current_year=2025):
+    rng = np.random.default_rng(seed)
+    brands = np.array(calibrator.luxury_brands + ["Honda", "Maruti Suzuki", "Toyota"],
+                      dtype=object)
+    mean = rng.lognormal(10, 1.5, n)
+    return (
+        mean,
+        mean * rng.uniform(0.5, 1, n),
+        mean * rng.uniform(1, 1.5, n),
+        brands[rng.integers(len(brands), size=n)],
+        rng.integers(1995, current_year + 1, n),
+        rng.integers(0, 300_000, n).astype(float),
+        rng.integers(8, 70, n) * 100.0,
+    )
+
+
+def benchmark(rows=100_000, current_year=2025, path=RULES_PATH):
+    calibrator = Calibrator.load(path)
+    inputs = random_inputs(rows, calibrator, current_year=current_year)
+
+    start = time.perf_counter()
+    scalar = np.array([
+        calibrate_scalar(calibrator, *row, current_year) for row in zip(*inputs)
+    ]).T
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = np.array(calibrator.apply(*inputs, current_year))
+    vector_seconds = time.perf_counter() - start
+
+    return {
+        "rows": rows,
+        "scalar_seconds": scalar_seconds,
+        "vectorized_seconds": vector_seconds,
+        "speedup": scalar_seconds / vector_seconds,
+        "max_abs_diff": float(np.abs(scalar - vectorized).max()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibration rules and benchmark.")
+    parser.add_argument("command", choices=["show", "bench"])
+    parser.add_argument("--rules", default=RULES_PATH)
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    if args.command == "show":
+        print(f"Rules version {Calibrator.load(args.rules).version} "
+              f"(content {rule_tables.version(args.rules)})")
+        print(open(args.rules).read())
+        return
+
+    result = benchmark(args.rows, path=args.rules)
+    print(f"Rows:        {result['rows']:,}")
+    print(f"Scalar:      {result['scalar_seconds']:.3f}s "
+          f"({result['rows'] / result['scalar_seconds']:,.0f} rows/s)")
+    print(f"Vectorized:  {result['vectorized_seconds']:.4f}s "
+          f"({result['rows'] / result['vectorized_seconds']:,.0f} rows/s)")
+    print(f"Speedup:     x{result['speedup']:.0f}")
+    print(f"Max |diff|:  {result['max_abs_diff']:.3g} USD")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+Brands, models and form options offered by the app.
+
+Kept out of app.py so the offline jobs (price table, benchmarks, ...) can
+enumerate exactly what the UI lets a user pick.
+
+The brand -> model variants, their smart defaults (median engine, power
+and fuel tank) and the fuel / owner / color choices are derived from the
+training CSV, not typed in:
+
+    python catalogue.py build       # rewrites catalogue.json
+    python catalogue.py check       # is it aligned with model_columns.pkl?
+    python catalogue.py search Honda "city v"
+
+Only variants the model can encode are kept: those with a one-hot column
+in model_columns.pkl plus the reference categories get_dummies dropped
+(``baselines``, which the encoder then knows not to report as unknown).
+catalogue.json is a flat, precomputed index: variants are sorted by brand
+and then name, so a brand is one slice and a prefix search is two bisects.
+It is read once per process; reruns of the app never touch the data.
+"""
+import argparse
+import bisect
+import json
+import os
+from collections import Counter
+
+from pricing import LUXURY_BRANDS, get_calibrator
+
+CATALOGUE_PATH = os.environ.get(
+    "CAR_PRICE_CATALOGUE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalogue.json"),
+)
+
+luxury_brands = LUXURY_BRANDS
+
+# ==================================================
+# Form options
+# ==================================================
+# Selectbox fields whose choices come from catalogue.json (see build)
+OPTION_FIELDS = ("fuel", "owner", "color")
+
+MIN_YEAR = 1995
+KM_RANGE = (0, 300_000, 5_000)        # min, max, step
+ENGINE_RANGE = (800, 7000, 100)
+POWER_RANGE = (50, 800, 5)
+TANK_RANGE = (30, 100, 1)
+
+# Brand spellings the title-cased data gets wrong
+DISPLAY_NAMES = {"Mg": "MG"}
+
+
+def transmissions_for(brand):
+    return ["Automatic"] if brand in luxury_brands else ["Manual", "Automatic"]
+
+
+def model_family(model):
+    """First word of a variant: "City V Petrol [2017-2019]" -> "City"."""
+    from encoder import normalize_category
+
+    words = normalize_category(model).split()
+    return words[0] if words else ""
+
+
+# ==================================================
+# Catalogue index
+# ==================================================
+class Catalogue:
+    """Read-only view of catalogue.json."""
+
+    def __init__(self, data):
+        self.brands = data["brands"]
+        self.brand_defaults = [_defaults(d) for d in data["brand_defaults"]]
+        self.brand_listings = data["brand_listings"]
+        self.offsets = data["offsets"]
+        self.models = data["models"]
+        self.model_defaults = data["model_defaults"]
+        self.listings = data["listings"]
+        self.baselines = data["baselines"]
+        # Empty in files written before the options were derived
+        self.options = data.get("options", {field: [] for field in OPTION_FIELDS})
+        self.source_digest = data.get("source_digest")
+        self.columns_digest = data.get("columns_digest")
+
+        self._brand_index = {b.lower(): i for i, b in enumerate(self.brands)}
+        self._keys = [m.lower() for m in self.models]
+        self._families = {}
+
+    @classmethod
+    def load(cls, path=CATALOGUE_PATH):
+        with open(path) as fh:
+            return cls(json.load(fh))
+
+    def _slice(self, brand):
+        i = self._brand_index.get(brand.lower())
+        if i is None:
+            raise KeyError(f"Unknown brand {brand!r}")
+        return i, self.offsets[i], self.offsets[i + 1]
+
+    def models_for(self, brand):
+        """All variants of ``brand``, by name."""
+        _, start, stop = self._slice(brand)
+        return self.models[start:stop]
+
+    def _prefix_range(self, brand, prefix):
+        _, start, stop = self._slice(brand)
+        prefix = prefix.lower()
+        lo = bisect.bisect_left(self._keys, prefix, start, stop)
+        return lo, bisect.bisect_left(self._keys, prefix + "\uffff", lo, stop)
+
+    def search(self, brand, prefix, limit=None):
+        """Variants of ``brand`` starting with ``prefix`` (case-insensitive)."""
+        lo, hi = self._prefix_range(brand, prefix)
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return self.models[lo:hi]
+
+    def families(self, brand):
+        """Model families of ``brand``, most listed first."""
+        i, start, stop = self._slice(brand)
+        if i not in self._families:
+            counts = Counter()
+            for j in range(start, stop):
+                counts[model_family(self.models[j])] += self.listings[j]
+            self._families[i] = [f for f, _ in counts.most_common()]
+        return self._families[i]
+
+    def variants(self, brand, family):
+        """Variants of one family, most listed first."""
+        lo, hi = self._prefix_range(brand, family)
+        matches = [j for j in range(lo, hi) if model_family(self.models[j]) == family]
+        matches.sort(key=lambda j: -self.listings[j])
+        return [self.models[j] for j in matches]
+
+    def defaults(self, brand, model=None):
+        """{"engine", "power", "tank"} for a variant, else for the brand."""
+        i, start, stop = self._slice(brand)
+        if model is not None:
+            key = model.lower()
+            j = bisect.bisect_left(self._keys, key, start, stop)
+            if j < stop and self._keys[j] == key:
+                return _defaults(self.model_defaults[j])
+        return self.brand_defaults[i]
+
+    def most_listed_brand(self):
+        return self.brands[max(range(len(self.brands)), key=self.brand_listings.__getitem__)]
+
+    def popular(self, n):
+        """The ``n`` most listed (brand, model) variants."""
+        top = sorted(range(len(self.models)), key=lambda j: -self.listings[j])[:n]
+        return [(self.brands[bisect.bisect_right(self.offsets, j) - 1], self.models[j])
+                for j in top]
+
+
+def _defaults(values):
+    engine, power, tank = values
+    return {"engine": engine, "power": power, "tank": tank}
+
+
+# None until the first `python catalogue.py build`
+catalogue = Catalogue.load() if os.path.exists(CATALOGUE_PATH) else None
+
+# Brand -> variants and brand defaults, as the offline jobs enumerate them
+brand_model_map, brand_defaults = {}, {}
+if catalogue is not None:
+    brand_model_map = {brand: catalogue.models_for(brand) for brand in catalogue.brands}
+    brand_defaults = dict(zip(catalogue.brands, catalogue.brand_defaults))
+
+# Spelled as in the data and model_columns ("First", "Petrol + Cng"), most listed first
+FUEL_TYPES, OWNERS, COLORS = (
+    list(catalogue.options[field]) if catalogue is not None else []
+    for field in OPTION_FIELDS
+)
+
+
+# ==================================================
+# Build
+# ==================================================
+def display_name(make):
+    """The calibration rules' spelling of a make ("Bmw" -> "BMW")."""
+    from encoder import normalize_category
+
+    calibrator = get_calibrator()
+    for name in list(calibrator.luxury_brands) + list(calibrator.brand_caps):
+        if normalize_category(name) == make:
+            return name
+    return DISPLAY_NAMES.get(make, make)
+
+
+def clamp(value, bounds):
+    low, high = bounds[0], bounds[1]
+    return int(min(max(round(value), low), high))
+
+
+def build(data_path=None, columns_path=None, path=CATALOGUE_PATH):
+    """Derive the catalogue from the training CSV, aligned to the columns."""
+    import joblib
+    import pandas as pd
+
+    from encoder import CATEGORICAL_FIELDS
+    from model_registry import COLUMNS_PATH, file_digest
+    from train import DATA_PATH, parse_listings
+
+    data_path = data_path or DATA_PATH
+    columns_path = columns_path or COLUMNS_PATH
+    parsed = parse_listings(pd.read_csv(data_path))
+    columns = set(joblib.load(columns_path))
+
+    # get_dummies(drop_first=True) dropped the first category of each column
+    baselines = {
+        field: str(sorted(parsed[prefix].dropna().unique())[0])
+        for field, prefix in CATEGORICAL_FIELDS.items()
+    }
+
+    def encodable(field, value):
+        return (f"{CATEGORICAL_FIELDS[field]}_{value}" in columns
+                or value == baselines[field])
+
+    parsed = parsed[
+        parsed["Make"].map(lambda v: encodable("brand", v))
+        & parsed["Model"].map(lambda v: encodable("model", v))
+    ]
+    options = {
+        field: [str(v) for v in parsed[CATEGORICAL_FIELDS[field]].value_counts().index
+                if encodable(field, v)]
+        for field in OPTION_FIELDS
+    }
+    spec = ["engine_cc", "max_power", "Fuel_Tank_Capacity"]
+    bounds = [ENGINE_RANGE, POWER_RANGE, TANK_RANGE]
+
+    def medians(frame):
+        return [clamp(frame[c].median(), b) for c, b in zip(spec, bounds)]
+
+    data = {"brands": [], "brand_defaults": [], "brand_listings": [], "offsets": [0],
+            "models": [], "model_defaults": [], "listings": []}
+    makes = sorted(parsed["Make"].unique(), key=lambda m: display_name(m).lower())
+    for make in makes:
+        rows = parsed[parsed["Make"] == make]
+        data["brands"].append(display_name(make))
+        data["brand_defaults"].append(medians(rows))
+        data["brand_listings"].append(len(rows))
+        for model, group in sorted(rows.groupby("Model"), key=lambda g: g[0].lower()):
+            data["models"].append(model)
+            data["model_defaults"].append(medians(group))
+            data["listings"].append(len(group))
+        data["offsets"].append(len(data["models"]))
+    data["baselines"] = baselines
+    data["options"] = options
+    data["source_digest"] = file_digest(data_path)
+    data["columns_digest"] = file_digest(columns_path)
+
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump(data, fh, separators=(",", ":"))
+    os.replace(tmp, path)
+    return Catalogue(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Brand / model catalogue.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help="derive catalogue.json from the CSV")
+    build_parser.add_argument("--data", help="training CSV (default: the bundled one)")
+    sub.add_parser("check", help="compare catalogue.json with model_columns.pkl")
+    search_parser = sub.add_parser("search", help="prefix search within a brand")
+    search_parser.add_argument("brand")
+    search_parser.add_argument("prefix", nargs="?", default="")
+    search_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        built = build(args.data)
+        print(f"{len(built.brands)} brands, {len(built.models):,} variants "
+              f"({os.path.getsize(CATALOGUE_PATH) / 1e3:.0f} kB) -> {CATALOGUE_PATH}")
+    elif catalogue is None:
+        parser.error(f"{CATALOGUE_PATH} not found; run `python catalogue.py build` first")
+    elif args.command == "check":
+        from model_registry import COLUMNS_PATH, file_digest
+
+        if catalogue.columns_digest != file_digest(COLUMNS_PATH):
+            parser.exit(1, "catalogue.json was built for other model columns; "
+                           "run `python catalogue.py build`\n")
+        print("catalogue.json matches model_columns.pkl")
+    else:
+        for model in catalogue.search(args.brand, args.prefix, args.limit):
+            print(f"  {model:<50} {catalogue.defaults(args.brand, model)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Comparable listings from the training data.
+
+    python comparables.py build                      # writes comparables.pkl
+    python comparables.py query --brand Honda --model City --year 2017 \\
+        --km 60000 --engine-cc 1500 --max-power 119 -k 5
+    python comparables.py bench                      # query latency
+
+For a listing, the k most similar rows of the bundled CSV: same make and
+model family (first word of the model name, so "City" matches "City 1.5 V
+Mt"), closest in year, kilometres, engine size and power. When the family
+has fewer than k listings the rest come from the same make, then from any
+make.
+
+The index is built once. Rows are sorted by (make, family), so every
+partition - one family, or a whole make - is a contiguous slice of one
+scaled feature matrix. Partitions larger than ``KDTREE_MIN_ROWS`` get a
+KD-tree, smaller ones are scanned directly, which is faster at that size.
+The index is saved with joblib next to the model and loaded through the
+model registry, so a rebuilt file is picked up without a restart.
+
+Prices are the listings' asking prices converted to USD at ``INR_TO_USD``.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from catalogue import model_family
+from encoder import normalize_category
+from model_registry import BASE_DIR, ModelRegistry, file_digest, joblib_load
+
+COMPARABLES_PATH = os.environ.get(
+    "CAR_PRICE_COMPARABLES_PATH", os.path.join(BASE_DIR, "comparables.pkl")
+)
+FEATURES = ["year", "km", "engine_cc", "max_power"]
+# Relative importance after scaling each feature to unit spread.
+FEATURE_WEIGHTS = np.array([1.5, 1.0, 1.0, 1.0])
+KDTREE_MIN_ROWS = 64
+DEFAULT_K = 5
+MATCH_LEVELS = ("model", "make", "any")
+
+
+class ComparablesIndex:
+    """Sorted listing arrays plus a KD-tree or slice per partition."""
+
+    def __init__(self, rows, source_digest=None):
+        from sklearn.neighbors import KDTree
+
+        makes = np.array([normalize_category(m) for m in rows["make"]], dtype=object)
+        families = np.array([model_family(m) for m in rows["model"]], dtype=object)
+        order = np.lexsort((families, makes))
+        self.rows = {name: np.asarray(values)[order] for name, values in rows.items()}
+        self.makes, self.families = makes[order], families[order]
+
+        raw = np.column_stack([self.rows[f] for f in FEATURES]).astype(np.float64)
+        self.center = np.nanmedian(raw, axis=0)
+        spread = np.nanpercentile(raw, 75, axis=0) - np.nanpercentile(raw, 25, axis=0)
+        self.scale = np.where(spread > 0, spread, 1.0) / FEATURE_WEIGHTS
+        self.features = self._scaled(np.where(np.isnan(raw), self.center, raw))
+        self.source_digest = source_digest
+
+        # (make, family) and make -> (start, stop) slices of the sorted rows
+        self.partitions = {}
+        for key in (list(zip(self.makes, self.families)), list(self.makes)):
+            start = 0
+            for i in range(1, len(key) + 1):
+                if i == len(key) or key[i] != key[start]:
+                    self.partitions[key[start]] = (start, i)
+                    start = i
+        self.trees = {
+            key: KDTree(self.features[start:stop])
+            for key, (start, stop) in self.partitions.items()
+            if stop - start >= KDTREE_MIN_ROWS
+        }
+        self.global_tree = KDTree(self.features)
+
+    def _scaled(self, values):
+        return ((values - self.center) / self.scale).astype(np.float64)
+
+    def __len__(self):
+        return len(self.makes)
+
+    def resolve_make(self, brand):
+        """Index make for ``brand``; "Maruti" also finds "Maruti Suzuki"."""
+        make = normalize_category(brand)
+        if make in self.partitions:
+            return make
+        for known in sorted(k for k in self.partitions if isinstance(k, str)):
+            if known.startswith(make + " "):
+                return known
+        return make
+
+    def _nearest(self, key, point, k, exclude):
+        """(row indices, distances) of the k nearest rows of one partition."""
+        if key is None:
+            tree, start = self.global_tree, 0
+            stop = len(self)
+        else:
+            if key not in self.partitions:
+                return [], []
+            (start, stop), tree = self.partitions[key], self.trees.get(key)
+        want = min(k + len(exclude), stop - start)
+        if tree is not None:
+            distances, positions = tree.query(point[None, :], k=want)
+            distances, positions = distances[0], positions[0] + start
+        else:
+            d = np.sqrt(((self.features[start:stop] - point) ** 2).sum(axis=1))
+            nearest = np.argsort(d, kind="stable")[:want]
+            distances, positions = d[nearest], nearest + start
+        keep = [i for i, p in enumerate(positions) if p not in exclude][:k]
+        return positions[keep].tolist(), distances[keep].tolist()
+
+    def query(self, listing, k=DEFAULT_K):
+        """The ``k`` most comparable listings as dicts, closest first within
+        the most specific match level."""
+        make = self.resolve_make(listing["brand"])
+        family = model_family(listing["model"])
+        raw = np.array([float(listing[f]) for f in FEATURES])
+        point = self._scaled(np.where(np.isnan(raw), self.center, raw))
+
+        found, results = set(), []
+        for level, key in zip(MATCH_LEVELS, [(make, family), make, None]):
+            if len(results) >= k:
+                break
+            positions, distances = self._nearest(key, point, k - len(results), found)
+            for position, distance in zip(positions, distances):
+                found.add(position)
+                results.append(dict(
+                    {name: _plain(values[position]) for name, values in self.rows.items()},
+                    match=level, distance=round(float(distance), 4),
+                ))
+        return results
+
+    def query_many(self, listings, k=DEFAULT_K):
+        return [self.query(listing, k) for listing in listings]
+
+
+def _plain(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+# ==================================================
+# Build / load
+# ==================================================
+def read_rows(data_path):
+    """Column arrays of the parsed training CSV, in ``ComparablesIndex`` form."""
+    import pandas as pd
+
+    from train import LAKH, parse_listings
+
+    raw = pd.read_csv(data_path)
+    raw["row"] = np.arange(len(raw))
+    parsed = parse_listings(raw)
+    return {
+        "row": parsed["row"].to_numpy(),
+        "make": parsed["Make"].to_numpy(dtype=object),
+        "model": parsed["Model"].to_numpy(dtype=object),
+        "year": parsed["Year"].to_numpy(),
+        "km": parsed["Kilometer"].to_numpy(),
+        "engine_cc": parsed["engine_cc"].to_numpy(),
+        "max_power": parsed["max_power"].to_numpy(),
+        "fuel": parsed["Fuel Type"].to_numpy(dtype=object),
+        "transmission": parsed["Transmission"].to_numpy(dtype=object),
+        "owner": parsed["Owner"].to_numpy(dtype=object),
+        # parse_listings scales Price by a lakh before the INR -> USD rate
+        "price_usd": (parsed["Price"] / LAKH).round(0).to_numpy(),
+    }
+
+
+def build(data_path=None, path=COMPARABLES_PATH):
+    import joblib
+
+    from train import DATA_PATH
+
+    data_path = data_path or DATA_PATH
+    index = ComparablesIndex(read_rows(data_path), file_digest(data_path))
+    # Plain state rather than the object, so a file written by the CLI
+    # (where the class lives in __main__) loads anywhere
+    tmp = path + ".tmp"
+    joblib.dump(vars(index), tmp)
+    os.replace(tmp, path)
+    return index
+
+
+def load_index(path):
+    index = ComparablesIndex.__new__(ComparablesIndex)
+    vars(index).update(joblib_load(path))
+    return index
+
+
+comparable_indexes = ModelRegistry(loader=load_index)
+
+
+def get_comparables(path=COMPARABLES_PATH):
+    """The persisted index, or None if it has not been built."""
+    if not os.path.exists(path):
+        return None
+    return comparable_indexes.get(path)
+
+
+def benchmark(index, n=2000, k=DEFAULT_K, seed=0):
+    """Per-query latency percentiles (ms) over random training listings."""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(len(index), size=n)
+    listings = [
+        {"brand": index.makes[i], "model": index.rows["model"][i],
+         **{f: index.rows[f][i] for f in FEATURES}}
+        for i in picks
+    ]
+    timings = np.empty(n)
+    for j, listing in enumerate(listings):
+        start = time.perf_counter()
+        index.query(listing, k)
+        timings[j] = time.perf_counter() - start
+    return {q: float(np.percentile(timings, q) * 1e3) for q in (50, 99)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Comparable listings index.")
+    parser.add_argument("command", choices=["build", "query", "bench"])
+    parser.add_argument("--data", help="training CSV (default: the bundled one)")
+    parser.add_argument("--out", default=COMPARABLES_PATH)
+    parser.add_argument("-k", type=int, default=DEFAULT_K)
+    for field in ["brand", "model"]:
+        parser.add_argument("--" + field)
+    for field in FEATURES:
+        parser.add_argument("--" + field.replace("_", "-"), type=float)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.perf_counter()
+        index = build(args.data, args.out)
+        print(f"Indexed {len(index):,} listings in {len(index.partitions):,} partitions "
+              f"({len(index.trees)} KD-trees) in {time.perf_counter() - start:.2f}s; "
+              f"{os.path.getsize(args.out) / 1e6:.2f} MB -> {args.out}")
+        return
+
+    index = get_comparables(args.out)
+    if index is None:
+        parser.error(f"{args.out} not found; run `python comparables.py build` first")
+    if args.command == "bench":
+        p = benchmark(index, k=args.k)
+        print(f"k={args.k}: p50 {p[50]:.3f} ms, p99 {p[99]:.3f} ms per query")
+        return
+
+    listing = {"brand": args.brand, "model": args.model,
+               **{f: getattr(args, f) for f in FEATURES}}
+    missing = [name for name, value in listing.items() if value is None]
+    if missing:
+        parser.error("query needs --" + ", --".join(m.replace("_", "-") for m in missing))
+    for c in index.query(listing, args.k):
+        print(f"  [{c['match']:<5}] {c['year']:.0f} {c['make']} {c['model']:<34} "
+              f"{c['km']:>9,.0f} km {c['engine_cc']:>6,.0f} cc {c['max_power']:>5,.0f} bhp  "
+              f"${c['price_usd']:>9,.0f}  (row {c['row']}, d={c['distance']:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Shrink the forest to fit a size / latency budget.
+
+    python compress.py --max-trees 100
+    python compress.py --max-bytes 2_000_000 --max-p99-ms 0.5 --out car_price_model.forest
+
+Two reductions are combined:
+
+* tree selection - trees are ranked greedily by how much they bring the
+  subset's mean closer to the full forest's prediction on the training rows
+  (no labels are used, so the hold-out stays untouched);
+* depth pruning - every tree is cut at a maximum depth, the cut nodes
+  becoming leaves that predict their stored node mean.
+
+Every (depth, tree count) candidate that meets the budget is scored by its
+fidelity to the full forest on the training rows; the best one is written in
+the flat format. R² / MAE on the notebook's hold-out and single-row latency
+are reported for the original and the compressed model.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from forest import (
+    FLAT_ALIGN, LEAF_QUANTILE_LEVELS, FlatForest, compile_forest, flat_layout,
+    flat_size, save_flat,
+)
+from model_registry import BASE_DIR, MODEL_PATH, registry
+
+COMPACT_PATH = os.path.join(BASE_DIR, "car_price_model.compact.forest")
+
+# feature (int32) + float32 threshold + 2 x int32 children + float64 value
+FLAT_BYTES_PER_NODE = 4 + 4 + 8 + 8
+MISSING_BYTES_PER_NODE = 1          # missing_left (bool), when saved
+LEAF_INDEX_BYTES_PER_NODE = 4       # leaf_index (int32), with leaf quantiles
+QUANTILE_BYTES = 4                  # per leaf and quantile level (float32)
+
+
+def byte_model(forest, columns=None, quantile_levels=LEAF_QUANTILE_LEVELS):
+    """(fixed, per node, per leaf) bytes of a flat file cut from ``forest``:
+    header and alignment padding, node arrays, leaf quantile rows."""
+    arrays, _, _, data_start = flat_layout(forest, columns)
+    fixed = data_start + FLAT_ALIGN * (len(arrays) + 2)
+    per_node = FLAT_BYTES_PER_NODE + (MISSING_BYTES_PER_NODE if "missing_left" in arrays else 0)
+    per_leaf = 0
+    if quantile_levels:
+        per_node += LEAF_INDEX_BYTES_PER_NODE
+        per_leaf = QUANTILE_BYTES * len(quantile_levels)
+    return fixed, per_node, per_leaf
+
+
+# ==================================================
+# Sub-forests
+# ==================================================
+def node_depths(forest):
+    depth = np.full(forest.node_count, -1, dtype=np.int32)
+    frontier = np.asarray(forest.roots)
+    level = 0
+    while frontier.size:
+        depth[frontier] = level
+        frontier = frontier[~forest.is_leaf[frontier]]
+        frontier = np.concatenate([forest.left[frontier], forest.right[frontier]])
+        level += 1
+    return depth
+
+
+def tree_ranges(forest):
+    ends = np.append(forest.roots[1:], forest.node_count)
+    return np.stack([forest.roots, ends], axis=1)
+
+
+def subforest(forest, trees, max_depth=None, depth=None):
+    """New FlatForest with only ``trees`` (in that order), cut at ``max_depth``."""
+    if depth is None:
+        depth = node_depths(forest)
+    ranges = tree_ranges(forest)
+    limit = np.iinfo(np.int32).max if max_depth is None else max_depth
+
+    keep = np.concatenate([
+        np.arange(start, end)[depth[start:end] <= limit] for start, end in ranges[trees]
+    ])
+    remap = np.full(forest.node_count, -1, dtype=np.int64)
+    remap[keep] = np.arange(len(keep))
+
+    leaf = forest.is_leaf[keep] | (depth[keep] >= limit)
+    children = forest.children.reshape(-1, 2)[keep]
+    children = np.where(leaf[:, None], -1, remap[children]).astype(np.int32)
+    missing = None if forest.missing_left is None else np.asarray(forest.missing_left)[keep]
+
+    return FlatForest(
+        np.where(leaf, 0, forest.feature[keep]).astype(np.int32),
+        np.asarray(forest.threshold)[keep],
+        children,
+        np.asarray(forest.value)[keep],
+        remap[ranges[trees, 0]].astype(np.int32),
+        missing_left=missing,
+        n_features=forest.n_features,
+        max_depth=int(min(limit, depth[keep].max())),
+        columns=forest.columns,
+        source_version=forest.source_version,
+    )
+
+
+def rank_trees(per_tree, target, limit):
+    """Greedy forward selection: each step adds the tree that brings the
+    running mean closest to ``target`` (mean squared error)."""
+    n_trees = per_tree.shape[1]
+    chosen, available = [], np.ones(n_trees, dtype=bool)
+    total = np.zeros(per_tree.shape[0])
+    for k in range(1, min(limit, n_trees) + 1):
+        candidate = (total[:, None] + per_tree) / k
+        error = ((candidate - target[:, None]) ** 2).mean(axis=0)
+        error[~available] = np.inf
+        best = int(np.argmin(error))
+        chosen.append(best)
+        available[best] = False
+        total += per_tree[:, best]
+    return np.array(chosen)
+
+
+# ==================================================
+# Measurements
+# ==================================================
+def single_row_latency(forest, rows, repeat=200):
+    """(p50, p99) single-row predict latency in milliseconds."""
+    timings = np.empty(repeat)
+    for i in range(repeat):
+        row = rows[i % len(rows)][None, :]
+        start = time.perf_counter()
+        forest.predict_stats(row)
+        timings[i] = time.perf_counter() - start
+    return np.percentile(timings, 50) * 1e3, np.percentile(timings, 99) * 1e3
+
+
+def holdout_metrics(forest, X_test, y_test):
+    from sklearn.metrics import mean_absolute_error, r2_score
+
+    y_pred = forest.predict(X_test)
+    return {
+        "r2": float(r2_score(y_test, y_pred)),
+        "mae_usd": float(mean_absolute_error(y_test, y_pred)),
+    }
+
+
+def describe(forest, X_test, y_test):
+    p50, p99 = single_row_latency(forest, X_test)
+    return dict(
+        holdout_metrics(forest, X_test, y_test),
+        trees=forest.n_trees,
+        nodes=forest.node_count,
+        max_depth=forest.max_depth,
+        flat_bytes=flat_size(forest),
+        p50_ms=p50,
+        p99_ms=p99,
+    )
+
+
+# ==================================================
+# Budgeted search
+# ==================================================
+def compress(forest, X_train, max_trees=None, max_depth=None, max_bytes=None,
+             max_p99_ms=None, depth_step=2, latency_rows=None, columns=None,
+             quantile_levels=LEAF_QUANTILE_LEVELS):
+    """Best sub-forest within the budget, by fidelity to ``forest`` on X_train.
+
+    ``max_bytes`` bounds the saved file, including the leaf quantiles for
+    ``quantile_levels`` that the export adds (pass () if it adds none).
+    """
+    per_tree = forest.predict_trees(X_train)
+    teacher = per_tree.mean(axis=1)
+    tree_limit = min(max_trees or forest.n_trees, forest.n_trees)
+    order = rank_trees(per_tree, teacher, tree_limit)
+    depth = node_depths(forest)
+    latency_rows = X_train if latency_rows is None else latency_rows
+    fixed, per_node, per_leaf = byte_model(forest, columns, quantile_levels)
+
+    top = min(max_depth or forest.max_depth, forest.max_depth)
+    best = None
+    for d in range(top, 0, -depth_step):
+        # Nodes and leaves per tree at this depth, in ranked order -> bytes
+        # for each k. A node at depth d becomes a leaf when cut there.
+        ranges = tree_ranges(forest)[order]
+        nodes = np.array([np.count_nonzero(depth[start:end] <= d) for start, end in ranges])
+        leaves = np.array([
+            np.count_nonzero((depth[start:end] == d)
+                             | (forest.is_leaf[start:end] & (depth[start:end] < d)))
+            for start, end in ranges
+        ])
+        size = fixed + np.cumsum(nodes) * per_node + np.cumsum(leaves) * per_leaf
+        fits = size <= (max_bytes or np.inf)
+        k = int(np.count_nonzero(fits))
+
+        # Latency grows with tree count; shrink k until p99 fits.
+        while k and max_p99_ms is not None:
+            if single_row_latency(subforest(forest, order[:k], d, depth),
+                                  latency_rows)[1] <= max_p99_ms:
+                break
+            k = k * 3 // 4
+        if not k:
+            continue
+
+        candidate = subforest(forest, order[:k], d, depth)
+        pruned = candidate.predict_trees(X_train)
+        error = float(((pruned.mean(axis=1) - teacher) ** 2).mean())
+        if best is None or error < best[0]:
+            best = (error, candidate)
+
+    if best is None:
+        raise ValueError("No sub-forest fits the requested budget")
+    return best[1]
+
+
+def main(argv=None):
+    from train import holdout_split, load_encoded
+
+    parser = argparse.ArgumentParser(description="Compress the forest to a budget.")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--max-trees", type=int)
+    parser.add_argument("--max-depth", type=int)
+    parser.add_argument("--max-bytes", type=lambda v: int(float(v)))
+    parser.add_argument("--max-p99-ms", type=float)
+    parser.add_argument("--out", default=COMPACT_PATH)
+    args = parser.parse_args(argv)
+
+    X, y = load_encoded()
+    X_train, X_test, y_train, y_test = holdout_split(X, y)
+    X_train = X_train.to_numpy(dtype=np.float32)
+    X_test = X_test.to_numpy(dtype=np.float32)
+
+    original = compile_forest(registry.get(args.model))
+    original.source_version = registry.version(args.model)
+
+    start = time.perf_counter()
+    compact = compress(
+        original, X_train, args.max_trees, args.max_depth, args.max_bytes,
+        args.max_p99_ms, latency_rows=X_test, columns=list(X.columns),
+    )
+    search_seconds = time.perf_counter() - start
+    # Pruned trees have new leaves, so the QRF leaf quantiles are refitted.
+    compact.fit_leaf_quantiles(X_train, y_train)
+    save_flat(compact, args.out, list(X.columns))
+
+    before = describe(original, X_test, y_test)
+    after = describe(compact, X_test, y_test)
+    print(f"Search took {search_seconds:.1f}s; wrote {args.out} "
+          f"({os.path.getsize(args.out):,} bytes)")
+    print(f"{'':<12} {'original':>16} {'compressed':>16}")
+    for key, fmt in [
+        ("trees", "{:,}"), ("max_depth", "{}"), ("nodes", "{:,}"),
+        ("flat_bytes", "{:,}"), ("p50_ms", "{:.3f}"), ("p99_ms", "{:.3f}"),
+        ("r2", "{:.4f}"), ("mae_usd", "{:,.0f}"),
+    ]:
+        print(f"{key:<12} {fmt.format(before[key]):>16} {fmt.format(after[key]):>16}")
+    print(
+        f"R² change {after['r2'] - before['r2']:+.4f}, "
+        f"MAE change {after['mae_usd'] / before['mae_usd'] - 1:+.1%}, "
+        f"p99 latency x{before['p99_ms'] / after['p99_ms']:.1f} faster"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Precompiled one-hot encoder for model_columns.pkl.
+
+The encoder is built once per column list. It maps every
+``(prefix, category)`` pair and every numeric field straight to a column
+index, so encoding a listing is a handful of array writes into a
+preallocated row (or a batch matrix / CSR matrix for many rows).
+
+Categories are normalised the way the training notebook normalised them
+(``str.strip().str.title()``). A category with no column of its own is
+reported back to the caller instead of being dropped silently. It is still
+encoded as all zeros, which is what ``get_dummies(drop_first=True)`` did
+for the reference category.
+"""
+import numpy as np
+
+# Listing fields -> model column (numeric) or one-hot prefix (categorical)
+NUMERIC_FIELDS = {
+    "year": "Year",
+    "km": "Kilometer",
+    "engine_cc": "engine_cc",
+    "max_power": "max_power",
+    "fuel_tank": "Fuel_Tank_Capacity",
+}
+CATEGORICAL_FIELDS = {
+    "brand": "Make",
+    "model": "Model",
+    "fuel": "Fuel Type",
+    "transmission": "Transmission",
+    "owner": "Owner",
+    "color": "Color",
+}
+LISTING_FIELDS = list(NUMERIC_FIELDS) + list(CATEGORICAL_FIELDS)
+
+
+def normalize_category(value):
+    return str(value).strip().title()
+
+
+class FeatureEncoder:
+    """Listing fields -> positions in the model's feature vector."""
+
+    def __init__(self, model_columns, baselines=None):
+        self.columns = list(model_columns)
+        self.n_columns = len(self.columns)
+        index = {col: i for i, col in enumerate(self.columns)}
+
+        self.numeric_positions = {
+            field: index[column] for field, column in NUMERIC_FIELDS.items()
+        }
+
+        # field -> {normalised category: column index}
+        self.category_positions = {field: {} for field in CATEGORICAL_FIELDS}
+        for field, prefix in CATEGORICAL_FIELDS.items():
+            head = prefix + "_"
+            for col, i in index.items():
+                if col.startswith(head):
+                    self.category_positions[field][col[len(head):]] = i
+
+        # Reference categories dropped by get_dummies(drop_first=True); they
+        # are legitimately all-zero and so not reported as unknown.
+        self.baselines = {
+            field: normalize_category(value)
+            for field, value in (baselines or {}).items()
+        }
+
+    # ==================================================
+    # Lookups
+    # ==================================================
+    def position(self, field, value):
+        """Column index for a category, or None if it has no column."""
+        return self.category_positions[field].get(normalize_category(value))
+
+    def categories(self, field):
+        return sorted(self.category_positions[field])
+
+    def _is_unknown(self, field, value):
+        return value != self.baselines.get(field)
+
+    def _category_hits(self, listings):
+        """(rows, cols) of the ones plus {field: [unknown categories]}."""
+        import pandas as pd  # batch path only; keeps single-row imports light
+
+        rows, cols, unknown = [], [], {}
+        for field, positions in self.category_positions.items():
+            values = pd.Series(listings[field]).astype(str).str.strip().str.title()
+            mapped = values.map(positions).to_numpy(dtype=float)
+            hit = ~np.isnan(mapped)
+            rows.append(np.flatnonzero(hit))
+            cols.append(mapped[hit].astype(np.intp))
+            missing = [
+                v for v in pd.unique(values[~hit]) if self._is_unknown(field, v)
+            ]
+            if missing:
+                unknown[field] = sorted(missing)
+        return np.concatenate(rows), np.concatenate(cols), unknown
+
+    # ==================================================
+    # Encoding
+    # ==================================================
+    def encode_one(self, listing, out=None):
+        """Encode one listing dict into a (1, n_columns) float32 row.
+
+        Returns ``(row, unknown)`` where ``unknown`` lists the
+        ``(field, category)`` pairs that matched no column.
+        """
+        row = np.zeros((1, self.n_columns), dtype=np.float32) if out is None else out
+        if out is not None:
+            row.fill(0)
+        for field, pos in self.numeric_positions.items():
+            row[0, pos] = listing.get(field, 0)
+
+        unknown = []
+        for field, positions in self.category_positions.items():
+            if field not in listing:
+                continue
+            value = normalize_category(listing[field])
+            pos = positions.get(value)
+            if pos is not None:
+                row[0, pos] = 1
+            elif self._is_unknown(field, value):
+                unknown.append((field, value))
+        return row, unknown
+
+    def encode(self, listings, out=None):
+        """Encode a DataFrame of listings into a dense float32 matrix.
+
+        ``out`` may be a reusable buffer with at least ``len(listings)`` rows.
+        Returns ``(X, unknown)`` with ``unknown`` as ``{field: [categories]}``.
+        """
+        n = len(listings)
+        if out is None:
+            X = np.zeros((n, self.n_columns), dtype=np.float32)
+        else:
+            X = out[:n]
+            X.fill(0)
+        for field, pos in self.numeric_positions.items():
+            X[:, pos] = np.asarray(listings[field], dtype=np.float32)
+
+        rows, cols, unknown = self._category_hits(listings)
+        X[rows, cols] = 1
+        return X, unknown
+
+    def encode_sparse(self, listings):
+        """Like ``encode`` but returns a ``scipy.sparse.csr_matrix``."""
+        from scipy import sparse
+
+        n = len(listings)
+        numeric_cols = np.fromiter(self.numeric_positions.values(), dtype=np.intp)
+        numeric = np.column_stack([
+            np.asarray(listings[field], dtype=np.float32)
+            for field in self.numeric_positions
+        ]) if n else np.empty((0, len(numeric_cols)), dtype=np.float32)
+
+        cat_rows, cat_cols, unknown = self._category_hits(listings)
+        rows = np.concatenate([np.repeat(np.arange(n), len(numeric_cols)), cat_rows])
+        cols = np.concatenate([np.tile(numeric_cols, n), cat_cols])
+        data = np.concatenate([numeric.ravel(), np.ones(len(cat_rows), np.float32)])
+        X = sparse.csr_matrix((data, (rows, cols)), shape=(n, self.n_columns))
+        X.eliminate_zeros()
+        return X, unknown
+
+
+# ==================================================
+# Per-column-list cache
+# ==================================================
+_cached = (None, None, None)
+
+
+def catalogue_baselines():
+    """Reference categories recorded by the catalogue build (empty without one)."""
+    from catalogue import catalogue
+
+    return catalogue.baselines if catalogue is not None else {}
+
+
+def get_encoder(model_columns, baselines=None):
+    """Encoder for ``model_columns``, rebuilt only when the list changes.
+
+    ``baselines`` defaults to the catalogue's reference categories.
+    """
+    global _cached
+    if baselines is None:
+        baselines = catalogue_baselines()
+    columns, cached_baselines, encoder = _cached
+    if columns is not model_columns or cached_baselines is not baselines:
+        encoder = FeatureEncoder(model_columns, baselines)
+        _cached = (model_columns, baselines, encoder)
+    return encoder
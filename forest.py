@@ -0,0 +1,614 @@
+"""
+Flattened random-forest evaluator.
+
+All trees of a fitted ``RandomForestRegressor`` are packed into a handful of
+contiguous NumPy buffers (one slot per node, tree after tree). A batch of rows
+then walks every tree at once: each step advances all (row, tree) cursors that
+have not reached a leaf yet, so the cost is a few vector operations per tree
+level instead of one sklearn ``predict`` call per tree.
+"""
+import json
+import os
+import struct
+import weakref
+
+import numpy as np
+
+from model_registry import BASE_DIR, ModelRegistry, load_model, model_version
+
+LEAF = -1
+
+FLAT_PATH = os.environ.get(
+    "CAR_PRICE_FLAT_PATH", os.path.join(BASE_DIR, "car_price_model.forest")
+)
+FLAT_MAGIC = b"CARFOREST"
+FLAT_FORMAT_VERSION = 2
+# Version 1 stored a leaf quantile row for every node (no leaf_index).
+READABLE_FORMAT_VERSIONS = (1, 2)
+FLAT_ALIGN = 64
+
+# Training-target quantiles stored per leaf for quantile-regression-forest
+# intervals (see FlatForest.fit_leaf_quantiles).
+LEAF_QUANTILE_LEVELS = (5, 10, 25, 50, 75, 90, 95)
+INTERVAL_METHODS = ("std", "trees", "qrf")
+
+
+class FlatForest:
+    """Per-tree predictions for many rows in one vectorized pass.
+
+    Comparisons follow sklearn exactly: inputs are cast to float32 and
+    compared with ``<=`` against the split thresholds, so the per-tree
+    outputs are bit-identical to ``tree.predict``. Thresholds may be stored
+    as float64 (sklearn's own) or narrowed to float32 by
+    ``narrow_thresholds``, which preserves every float32 comparison.
+
+    Arrays are used as given, so a forest can sit directly on top of a
+    read-only memory map (see ``load_flat``).
+
+    ``leaf_quantiles`` (n_leaves, len(quantile_levels)) optionally holds,
+    for every leaf, quantiles of the training targets that fell into it;
+    ``leaf_index`` maps a node to its row there (-1 for split nodes).
+    """
+
+    def __init__(self, feature, threshold, children, value, roots,
+                 missing_left=None, n_features=None, max_depth=None,
+                 columns=None, source_version=None, leaf_quantiles=None,
+                 quantile_levels=None, leaf_index=None):
+        self.feature = feature
+        self.threshold = threshold
+        # children[node] = (left, right), LEAF for both on a leaf
+        self.children = children.reshape(-1)
+        self.value = value
+        self.roots = roots
+        self.missing_left = missing_left
+        self.n_features = n_features
+        self.max_depth = max_depth
+        self.columns = columns
+        self.source_version = source_version
+        self.leaf_quantiles = leaf_quantiles
+        if leaf_quantiles is not None and leaf_index is None:
+            # Format version 1: one row per node
+            leaf_index = np.arange(len(feature), dtype=np.int32)
+        self.leaf_index = leaf_index
+        self.quantile_levels = None if quantile_levels is None else list(quantile_levels)
+        self.is_leaf = self.children[0::2] == LEAF
+
+    @classmethod
+    def from_sklearn(cls, model, source_version=None):
+        feature, threshold, children, value = [], [], [], []
+        missing, roots = [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == LEAF
+            roots.append(offset)
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+            children.append(np.where(
+                is_leaf[:, None],
+                LEAF,
+                np.stack([tree.children_left, tree.children_right], axis=1) + offset,
+            ))
+            value.append(tree.value[:, 0, 0])
+            missing_go_left = getattr(tree, "missing_go_to_left", None)
+            missing.append(
+                np.zeros(n, dtype=bool) if missing_go_left is None
+                else np.asarray(missing_go_left, dtype=bool)
+            )
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n
+
+        columns = getattr(model, "feature_names_in_", None)
+        return cls(
+            np.concatenate(feature).astype(np.int32),
+            np.concatenate(threshold).astype(np.float64),
+            np.concatenate(children).astype(np.int32),
+            np.concatenate(value).astype(np.float64),
+            np.asarray(roots, dtype=np.int32),
+            missing_left=np.concatenate(missing),
+            n_features=model.n_features_in_,
+            max_depth=max_depth,
+            columns=None if columns is None else list(columns),
+            source_version=source_version,
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def node_count(self):
+        return len(self.feature)
+
+    @property
+    def left(self):
+        return self.children[0::2]
+
+    @property
+    def right(self):
+        return self.children[1::2]
+
+    def arrays(self):
+        arrays = {
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "children": self.children,
+            "value": self.value,
+            "roots": self.roots,
+        }
+        if self.missing_left is not None:
+            arrays["missing_left"] = self.missing_left
+        if self.leaf_quantiles is not None:
+            arrays["leaf_quantiles"] = self.leaf_quantiles
+            arrays["leaf_index"] = self.leaf_index
+        return arrays
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.arrays().values())
+
+    # ==================================================
+    # Traversal
+    # ==================================================
+    def _as_matrix(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        if self.n_features is not None and X.shape[1] != self.n_features:
+            raise ValueError(
+                f"X has {X.shape[1]} features, the forest expects {self.n_features}"
+            )
+        return X
+
+    def apply(self, X):
+        """Leaf node index reached in every tree, shape (n_rows, n_trees)."""
+        X = self._as_matrix(X)
+        n_rows, n_trees = X.shape[0], self.n_trees
+        has_nan = self.missing_left is not None and np.isnan(X).any()
+
+        # Column-major copy so that feature * n_rows + row addresses a cell.
+        flat_x = np.ascontiguousarray(X.T).ravel()
+        index = np.int32 if flat_x.size < 2 ** 31 else np.int64
+        offset = self.feature.astype(index) * index(n_rows)
+
+        # Cursors are laid out tree-major; only the ones still sitting on a
+        # split node are carried into the next step.
+        leaves = np.repeat(self.roots, n_rows)
+        slot = np.arange(leaves.size, dtype=index)
+        row = np.tile(np.arange(n_rows, dtype=index), n_trees)
+        node = leaves.copy()
+        keep = ~self.is_leaf[node]
+        slot, row, node = slot[keep], row[keep], node[keep]
+
+        while slot.size:
+            x = flat_x[offset[node] + row]
+            go_right = x > self.threshold[node]
+            if has_nan:
+                nan = np.isnan(x)
+                go_right[nan] = ~self.missing_left[node[nan]]
+            node = self.children[2 * node + go_right]
+            done = self.is_leaf[node]
+            leaves[slot[done]] = node[done]
+            keep = ~done
+            slot, row, node = slot[keep], row[keep], node[keep]
+
+        return leaves.reshape(n_trees, n_rows).T
+
+    def predict_trees(self, X):
+        """Per-tree predictions, shape (n_rows, n_trees)."""
+        return np.ascontiguousarray(self.value[self.apply(X)])
+
+    def predict(self, X):
+        return self.predict_trees(X).mean(axis=1)
+
+    def predict_stats(self, X, percentiles=()):
+        """Mean, std and the requested percentiles across trees, per row."""
+        per_tree = self.predict_trees(X)
+        stats = {
+            "mean": per_tree.mean(axis=1),
+            "std": per_tree.std(axis=1),
+        }
+        if len(percentiles):
+            values = np.percentile(per_tree, percentiles, axis=1)
+            for q, row in zip(percentiles, values):
+                stats[f"p{q:g}"] = row
+        return stats
+
+    # ==================================================
+    # Prediction intervals
+    # ==================================================
+    def fit_leaf_quantiles(self, X, y, levels=LEAF_QUANTILE_LEVELS):
+        """Store, per leaf, the ``levels`` quantiles of the targets of the
+        training rows ``X`` that land in it.
+
+        Done once at export time. At query time a quantile-regression-forest
+        interval is then the mean of the reached leaves' stored quantiles:
+        one gather per tree, whatever the training set size.
+        """
+        leaves = self.apply(X).ravel()
+        targets = np.repeat(np.asarray(y, dtype=np.float64), self.n_trees)
+        order = np.lexsort((targets, leaves))
+        leaves, targets = leaves[order], targets[order]
+        nodes, starts, counts = np.unique(leaves, return_index=True, return_counts=True)
+
+        # Rows for leaves only; split nodes are never reached by apply().
+        leaf_nodes = np.flatnonzero(self.is_leaf)
+        leaf_index = np.full(self.node_count, -1, dtype=np.int32)
+        leaf_index[leaf_nodes] = np.arange(len(leaf_nodes), dtype=np.int32)
+
+        # Leaves no training row reaches keep their own prediction.
+        quantiles = np.repeat(
+            np.asarray(self.value, dtype=np.float32)[leaf_nodes, None], len(levels), axis=1
+        )
+        rows = leaf_index[nodes]
+        for j, level in enumerate(levels):
+            position = level / 100 * (counts - 1)
+            low = np.floor(position).astype(np.int64)
+            high = np.minimum(low + 1, counts - 1)
+            frac = position - low
+            quantiles[rows, j] = (
+                targets[starts + low] * (1 - frac) + targets[starts + high] * frac
+            )
+        self.leaf_quantiles = quantiles
+        self.leaf_index = leaf_index
+        self.quantile_levels = [float(level) for level in levels]
+        return self
+
+    def has_leaf_quantiles(self, levels):
+        return self.leaf_quantiles is not None and all(
+            float(level) in self.quantile_levels for level in levels
+        )
+
+    def predict_interval(self, X, method="std", levels=(10, 90)):
+        """Mean plus a (low, high) band per row, from a single traversal.
+
+        ``method``:
+          "std"   - mean ± std of the per-tree predictions;
+          "trees" - the ``levels`` percentiles of the per-tree predictions;
+          "qrf"   - mean over trees of the stored leaf quantiles at ``levels``
+                    (requires ``fit_leaf_quantiles``).
+        """
+        if method not in INTERVAL_METHODS:
+            raise ValueError(f"Unknown interval method {method!r}")
+        leaves = self.apply(X)
+        per_tree = np.ascontiguousarray(self.value[leaves])
+        mean = per_tree.mean(axis=1)
+        std = per_tree.std(axis=1)
+
+        if method == "std":
+            low, high = mean - std, mean + std
+        elif method == "trees":
+            low, high = np.percentile(per_tree, levels, axis=1)
+        else:
+            if not self.has_leaf_quantiles(levels):
+                raise ValueError(
+                    f"The forest has no leaf quantiles for levels {list(levels)}; "
+                    "export it with training data (python forest.py export)"
+                )
+            rows = self.leaf_index[leaves]
+            low, high = (
+                self.leaf_quantiles[rows, self.quantile_levels.index(float(level))]
+                .mean(axis=1, dtype=np.float64)
+                for level in levels
+            )
+        return {"mean": mean, "std": std, "low": low, "high": high}
+
+
+# ==================================================
+# Flat binary format
+#
+#   magic | uint64 header length | JSON header | arrays (64-byte aligned)
+#
+# The header holds the column list, forest shape, the leaf quantile levels
+# (if any) and, per array, its dtype, shape and byte offset, so the loader
+# can map every array in place.
+# ==================================================
+def narrow_thresholds(threshold):
+    """float64 thresholds -> float32 without changing any float32 comparison.
+
+    Each threshold is rounded *down* to the nearest float32. For a float32
+    input x, ``x <= t64`` and ``x <= t32`` are then always equivalent.
+    """
+    narrowed = threshold.astype(np.float32)
+    over = narrowed.astype(np.float64) > threshold
+    narrowed[over] = np.nextafter(narrowed[over], np.float32(-np.inf))
+    return narrowed
+
+
+def flat_layout(forest, columns=None):
+    """(arrays, header, encoded header, data start) exactly as ``save_flat``
+    writes them."""
+    arrays = {
+        "feature": forest.feature.astype(np.int32),
+        "threshold": narrow_thresholds(np.asarray(forest.threshold, dtype=np.float64)),
+        "children": forest.children.astype(np.int32),
+        "value": forest.value.astype(np.float64),
+        "roots": forest.roots.astype(np.int32),
+    }
+    if forest.missing_left is not None and forest.missing_left.any():
+        arrays["missing_left"] = forest.missing_left.astype(np.bool_)
+    if forest.leaf_quantiles is not None:
+        arrays["leaf_quantiles"] = np.asarray(forest.leaf_quantiles, dtype=np.float32)
+        arrays["leaf_index"] = np.asarray(forest.leaf_index, dtype=np.int32)
+
+    # Offsets are relative to the start of the (aligned) data section.
+    offset, specs = 0, {}
+    for name, array in arrays.items():
+        specs[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset = _align(offset + array.nbytes)
+
+    header = {
+        "format_version": FLAT_FORMAT_VERSION,
+        "n_features": forest.n_features,
+        "n_trees": forest.n_trees,
+        "node_count": forest.node_count,
+        "max_depth": forest.max_depth,
+        "source_version": forest.source_version,
+        "quantile_levels": forest.quantile_levels,
+        "columns": list(columns if columns is not None else forest.columns or []),
+        "arrays": specs,
+    }
+    encoded = json.dumps(header).encode()
+    return arrays, header, encoded, _align(len(FLAT_MAGIC) + 8 + len(encoded))
+
+
+def flat_size(forest, columns=None):
+    """Size in bytes of the file ``save_flat`` would write."""
+    arrays, header, _, data_start = flat_layout(forest, columns)
+    specs = header["arrays"]
+    return data_start + max(specs[n]["offset"] + a.nbytes for n, a in arrays.items())
+
+
+def save_flat(forest, path, columns=None):
+    arrays, header, encoded, data_start = flat_layout(forest, columns)
+    specs = header["arrays"]
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(FLAT_MAGIC)
+        fh.write(struct.pack("<Q", len(encoded)))
+        fh.write(encoded)
+        for name, array in arrays.items():
+            fh.seek(data_start + specs[name]["offset"])
+            fh.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp, path)
+    return header
+
+
+def _align(offset):
+    return -(-offset // FLAT_ALIGN) * FLAT_ALIGN
+
+
+def read_flat_header(path):
+    with open(path, "rb") as fh:
+        if fh.read(len(FLAT_MAGIC)) != FLAT_MAGIC:
+            raise ValueError(f"{path} is not a flat forest file")
+        (length,) = struct.unpack("<Q", fh.read(8))
+        header = json.loads(fh.read(length))
+    header["data_start"] = _align(len(FLAT_MAGIC) + 8 + length)
+    if header["format_version"] not in READABLE_FORMAT_VERSIONS:
+        raise ValueError(
+            f"{path} has format version {header['format_version']}, "
+            f"expected one of {READABLE_FORMAT_VERSIONS}"
+        )
+    return header
+
+
+def load_flat(path, mmap=True):
+    """FlatForest backed by a read-only memory map of ``path``.
+
+    Every process that maps the same file shares its pages, so N workers
+    cost one copy of the node arrays in the page cache. ``mmap=False``
+    reads the arrays into private memory instead.
+    """
+    header = read_flat_header(path)
+    if mmap:
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    else:
+        with open(path, "rb") as fh:
+            buffer = np.frombuffer(fh.read(), dtype=np.uint8)
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        start = header["data_start"] + spec["offset"]
+        arrays[name] = (
+            buffer[start:start + count * dtype.itemsize]
+            .view(dtype)
+            .reshape(spec["shape"])
+        )
+
+    forest = FlatForest(
+        arrays["feature"],
+        arrays["threshold"],
+        arrays["children"],
+        arrays["value"],
+        arrays["roots"],
+        missing_left=arrays.get("missing_left"),
+        n_features=header["n_features"],
+        max_depth=header["max_depth"],
+        columns=header["columns"],
+        source_version=header["source_version"],
+        leaf_quantiles=arrays.get("leaf_quantiles"),
+        quantile_levels=header.get("quantile_levels"),
+        leaf_index=arrays.get("leaf_index"),
+    )
+    return forest
+
+
+flat_models = ModelRegistry(loader=load_flat)
+
+
+def global_forest():
+    """The single forest: the flat export if it matches the current pickle,
+    otherwise the pickle compiled in memory."""
+    if os.path.exists(FLAT_PATH):
+        forest = flat_models.get(FLAT_PATH)
+        if forest.source_version == model_version():
+            return forest
+    return compile_forest(load_model())
+
+
+def get_forest():
+    """The forest to serve: ``global_forest()``, behind the per-segment
+    router when segment models were built for the current columns
+    (see segments.py)."""
+    from segments import routed_forest
+
+    return routed_forest(global_forest())
+
+
+def serving_version():
+    """Content version of whatever ``get_forest`` serves.
+
+    Caches keyed on it are dropped when the pickle, the flat file (e.g. a
+    re-export or a compressed model) or the segment models change.
+    """
+    from segments import segments_version
+
+    version = model_version()
+    if os.path.exists(FLAT_PATH):
+        forest = flat_models.get(FLAT_PATH)
+        if forest.source_version == version:
+            version = flat_models.version(FLAT_PATH)
+    return segments_version(version)
+
+
+# ==================================================
+# Per-model cache
+# ==================================================
+_compiled = weakref.WeakKeyDictionary()
+
+
+def compile_forest(model):
+    """FlatForest for ``model``, built once and reused while the model lives."""
+    forest = _compiled.get(model)
+    if forest is None:
+        forest = FlatForest.from_sklearn(model)
+        _compiled[model] = forest
+    return forest
+
+
+# ==================================================
+# Export / load comparison
+# ==================================================
+def _memory():
+    """(rss, pss) in bytes for this process; pss splits shared pages."""
+    from model_registry import rss_bytes
+
+    pss = None
+    try:
+        with open("/proc/self/smaps_rollup") as fh:
+            for line in fh:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return rss_bytes(), pss
+
+
+def _measure_load(kind, path, n_rows):
+    """Runs in a fresh process: load one artifact, then predict once."""
+    import time
+
+    rss_before, pss_before = _memory()
+    start = time.perf_counter()
+    if kind == "joblib":
+        import joblib
+
+        forest = FlatForest.from_sklearn(joblib.load(path))
+    else:
+        forest = load_flat(path, mmap=(kind == "mmap"))
+    load_seconds = time.perf_counter() - start
+    rss_loaded, _ = _memory()
+
+    X = np.zeros((n_rows, forest.n_features), dtype=np.float32)
+    start = time.perf_counter()
+    forest.predict(X)
+    predict_seconds = time.perf_counter() - start
+    rss_used, pss_used = _memory()
+    return {
+        "kind": kind,
+        "load_seconds": load_seconds,
+        "predict_seconds": predict_seconds,
+        "rss_after_load": rss_loaded - rss_before,
+        "rss_after_predict": rss_used - rss_before,
+        "pss_after_predict": None if pss_used is None else pss_used - pss_before,
+    }
+
+
+def compare_loading(pickle_path, flat_path, n_rows=256):
+    import multiprocessing
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for kind, path in (("joblib", pickle_path), ("read", flat_path), ("mmap", flat_path)):
+        with ctx.Pool(1) as pool:
+            results.append(pool.apply(_measure_load, (kind, path, n_rows)))
+    return results
+
+
+def main(argv=None):
+    import argparse
+
+    from model_registry import COLUMNS_PATH, MODEL_PATH
+
+    parser = argparse.ArgumentParser(
+        description="Export the forest to the flat format and compare loading."
+    )
+    parser.add_argument("command", choices=["export", "compare"])
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--columns", default=COLUMNS_PATH)
+    parser.add_argument("--out", default=FLAT_PATH)
+    parser.add_argument("--no-leaf-quantiles", action="store_true",
+                        help="skip the per-leaf training quantiles used by 'qrf' intervals")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        import joblib
+
+        from model_registry import registry
+
+        forest = FlatForest.from_sklearn(
+            joblib.load(args.model), source_version=registry.version(args.model)
+        )
+        columns = joblib.load(args.columns)
+        if not args.no_leaf_quantiles:
+            from train import DATA_PATH, holdout_split, load_encoded
+
+            if os.path.exists(DATA_PATH):
+                X, y = load_encoded()
+                X_train, _, y_train, _ = holdout_split(X, y)
+                # Incremental updates may have appended columns to the model.
+                X_train = X_train.reindex(columns=columns, fill_value=0)
+                forest.fit_leaf_quantiles(X_train.to_numpy(dtype=np.float32), y_train)
+            else:
+                print(f"No training data at {DATA_PATH}; exporting without leaf quantiles")
+        header = save_flat(forest, args.out, columns)
+        print(
+            f"Wrote {args.out}: {header['n_trees']} trees, "
+            f"{header['node_count']:,} nodes, {os.path.getsize(args.out) / 1e6:.1f} MB "
+            f"(pickle {os.path.getsize(args.model) / 1e6:.1f} MB)"
+        )
+
+    print(f"{'loader':<8} {'load':>9} {'predict':>9} {'RSS load':>10} "
+          f"{'RSS used':>10} {'PSS used':>10}")
+    for r in compare_loading(args.model, args.out):
+        pss = r["pss_after_predict"]
+        print(
+            f"{r['kind']:<8} {r['load_seconds'] * 1e3:7.1f}ms "
+            f"{r['predict_seconds'] * 1e3:7.1f}ms "
+            f"{r['rss_after_load'] / 1e6:8.1f}MB {r['rss_after_predict'] / 1e6:8.1f}MB "
+            f"{'-' if pss is None else f'{pss / 1e6:8.1f}MB':>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Incremental model updates from a window of new listings.
+
+    python incremental.py new_sales.csv                    # add 50 trees
+    python incremental.py new_sales.csv --mode replace --trees 50
+    python incremental.py new_sales.csv --compare-full     # also time a retrain
+
+Starts from the current car_price_model.pkl instead of retraining all 500
+trees. The window (raw CSV schema) is parsed like the training data and
+split 80/20. At most ``--trees`` new trees are fitted on its training part
+and then either appended to the forest ("add") or swapped in for the oldest
+trees ("replace", a rolling ensemble of constant size).
+
+Categories the model has no column for get new one-hot columns appended at
+the end of model_columns. Existing columns keep their positions, so the old
+trees stay valid; they are re-declared with the wider feature count and
+simply never split on the new columns.
+
+Every update writes a versioned copy of both artifacts to models/, records
+it in models/history.json, and then replaces car_price_model.pkl and
+model_columns.pkl. The report compares the update's cost and hold-out
+scores with a full retrain (measured with --compare-full, estimated
+otherwise).
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from model_registry import BASE_DIR, COLUMNS_PATH, MODEL_PATH, file_digest
+from train import (
+    CATEGORICAL_COLUMNS,
+    DATA_PATH,
+    DEFAULT_PARAMS,
+    FINAL_FEATURES,
+    TEST_SIZE,
+    evaluate,
+    fit_forest,
+    holdout_split,
+    load_encoded,
+    parse_listings,
+)
+
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+HISTORY_FILE = "history.json"
+DEFAULT_TREES = 50
+
+
+# ==================================================
+# Encoding the window
+# ==================================================
+def reference_categories(data_path=DATA_PATH):
+    """Categories get_dummies(drop_first=True) dropped when the base model
+    was trained; they are all-zero on purpose and need no new column."""
+    if not os.path.exists(data_path):
+        return {}
+    parsed = parse_listings(pd.read_csv(data_path))
+    return {c: str(sorted(parsed[c].dropna().unique())[0]) for c in CATEGORICAL_COLUMNS}
+
+
+def encode_window(window, columns, references):
+    """Parsed window -> (X, y, new_columns) against ``columns``.
+
+    ``X`` has ``columns + new_columns``, new one-hot columns being the
+    categories that have neither a column nor are a reference category.
+    """
+    dummies = pd.get_dummies(window[FINAL_FEATURES], columns=CATEGORICAL_COLUMNS)
+    known = set(columns)
+    reference_columns = {f"{c}_{v}" for c, v in references.items()}
+    new_columns = [
+        col for col in dummies.columns
+        if col not in known and col != "Price" and col not in reference_columns
+    ]
+    X = dummies.reindex(columns=list(columns) + new_columns, fill_value=0)
+    return X.astype(np.float32), dummies["Price"], new_columns
+
+
+def widen(model, n_features, columns):
+    """Re-declare every fitted tree for ``n_features`` inputs (in place).
+
+    Node arrays are copied unchanged, so predictions on the original
+    columns are identical and any extra columns are ignored.
+    """
+    from sklearn.tree._tree import Tree
+
+    for estimator in model.estimators_:
+        old = estimator.tree_
+        tree = Tree(n_features, np.ones(old.n_outputs, dtype=np.intp), old.n_outputs)
+        tree.__setstate__(old.__getstate__())
+        estimator.tree_ = tree
+        estimator.n_features_in_ = n_features
+    model.n_features_in_ = n_features
+    model.feature_names_in_ = np.asarray(columns, dtype=object)
+    return model
+
+
+# ==================================================
+# Update
+# ==================================================
+def update(model, X_window, y_window, n_trees=DEFAULT_TREES, mode="add", seed=0):
+    """Model with ``n_trees`` trees fitted on the window added or rotated in."""
+    if mode not in ("add", "replace"):
+        raise ValueError(f"Unknown update mode {mode!r}")
+    params = {k: v for k, v in model.get_params().items() if k in DEFAULT_PARAMS}
+    fresh = fit_forest(X_window, y_window, dict(params, n_estimators=n_trees, random_state=seed))
+
+    kept = model.estimators_
+    if mode == "replace":
+        kept = kept[min(n_trees, len(kept) - 1):]
+    model.estimators_ = list(kept) + list(fresh.estimators_)
+    model.n_estimators = len(model.estimators_)
+    return model
+
+
+def load_history(models_dir=MODELS_DIR):
+    path = os.path.join(models_dir, HISTORY_FILE)
+    if not os.path.exists(path):
+        return {"references": None, "versions": []}
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def save_version(model, columns, entry, history, models_dir=MODELS_DIR,
+                 model_path=MODEL_PATH, columns_path=COLUMNS_PATH):
+    """Write the versioned artifacts, record them, then swap in the live ones."""
+    os.makedirs(models_dir, exist_ok=True)
+    tmp_model = os.path.join(models_dir, "car_price_model.pkl.tmp")
+    joblib.dump(model, tmp_model)
+    version = file_digest(tmp_model)[:12]
+    versioned_model = os.path.join(models_dir, f"car_price_model-{version}.pkl")
+    versioned_columns = os.path.join(models_dir, f"model_columns-{version}.pkl")
+    os.replace(tmp_model, versioned_model)
+    joblib.dump(list(columns), versioned_columns)
+
+    history["versions"].append(dict(entry, version=version))
+    with open(os.path.join(models_dir, HISTORY_FILE + ".tmp"), "w") as fh:
+        json.dump(history, fh, indent=2)
+    os.replace(os.path.join(models_dir, HISTORY_FILE + ".tmp"),
+               os.path.join(models_dir, HISTORY_FILE))
+
+    # Columns first: a reader that sees the new model also sees its columns.
+    for source, target in ((versioned_columns, columns_path), (versioned_model, model_path)):
+        shutil.copyfile(source, target + ".tmp")
+        os.replace(target + ".tmp", target)
+    return version
+
+
+def run_update(window_path, n_trees=DEFAULT_TREES, mode="add", compare_full=False,
+               model_path=MODEL_PATH, columns_path=COLUMNS_PATH, models_dir=MODELS_DIR,
+               data_path=DATA_PATH):
+    timings = {}
+    start = time.perf_counter()
+    model = joblib.load(model_path)
+    columns = list(joblib.load(columns_path))
+    parent = file_digest(model_path)[:12]
+    history = load_history(models_dir)
+    if history["references"] is None:
+        history["references"] = reference_categories(data_path)
+    timings["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    window = parse_listings(pd.read_csv(window_path))
+    X, y, new_columns = encode_window(window, columns, history["references"])
+    X_train, X_test, y_train, y_test = holdout_split(X, y)
+    timings["encode"] = time.perf_counter() - start
+
+    all_columns = columns + new_columns
+    before = evaluate(model, X_test[columns], y_test)
+
+    start = time.perf_counter()
+    widen(model, len(all_columns), all_columns)
+    update(model, X_train, y_train, n_trees, mode, seed=len(history["versions"]) + 1)
+    timings["fit"] = time.perf_counter() - start
+    after = evaluate(model, X_test, y_test)
+
+    report = {
+        "window": os.path.abspath(window_path),
+        "window_rows": len(window),
+        "mode": mode,
+        "trees_fitted": n_trees,
+        "n_trees": model.n_estimators,
+        "new_columns": new_columns,
+        "parent": parent,
+        "window_holdout_before": before,
+        "window_holdout_after": after,
+        "seconds": timings,
+        "update_seconds": sum(timings.values()),
+    }
+
+    if os.path.exists(data_path):
+        X_base, y_base = load_encoded(data_path)
+        _, X_base_test, _, y_base_test = holdout_split(X_base, y_base)
+        X_base_test = X_base_test.reindex(columns=all_columns, fill_value=0)
+        report["base_holdout_after"] = evaluate(model, X_base_test, y_base_test)
+
+        if compare_full:
+            X_base_train, _, y_base_train, _ = holdout_split(X_base, y_base)
+            X_full = pd.concat([
+                X_base_train.reindex(columns=all_columns, fill_value=0).astype(np.float32),
+                X_train,
+            ])
+            start = time.perf_counter()
+            full = fit_forest(X_full, pd.concat([y_base_train, y_train]))
+            report["full_retrain_seconds"] = time.perf_counter() - start
+            report["full_window_holdout"] = evaluate(full, X_test, y_test)
+            report["full_base_holdout"] = evaluate(full, X_base_test, y_base_test)
+        else:
+            # Tree fitting cost grows roughly linearly with rows and trees.
+            rows = len(X_base) * (1 - TEST_SIZE) + len(X_train)
+            report["full_retrain_seconds_estimate"] = (
+                timings["fit"] / n_trees * DEFAULT_PARAMS["n_estimators"]
+                * rows / max(len(X_train), 1)
+            )
+
+    entry = {k: report[k] for k in ("window", "window_rows", "mode", "trees_fitted",
+                                     "n_trees", "new_columns", "parent")}
+    entry["created"] = time.time()
+    report["version"] = save_version(
+        model, all_columns, entry, history, models_dir, model_path, columns_path
+    )
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update the model from new listings.")
+    parser.add_argument("window", help="CSV of new listings (raw training schema)")
+    parser.add_argument("--trees", type=int, default=DEFAULT_TREES)
+    parser.add_argument("--mode", choices=["add", "replace"], default="add")
+    parser.add_argument("--compare-full", action="store_true",
+                        help="also run a full retrain to measure its cost")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--columns", default=COLUMNS_PATH)
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    args = parser.parse_args(argv)
+
+    report = run_update(args.window, args.trees, args.mode, args.compare_full,
+                        args.model, args.columns, args.models_dir)
+
+    print(f"Version {report['version']} (from {report['parent']}): {report['mode']} "
+          f"{report['trees_fitted']} trees -> {report['n_trees']} trees, "
+          f"{report['window_rows']:,} window rows")
+    if report["new_columns"]:
+        print(f"New columns ({len(report['new_columns'])}): "
+              + ", ".join(report["new_columns"]))
+    print(f"Window hold-out R²: {report['window_holdout_before']['r2']:.4f} -> "
+          f"{report['window_holdout_after']['r2']:.4f}")
+    if "base_holdout_after" in report:
+        print(f"Base hold-out R² after update: {report['base_holdout_after']['r2']:.4f}")
+    print(f"Update took {report['update_seconds']:.1f}s "
+          f"(fit {report['seconds']['fit']:.1f}s)")
+    if "full_retrain_seconds" in report:
+        print(f"Full retrain took {report['full_retrain_seconds']:.1f}s "
+              f"(x{report['full_retrain_seconds'] / report['update_seconds']:.1f}); "
+              f"window R² {report['full_window_holdout']['r2']:.4f}, "
+              f"base R² {report['full_base_holdout']['r2']:.4f}")
+    elif "full_retrain_seconds_estimate" in report:
+        print(f"Full retrain estimated at {report['full_retrain_seconds_estimate']:.0f}s")
+    print("Re-export the flat model (python forest.py export) to serve it memory-mapped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+Chunked ingestion and bounded-memory training for large listing histories.
+
+    python ingest.py build listings.csv
+    python ingest.py train listings.csv --max-memory-mb 1024
+
+The raw CSV (same schema as Data/car details v4 (2).csv) is never loaded
+whole. It is read ``--chunk-rows`` rows at a time, twice:
+
+1. vocabulary - each chunk is parsed with train.parse_listings (precompiled
+   unit parsers) and the categories of every one-hot column are counted.
+   The sorted vocabulary fixes the encoded column list once, as
+   ``get_dummies(drop_first=True)`` would have over the whole file.
+2. encode - each chunk is parsed again and written as a float32 X shard
+   and a float64 y shard (.npy) under .cache/ingest/<content hash>/, next
+   to a manifest.json with the columns, vocabulary and shard list.
+
+Training memory-maps the shards. If the training rows fit in the memory
+budget they are fitted in one go with the notebook's hold-out split, which
+reproduces train.py exactly. Otherwise trees are grown in rounds, each on a
+fresh random sample of at most the budget, with a fixed per-shard hold-out
+evaluated shard by shard.
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import time
+from collections import Counter
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from model_registry import BASE_DIR, COLUMNS_PATH, MODEL_PATH, file_digest
+from train import (
+    CATEGORICAL_COLUMNS,
+    DATA_PATH,
+    DEFAULT_PARAMS,
+    ENCODE_VERSION,
+    FINAL_FEATURES,
+    PARSE_VERSION,
+    SPLIT_SEED,
+    TEST_SIZE,
+    evaluate,
+    fit_forest,
+    holdout_split,
+    parse_listings,
+    stage_key,
+)
+
+INGEST_DIR = os.path.join(BASE_DIR, ".cache", "ingest")
+INGEST_VERSION = 1
+CHUNK_ROWS = 100_000
+
+RAW_COLUMNS = [
+    "Make", "Model", "Price", "Year", "Kilometer", "Fuel Type", "Transmission",
+    "Location", "Color", "Owner", "Seller Type", "Engine", "Max Power",
+    "Max Torque", "Drivetrain", "Length", "Width", "Height", "Seating Capacity",
+    "Fuel Tank Capacity",
+]
+TEXT_COLUMNS = [
+    "Make", "Model", "Fuel Type", "Transmission", "Location", "Color", "Owner",
+    "Seller Type", "Engine", "Max Power", "Max Torque", "Drivetrain",
+]
+NUMERIC_COLUMNS = [
+    c for c in FINAL_FEATURES if c not in CATEGORICAL_COLUMNS and c != "Price"
+]
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    """Parsed frames of at most ``chunk_rows`` raw rows each."""
+    reader = pd.read_csv(
+        path, usecols=RAW_COLUMNS, dtype={c: str for c in TEXT_COLUMNS},
+        chunksize=chunk_rows,
+    )
+    for chunk in reader:
+        yield parse_listings(chunk)
+
+
+# ==================================================
+# Pass 1: vocabulary
+# ==================================================
+def build_vocabulary(path, chunk_rows=CHUNK_ROWS, min_count=1):
+    """{column: sorted categories} plus the parsed row count.
+
+    Categories seen fewer than ``min_count`` times get no column and are
+    encoded like the reference category (all zeros).
+    """
+    counts = {column: Counter() for column in CATEGORICAL_COLUMNS}
+    n_rows = 0
+    for frame in read_chunks(path, chunk_rows):
+        n_rows += len(frame)
+        for column in CATEGORICAL_COLUMNS:
+            counts[column].update(frame[column].dropna().value_counts().to_dict())
+    vocabulary = {
+        column: sorted(c for c, n in counter.items() if n >= min_count)
+        for column, counter in counts.items()
+    }
+    return vocabulary, n_rows
+
+
+def encoded_columns(vocabulary):
+    """Column list in get_dummies order: numerics, then one-hot blocks with
+    the first (reference) category of each dropped."""
+    columns = list(NUMERIC_COLUMNS)
+    for column in CATEGORICAL_COLUMNS:
+        columns += [f"{column}_{category}" for category in vocabulary[column][1:]]
+    return columns
+
+
+# ==================================================
+# Pass 2: encoded shards
+# ==================================================
+def encode_frame(frame, vocabulary, n_columns):
+    """Parsed frame -> (float32 X, float64 y) with the fixed vocabulary."""
+    X = np.zeros((len(frame), n_columns), dtype=np.float32)
+    for i, column in enumerate(NUMERIC_COLUMNS):
+        X[:, i] = frame[column].to_numpy(dtype=np.float32, na_value=np.nan)
+
+    base = len(NUMERIC_COLUMNS)
+    rows = np.arange(len(frame))
+    for column in CATEGORICAL_COLUMNS:
+        categories = vocabulary[column]
+        codes = pd.Categorical(frame[column], categories=categories).codes.astype(np.intp)
+        # code 0 is the dropped reference category, -1 unknown / missing
+        hit = codes >= 1
+        X[rows[hit], base + codes[hit] - 1] = 1
+        base += max(len(categories) - 1, 0)
+    return X, frame["Price"].to_numpy(dtype=np.float64)
+
+
+def ingest(path=DATA_PATH, cache_dir=INGEST_DIR, chunk_rows=CHUNK_ROWS, min_count=1,
+           verbose=True):
+    """Encoded shard directory for ``path``; reused while the file is unchanged."""
+    key = stage_key(file_digest(path), PARSE_VERSION, ENCODE_VERSION,
+                    INGEST_VERSION, min_count)
+    directory = os.path.join(cache_dir, key)
+    manifest_path = os.path.join(directory, "manifest.json")
+    if os.path.exists(manifest_path):
+        if verbose:
+            print(f"Using cached shards in {directory}")
+        return directory
+
+    start = time.perf_counter()
+    vocabulary, n_rows = build_vocabulary(path, chunk_rows, min_count)
+    columns = encoded_columns(vocabulary)
+    vocabulary_seconds = time.perf_counter() - start
+    if verbose:
+        print(f"  vocabulary {vocabulary_seconds:8.2f}s  "
+              f"{n_rows:,} rows, {len(columns):,} columns")
+
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    shards = []
+    for i, frame in enumerate(read_chunks(path, chunk_rows)):
+        X, y = encode_frame(frame, vocabulary, len(columns))
+        shard = {"x": f"X-{i:05d}.npy", "y": f"y-{i:05d}.npy", "rows": len(frame)}
+        np.save(os.path.join(directory, shard["x"]), X)
+        np.save(os.path.join(directory, shard["y"]), y)
+        shards.append(shard)
+    encode_seconds = time.perf_counter() - start
+    if verbose:
+        print(f"  encode     {encode_seconds:8.2f}s  {len(shards)} shards")
+
+    manifest = {
+        "source": os.path.abspath(path),
+        "ingest_version": INGEST_VERSION,
+        "min_count": min_count,
+        "n_rows": n_rows,
+        "columns": columns,
+        "vocabulary": vocabulary,
+        "shards": shards,
+        "seconds": {"vocabulary": vocabulary_seconds, "encode": encode_seconds},
+    }
+    # Written last, so a half-built directory is never mistaken for a cache hit.
+    with open(manifest_path + ".tmp", "w") as fh:
+        json.dump(manifest, fh)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return directory
+
+
+class ShardedDataset:
+    """Memory-mapped view of an ingested shard directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "manifest.json")) as fh:
+            self.manifest = json.load(fh)
+        self.columns = self.manifest["columns"]
+        self.shards = self.manifest["shards"]
+        self.n_rows = self.manifest["n_rows"]
+
+    @property
+    def n_features(self):
+        return len(self.columns)
+
+    def shard(self, i):
+        spec = self.shards[i]
+        return (
+            np.load(os.path.join(self.directory, spec["x"]), mmap_mode="r"),
+            np.load(os.path.join(self.directory, spec["y"]), mmap_mode="r"),
+        )
+
+    def load(self):
+        """All rows as one (X, y) frame pair; only for data that fits."""
+        parts = [self.shard(i) for i in range(len(self.shards))]
+        X = np.concatenate([x for x, _ in parts]) if parts else np.empty((0, self.n_features))
+        y = np.concatenate([y for _, y in parts]) if parts else np.empty(0)
+        return pd.DataFrame(X, columns=self.columns), pd.Series(y, name="Price")
+
+    def holdout_mask(self, i, test_size=TEST_SIZE, seed=SPLIT_SEED):
+        """Fixed hold-out rows of shard ``i`` for the streaming path."""
+        rng = np.random.default_rng([seed, i])
+        return rng.random(self.shards[i]["rows"]) < test_size
+
+    def sample(self, n, rng, test_size=TEST_SIZE):
+        """Up to ``n`` random training (non hold-out) rows across all shards."""
+        train_rows = [np.flatnonzero(~self.holdout_mask(i, test_size))
+                      for i in range(len(self.shards))]
+        total = sum(len(r) for r in train_rows)
+        picks = np.sort(rng.choice(total, size=min(n, total), replace=False))
+        bounds = np.cumsum([0] + [len(r) for r in train_rows])
+
+        X = np.empty((len(picks), self.n_features), dtype=np.float32)
+        y = np.empty(len(picks))
+        filled = 0
+        for i, rows in enumerate(train_rows):
+            local = picks[(picks >= bounds[i]) & (picks < bounds[i + 1])] - bounds[i]
+            if not len(local):
+                continue
+            shard_x, shard_y = self.shard(i)
+            X[filled:filled + len(local)] = shard_x[rows[local]]
+            y[filled:filled + len(local)] = shard_y[rows[local]]
+            filled += len(local)
+        return pd.DataFrame(X, columns=self.columns), y
+
+
+# ==================================================
+# Bounded-memory training
+# ==================================================
+def budget_rows(dataset, max_memory_mb):
+    return int(max_memory_mb * 2 ** 20 // (dataset.n_features * 4 + 8))
+
+
+def evaluate_streaming(model, dataset, test_size=TEST_SIZE):
+    """R² / MAE over the per-shard hold-out rows, one shard at a time."""
+    n = sum_y = sum_y2 = sse = sae = 0.0
+    for i in range(len(dataset.shards)):
+        mask = dataset.holdout_mask(i, test_size)
+        if not mask.any():
+            continue
+        shard_x, shard_y = dataset.shard(i)
+        y = np.asarray(shard_y[mask])
+        pred = model.predict(pd.DataFrame(shard_x[mask], columns=dataset.columns))
+        n += len(y)
+        sum_y += y.sum()
+        sum_y2 += (y ** 2).sum()
+        sse += ((y - pred) ** 2).sum()
+        sae += np.abs(y - pred).sum()
+    total = sum_y2 - sum_y ** 2 / n
+    return {"r2": float(1 - sse / total), "mae_usd": float(sae / n)}
+
+
+def train_sharded(dataset, params=None, max_memory_mb=1024, verbose=True):
+    """(model, metrics, mode) trained from ``dataset`` within the budget."""
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    limit = budget_rows(dataset, max_memory_mb)
+
+    if dataset.n_rows <= limit:
+        X, y = dataset.load()
+        X_train, X_test, y_train, y_test = holdout_split(X, y)
+        model = fit_forest(X_train, y_train, params)
+        return model, evaluate(model, X_test, y_test), "in-memory"
+
+    # Each round grows its share of the trees on its own bounded sample.
+    n_train = dataset.n_rows * (1 - TEST_SIZE)
+    rounds = min(params["n_estimators"], math.ceil(n_train / limit))
+    per_round = np.diff(np.linspace(0, params["n_estimators"], rounds + 1).astype(int))
+    rng = np.random.default_rng(params.get("random_state"))
+
+    model = None
+    for k, n_trees in enumerate(per_round):
+        start = time.perf_counter()
+        X, y = dataset.sample(limit, rng)
+        if model is None:
+            model = fit_forest(X, y, dict(params, n_estimators=int(n_trees), warm_start=True))
+        else:
+            model.set_params(n_estimators=model.n_estimators + int(n_trees))
+            model.fit(X, y)
+        del X, y
+        if verbose:
+            print(f"  round {k + 1}/{rounds}: {model.n_estimators} trees "
+                  f"({time.perf_counter() - start:.1f}s)")
+    model.set_params(warm_start=False)
+    return model, evaluate_streaming(model, dataset), f"{rounds} rounds of {limit:,} rows"
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chunked ingestion and training.")
+    parser.add_argument("command", choices=["build", "train"])
+    parser.add_argument("data", nargs="?", default=DATA_PATH)
+    parser.add_argument("--cache-dir", default=INGEST_DIR)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--min-count", type=int, default=1,
+                        help="categories seen fewer times get no column")
+    parser.add_argument("--max-memory-mb", type=float, default=1024,
+                        help="budget for the training matrix held in memory")
+    parser.add_argument("--model-out", default=MODEL_PATH)
+    parser.add_argument("--columns-out", default=COLUMNS_PATH)
+    for name, default in DEFAULT_PARAMS.items():
+        parser.add_argument("--" + name.replace("_", "-"), type=int, default=default)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    directory = ingest(args.data, args.cache_dir, args.chunk_rows, args.min_count)
+    dataset = ShardedDataset(directory)
+    print(f"Ingested {dataset.n_rows:,} rows x {dataset.n_features:,} columns "
+          f"in {time.perf_counter() - start:.1f}s")
+    if args.command == "build":
+        print(f"Peak RSS {peak_rss_mb():,.0f} MB")
+        return
+
+    params = {name: getattr(args, name) for name in DEFAULT_PARAMS}
+    start = time.perf_counter()
+    model, metrics, mode = train_sharded(dataset, params, args.max_memory_mb)
+    print(f"Trained ({mode}) in {time.perf_counter() - start:.1f}s, "
+          f"peak RSS {peak_rss_mb():,.0f} MB")
+    joblib.dump(model, args.model_out)
+    joblib.dump(dataset.columns, args.columns_out)
+    print("FINAL R² Score:", metrics["r2"])
+    print("FINAL MAE (USD):", metrics["mae_usd"])
+
+
+if __name__ == "__main__":
+    main()
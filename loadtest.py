@@ -0,0 +1,109 @@
+"""
+Local load test for service.py.
+
+    python service.py &
+    python loadtest.py --concurrency 32 --duration 10
+    python loadtest.py --batch 256 --concurrency 4
+
+Sends random listings drawn from the app's catalogue and reports requests
+per second, listings per second and p50 / p99 latency.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import aiohttp
+import numpy as np
+
+from catalogue import (
+    COLORS,
+    FUEL_TYPES,
+    OWNERS,
+    brand_defaults,
+    brand_model_map,
+    transmissions_for,
+)
+from pricing import CURRENT_YEAR
+
+
+def random_listing(rng):
+    brand = rng.choice(list(brand_model_map))
+    defaults = brand_defaults[brand]
+    return {
+        "brand": brand,
+        "model": rng.choice(brand_model_map[brand]),
+        "year": rng.randint(2005, CURRENT_YEAR),
+        "km": rng.randrange(0, 200_000, 5_000),
+        "engine_cc": defaults["engine"],
+        "max_power": defaults["power"],
+        "fuel_tank": defaults["tank"],
+        "transmission": rng.choice(transmissions_for(brand)),
+        "fuel": rng.choice(FUEL_TYPES),
+        "owner": rng.choice(OWNERS),
+        "color": rng.choice(COLORS),
+    }
+
+
+async def worker(session, url, batch, deadline, rng, latencies, errors):
+    while time.perf_counter() < deadline:
+        if batch:
+            payload = {"listings": [random_listing(rng) for _ in range(batch)]}
+        else:
+            payload = random_listing(rng)
+        start = time.perf_counter()
+        try:
+            async with session.post(url, json=payload) as response:
+                await response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+                    continue
+        except aiohttp.ClientError as exc:
+            errors.append(type(exc).__name__)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(base_url, concurrency, duration, batch, seed):
+    url = base_url.rstrip("/") + ("/predict/batch" if batch else "/predict")
+    latencies, errors = [], []
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(
+            worker(session, url, batch, deadline, random.Random(seed + i), latencies, errors)
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the prediction service.")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--batch", type=int, default=0,
+                        help="listings per request (0 = single /predict calls)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    latencies, errors, elapsed = asyncio.run(
+        run(args.url, args.concurrency, args.duration, args.batch, args.seed)
+    )
+    if not latencies:
+        print(f"No successful requests ({len(errors)} errors)")
+        return
+
+    ms = np.array(latencies) * 1e3
+    rps = len(latencies) / elapsed
+    print(f"Requests:  {len(latencies):,} ok, {len(errors):,} errors in {elapsed:.1f}s")
+    print(f"RPS:       {rps:,.0f}")
+    print(f"Listings/s {rps * max(args.batch, 1):,.0f}")
+    print(f"Latency:   p50 {np.percentile(ms, 50):.1f} ms, "
+          f"p99 {np.percentile(ms, 99):.1f} ms, max {ms.max():.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+Latency histograms and counters for the prediction path.
+
+The app and the service time each stage of a prediction:
+
+    from metrics import metrics
+    with metrics.timed("encode"):
+        row, unknown = encoder.encode_one(listing)
+    metrics.inc("predictions_total", source="forest")
+
+Stages are load, encode, infer, calibrate and render (app) plus a
+per-endpoint request histogram (service). A timed block costs a bisect
+and a short lock, a few microseconds, so instrumentation stays on.
+
+``render()`` returns everything in the Prometheus text format, together
+with gauges read at scrape time: prediction-cache hit rate, artifact load
+times, micro-batcher queue and the serving model / calibration versions.
+The service exposes it on ``GET /metrics``. The Streamlit app starts an
+exporter from ``start_exporters()``:
+
+* CAR_PRICE_METRICS_PORT         - serve /metrics on this port;
+* CAR_PRICE_METRICS_HOST         - address to bind it to (default 127.0.0.1,
+                                   0.0.0.0 to let other hosts scrape);
+* CAR_PRICE_METRICS_LOG_SECONDS  - log a one-line summary this often.
+
+Only the standard library is imported here; the gauges look at modules
+that are already loaded and never import the model stack themselves.
+"""
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = "car_price"
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+METRICS_PORT = int(os.environ.get("CAR_PRICE_METRICS_PORT", 0))
+METRICS_HOST = os.environ.get("CAR_PRICE_METRICS_HOST", "127.0.0.1")
+LOG_SECONDS = float(os.environ.get("CAR_PRICE_METRICS_LOG_SECONDS", 0))
+
+HELP = {
+    "stage_seconds": "Time spent in each stage of the prediction path.",
+    "request_seconds": "HTTP request latency by endpoint.",
+    "predictions_total": "Predictions computed, by where the raw price came from.",
+    "errors_total": "Failed predictions by stage.",
+}
+
+logger = logging.getLogger("car_price.metrics")
+
+
+class Histogram:
+    """Fixed-bucket histogram; ``counts[i]`` holds values <= ``buckets[i]``
+    not counted in an earlier bucket, the last slot everything above."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th value (inf if above all)."""
+        counts, _, count = self.snapshot()
+        if not count:
+            return 0.0
+        rank, seen = q * count, 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Named histograms and counters, each keyed by a set of labels."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.started = time.time()
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    # ----------------------------------------------
+    # Recording
+    # ----------------------------------------------
+    def histogram(self, name, **labels):
+        key = (name, _labels(labels))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(self.buckets))
+        return histogram
+
+    def observe(self, name, seconds, **labels):
+        self.histogram(name, **labels).observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def timed(self, stage, name="stage_seconds", **labels):
+        """Record the block's duration under ``name{stage=...}``; failures
+        are counted in ``errors_total`` and re-raised."""
+        histogram = self.histogram(name, stage=stage, **labels)
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc("errors_total", stage=stage)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    # ----------------------------------------------
+    # Exposition
+    # ----------------------------------------------
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        emitted = set()
+
+        def header(name, kind):
+            if name not in emitted:
+                emitted.add(name)
+                if name in HELP:
+                    lines.append(f"# HELP {PREFIX}_{name} {HELP[name]}")
+                lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, n in zip(histogram.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = _format_value(float(bound))
+                lines.append(f"{PREFIX}_{name}_bucket"
+                             f"{_format_labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{PREFIX}_{name}_sum{_format_labels(labels)} {total!r}")
+            lines.append(f"{PREFIX}_{name}_count{_format_labels(labels)} {count}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{PREFIX}_{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for name, kind, help_text, samples in collect_gauges():
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{PREFIX}_{name}{_format_labels(_labels(labels))} "
+                             f"{_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """One log line: count / p50 / p99 per stage and the cache hit rate."""
+        parts = []
+        with self._lock:
+            stages = sorted((labels, h) for (name, labels), h in self._histograms.items()
+                            if name == "stage_seconds")
+        for labels, histogram in stages:
+            stage = dict(labels).get("stage")
+            parts.append(f"{stage} n={histogram.count} "
+                         f"p50<={histogram.quantile(0.5) * 1e3:g}ms "
+                         f"p99<={histogram.quantile(0.99) * 1e3:g}ms")
+        cache = sys.modules.get("prediction_cache")
+        if cache is not None:
+            parts.append(f"cache hit rate {cache.predictions.stats()['hit_rate']:.1%}")
+        return "; ".join(parts) or "no predictions yet"
+
+
+metrics = Metrics()
+
+
+# ==================================================
+# Scrape-time gauges
+# ==================================================
+def collect_gauges():
+    """[(name, type, help, [(labels, value)])] from already-loaded modules."""
+    gauges = [("uptime_seconds", "gauge", "Seconds since the metrics were created.",
+               [({}, time.time() - metrics.started)])]
+
+    cache = sys.modules.get("prediction_cache")
+    if cache is not None:
+        stats = cache.predictions.stats()
+        gauges += [
+            ("cache_hits_total", "counter", "Prediction cache hits.",
+             [({}, stats["hits"])]),
+            ("cache_misses_total", "counter", "Prediction cache misses.",
+             [({}, stats["misses"])]),
+            ("cache_hit_ratio", "gauge", "Prediction cache hit rate.",
+             [({}, stats["hit_rate"])]),
+            ("cache_entries", "gauge", "Entries in the prediction cache.",
+             [({}, stats["size"])]),
+        ]
+
+    artifacts = []
+    registry = sys.modules.get("model_registry")
+    if registry is not None:
+        artifacts += registry.registry.stats()
+    forest = sys.modules.get("forest")
+    if forest is not None:
+        artifacts += forest.flat_models.stats()
+    if artifacts:
+        gauges.append((
+            "artifact_load_seconds", "gauge", "Load time of each loaded artifact.",
+            [({"file": os.path.basename(a["path"]), "version": a["version"]},
+              a["load_seconds"]) for a in artifacts],
+        ))
+
+    if forest is not None:
+        info = {"model_version": forest.serving_version()}
+        calibration = sys.modules.get("calibration")
+        if calibration is not None:
+            info["calibration_version"] = calibration.calibration_version()
+        gauges.append(("model_info", "gauge", "Versions currently served.", [(info, 1)]))
+
+    batching = sys.modules.get("batching")
+    if batching is not None and batching._batcher is not None:
+        gauges += batcher_gauges(batching._batcher)
+
+    segments = sys.modules.get("segments")
+    if segments is not None and segments._router is not None:
+        stats = segments._router.stats()
+        gauges += [
+            ("segment_loaded_bytes", "gauge", "Bytes of segment forests currently loaded.",
+             [({}, stats["loaded_bytes"])]),
+            ("segment_evictions_total", "counter", "Segment forests evicted for memory.",
+             [({}, stats["evictions"])]),
+            ("segment_rows_total", "counter", "Rows priced per segment.",
+             [({"segment": name}, rows) for name, rows in sorted(stats["rows"].items())]),
+        ]
+
+    warmup = sys.modules.get("warmup")
+    if warmup is not None and warmup.status()["seconds"] is not None:
+        gauges.append(("warmup_seconds", "gauge", "Background model warm-up time.",
+                       [({}, warmup.status()["seconds"])]))
+    return gauges
+
+
+def batcher_gauges(batcher):
+    stats = batcher.stats()
+    return [
+        ("batch_queue_depth", "gauge", "Requests waiting for the micro-batcher.",
+         [({}, stats["queue_depth"])]),
+        ("batch_mean_rows", "gauge", "Mean rows per forest batch.",
+         [({}, stats["mean_batch_rows"])]),
+        ("batch_rejected_total", "counter", "Requests refused on a full queue.",
+         [({}, stats["rejected"])]),
+    ]
+
+
+# ==================================================
+# Exporters
+# ==================================================
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def serve(port, host=METRICS_HOST):
+    """Serve ``render()`` on http://host:port/metrics from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http",
+                     daemon=True).start()
+    return server
+
+
+def log_periodically(interval):
+    """Log ``summary()`` every ``interval`` seconds from a daemon thread."""
+    def run():
+        while True:
+            time.sleep(interval)
+            logger.info("prediction metrics: %s", metrics.summary())
+
+    thread = threading.Thread(target=run, name="metrics-log", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_exporters(port=METRICS_PORT, log_seconds=LOG_SECONDS, host=METRICS_HOST):
+    """Start the configured exporters once per process (Streamlit reruns)."""
+    with _exporters_lock:
+        if port and "http" not in _exporters:
+            try:
+                _exporters["http"] = serve(port, host)
+            except OSError as exc:
+                # Another app process on this host already serves the port.
+                logger.warning("metrics port %s unavailable: %s", port, exc)
+                _exporters["http"] = None
+        if log_seconds and "log" not in _exporters:
+            _exporters["log"] = log_periodically(log_seconds)
@@ -0,0 +1,213 @@
+"""
+Process-wide registry for the pickled model artifacts.
+
+Streamlit re-executes app.py on every widget change, but imported modules stay
+in ``sys.modules``. Anything held by the registry below is therefore loaded
+once per process and shared (read-only) by every session. An artifact is only
+reloaded when its file on disk changes.
+"""
+import hashlib
+import os
+import sys
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODEL_PATH = os.environ.get(
+    "CAR_PRICE_MODEL_PATH", os.path.join(BASE_DIR, "car_price_model.pkl")
+)
+COLUMNS_PATH = os.environ.get(
+    "CAR_PRICE_COLUMNS_PATH", os.path.join(BASE_DIR, "model_columns.pkl")
+)
+
+
+# ==================================================
+# Memory helpers
+# ==================================================
+def rss_bytes():
+    """Current resident set size of this process (0 if unknown)."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return 0
+
+
+def estimate_nbytes(obj):
+    """Rough in-memory size of a loaded artifact.
+
+    Forests are measured through their node and value arrays, which is
+    where practically all of their memory lives.
+    """
+    estimators = getattr(obj, "estimators_", None)
+    if estimators is not None:
+        total = 0
+        for tree in estimators:
+            state = tree.tree_.__getstate__()
+            total += state["nodes"].nbytes + state["values"].nbytes
+        return total
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(sys.getsizeof(item) for item in obj)
+    nbytes = getattr(obj, "nbytes", None)
+    if nbytes is not None:
+        return int(nbytes)
+    return sys.getsizeof(obj)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def joblib_load(path):
+    import joblib  # deferred: unpickling is the slow part of a cold start anyway
+
+    return joblib.load(path)
+
+
+# ==================================================
+# Registry
+# ==================================================
+class Artifact:
+    """A loaded artifact plus what is known about where it came from."""
+
+    def __init__(self, path, value, stat, digest, load_seconds, rss_delta):
+        self.path = path
+        self.value = value
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.digest = digest
+        self.load_seconds = load_seconds
+        self.rss_delta_bytes = rss_delta
+        self.nbytes = estimate_nbytes(value)
+        self.loaded_at = time.time()
+
+    @property
+    def version(self):
+        """Short content hash, stable across touches of the same file."""
+        return self.digest[:12]
+
+    def as_dict(self):
+        return {
+            "path": self.path,
+            "version": self.version,
+            "file_bytes": self.size,
+            "load_seconds": round(self.load_seconds, 4),
+            "rss_delta_bytes": self.rss_delta_bytes,
+            "nbytes": self.nbytes,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class ModelRegistry:
+    """Loads each artifact once and hands the same object to every caller.
+
+    ``get`` is cheap on the hot path: a single ``os.stat``. When mtime or size
+    change the file is hashed, and only a different hash triggers a reload.
+    """
+
+    def __init__(self, loader=joblib_load):
+        self._loader = loader
+        self._artifacts = {}
+        self._fingerprints = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, path):
+        with self._guard:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def artifact(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        current = self._artifacts.get(path)
+        if current is not None and (current.mtime_ns, current.size) == (
+            stat.st_mtime_ns, stat.st_size
+        ):
+            return current
+
+        # Only one session pays for the (re)load; the others wait for it.
+        with self._lock_for(path):
+            current = self._artifacts.get(path)
+            stat = os.stat(path)
+            if current is not None and (current.mtime_ns, current.size) == (
+                stat.st_mtime_ns, stat.st_size
+            ):
+                return current
+
+            digest = file_digest(path)
+            if current is not None and current.digest == digest:
+                current.mtime_ns, current.size = stat.st_mtime_ns, stat.st_size
+                return current
+
+            rss_before = rss_bytes()
+            start = time.perf_counter()
+            value = self._loader(path)
+            elapsed = time.perf_counter() - start
+            loaded = Artifact(
+                path, value, stat, digest, elapsed, rss_bytes() - rss_before
+            )
+            self._artifacts[path] = loaded
+            return loaded
+
+    def get(self, path):
+        return self.artifact(path).value
+
+    def version(self, path):
+        """Content version of ``path`` without loading it.
+
+        Matches ``artifact(path).version``; the file is only re-hashed when
+        its mtime or size change.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        loaded = self._artifacts.get(path)
+        if loaded is not None and (loaded.mtime_ns, loaded.size) == (
+            stat.st_mtime_ns, stat.st_size
+        ):
+            return loaded.version
+        known = self._fingerprints.get(path)
+        if known is None or known[0] != (stat.st_mtime_ns, stat.st_size):
+            known = ((stat.st_mtime_ns, stat.st_size), file_digest(path)[:12])
+            self._fingerprints[path] = known
+        return known[1]
+
+    def evict(self, path):
+        self._artifacts.pop(os.path.abspath(path), None)
+
+    def stats(self):
+        return [a.as_dict() for a in list(self._artifacts.values())]
+
+
+registry = ModelRegistry()
+
+
+def load_model():
+    return registry.get(MODEL_PATH)
+
+
+def load_model_columns():
+    return registry.get(COLUMNS_PATH)
+
+
+def model_version():
+    return registry.version(MODEL_PATH)
+
+
+if __name__ == "__main__":
+    import json
+
+    load_model()
+    load_model_columns()
+    print(json.dumps(registry.stats(), indent=2))
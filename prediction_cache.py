@@ -0,0 +1,98 @@
+"""
+Bounded LRU + TTL cache of calibrated predictions.
+
+The cache lives at module level, so like the model registry it is shared by
+every Streamlit session in the process. Keys are the canonicalised listing
+fields; entries are tied to a model version and the whole cache is dropped
+as soon as a different version is seen.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from encoder import CATEGORICAL_FIELDS, NUMERIC_FIELDS, normalize_category
+
+DEFAULT_MAXSIZE = 4096
+DEFAULT_TTL = 60 * 60
+
+
+def canonical_key(listing, current_year=None):
+    """Hashable, order-independent key for a listing dict."""
+    numeric = tuple(float(listing.get(field, 0)) for field in NUMERIC_FIELDS)
+    categories = tuple(
+        normalize_category(listing.get(field, "")) for field in CATEGORICAL_FIELDS
+    )
+    return numeric + categories + (current_year,)
+
+
+class PredictionCache:
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _sync_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key, version=None):
+        with self._lock:
+            self._sync_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, version=None):
+        with self._lock:
+            self._sync_version(version)
+            self._entries[key] = (self._clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute, version=None):
+        """Cached value for ``key``; ``compute()`` runs outside the lock on a miss."""
+        value = self.get(key, version)
+        if value is None:
+            value = compute()
+            self.put(key, value, version)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "model_version": self._version,
+            }
+
+
+predictions = PredictionCache()
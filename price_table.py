@@ -0,0 +1,342 @@
+"""
+Precomputed price surface for the popular part of the UI's input grid.
+
+The offline job evaluates the forest once over a grid of configurations and
+stores the raw per-cell forest mean and price band (low, high; see
+pricing.predict_interval) in a memory-mapped float32 array:
+
+    python price_table.py build
+
+A segment is one combination of brand, model, transmission, fuel, owner and
+colour for the ``POPULAR_MODELS`` most listed variants of the catalogue,
+with max power and fuel tank fixed at the variant's defaults. Each
+segment covers every manufacturing year, km in steps of 5,000 and engine
+sizes around the variant's default in steps of 100 cc. A lookup that lands in a
+segment is answered by (multi)linear interpolation of the stored cells.
+Anything else returns None and the caller falls back to the live forest.
+
+Depreciation and price caps are applied after the lookup, exactly as for
+live predictions. The km tiers and engine caps are step functions, so
+interpolating already calibrated prices across them would be wrong.
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+
+from catalogue import (
+    COLORS,
+    ENGINE_RANGE,
+    FUEL_TYPES,
+    KM_RANGE,
+    MIN_YEAR,
+    OWNERS,
+    catalogue,
+    transmissions_for,
+)
+from calibration import calibration_version
+from encoder import get_encoder, normalize_category
+from forest import get_forest, serving_version
+from model_registry import BASE_DIR, ModelRegistry, load_model_columns
+from pricing import CURRENT_YEAR, calibrate, interval_spec, predict_interval
+
+TABLE_PATH = os.environ.get(
+    "CAR_PRICE_TABLE_PATH", os.path.join(BASE_DIR, "price_table.json")
+)
+
+POPULAR_MODELS = 40
+POPULAR_FUELS = FUEL_TYPES[:2]
+POPULAR_OWNERS = OWNERS[:1]
+POPULAR_COLORS = COLORS[:1]
+ENGINE_STEPS = 2            # variant default engine ± this many 100 cc steps
+
+SEGMENT_FIELDS = ("brand", "model", "transmission", "fuel", "owner", "color")
+
+
+def segment_key(listing):
+    return tuple(normalize_category(listing[f]) for f in SEGMENT_FIELDS) + (
+        float(listing["max_power"]),
+        float(listing["fuel_tank"]),
+    )
+
+
+def _axis_position(value, start, step, size):
+    """(lower index, weight of the upper neighbour) or None if off-axis."""
+    offset = (value - start) / step
+    if offset < 0 or offset > size - 1:
+        return None
+    low = min(int(offset), size - 2) if size > 1 else 0
+    return low, offset - low
+
+
+class PriceTable:
+    """Memory-mapped (segment, year, km, engine, [mean, low, high]) float32 array."""
+
+    def __init__(self, header, values):
+        self.header = header
+        self.values = values
+        self.segments = {
+            tuple(seg["key"]): (i, seg["engine_start"])
+            for i, seg in enumerate(header["segments"])
+        }
+        self.year_start, self.n_years = header["year_start"], header["n_years"]
+        self.km_start, self.km_step, self.n_km = (
+            header["km_start"], header["km_step"], header["n_km"]
+        )
+        self.engine_step, self.n_engine = header["engine_step"], header["n_engine"]
+
+    @property
+    def model_version(self):
+        return self.header["model_version"]
+
+    @property
+    def interval(self):
+        interval = self.header.get("interval")
+        return None if interval is None else (interval["method"], interval["levels"])
+
+    @classmethod
+    def load(cls, path=TABLE_PATH):
+        with open(path) as fh:
+            header = json.load(fh)
+        values_path = os.path.join(os.path.dirname(path), header["values_file"])
+        values = np.load(values_path, mmap_mode="r")
+        return cls(header, values)
+
+    def lookup(self, listing):
+        """Interpolated raw forest (mean, low, high) for a listing, or None."""
+        hit = self.segments.get(segment_key(listing))
+        if hit is None:
+            return None
+        segment, engine_start = hit
+
+        axes = (
+            _axis_position(float(listing["year"]), self.year_start, 1, self.n_years),
+            _axis_position(float(listing["km"]), self.km_start, self.km_step, self.n_km),
+            _axis_position(
+                float(listing["engine_cc"]), engine_start, self.engine_step, self.n_engine
+            ),
+        )
+        if any(axis is None for axis in axes):
+            return None
+
+        (y, wy), (k, wk), (e, we) = axes
+        block = self.values[segment, y:y + 2, k:k + 2, e:e + 2]
+        # Trilinear interpolation; corners with zero weight drop out.
+        wy = np.array([1 - wy, wy])[:block.shape[0]]
+        wk = np.array([1 - wk, wk])[:block.shape[1]]
+        we = np.array([1 - we, we])[:block.shape[2]]
+        weights = wy[:, None, None] * wk[None, :, None] * we[None, None, :]
+        mean, low, high = np.tensordot(weights, block, axes=3)
+        return float(mean), float(low), float(high)
+
+
+tables = ModelRegistry(loader=PriceTable.load)
+# (key, table or None) of the last staleness check
+_served = (None, None)
+
+
+def get_price_table(path=TABLE_PATH, version=None):
+    """The table for the current model and price band, or None if missing
+    or stale.
+
+    ``version`` is the caller's "serving:calibration" version when it has
+    one already (the app keys its prediction cache on it). The model and
+    price band are only compared again when it or the table file changes.
+    """
+    global _served
+    if not os.path.exists(path):
+        return None
+    if version is None:
+        version = f"{serving_version()}:{calibration_version()}"
+    key = (os.path.abspath(path), tables.version(path), version)
+    served_key, table = _served
+    if key == served_key:
+        return table
+
+    table = tables.get(path)
+    if (table.model_version != serving_version()
+            or table.interval != interval_spec(get_forest())):
+        table = None
+    _served = (key, table)
+    return table
+
+
+# ==================================================
+# Offline build
+# ==================================================
+def iter_segments(fuels=POPULAR_FUELS, owners=POPULAR_OWNERS, colors=POPULAR_COLORS,
+                  models=POPULAR_MODELS):
+    for brand, model_name in catalogue.popular(models):
+        defaults = catalogue.defaults(brand, model_name)
+        for transmission, fuel, owner, color in itertools.product(
+            transmissions_for(brand), fuels, owners, colors
+        ):
+            yield {
+                "brand": brand,
+                "model": model_name,
+                "transmission": transmission,
+                "fuel": fuel,
+                "owner": owner,
+                "color": color,
+                "max_power": defaults["power"],
+                "fuel_tank": defaults["tank"],
+            }, defaults["engine"]
+
+
+def engine_axis_start(default_engine, steps=ENGINE_STEPS):
+    low, high, step = ENGINE_RANGE
+    start = default_engine - steps * step
+    return int(min(max(start, low), high - 2 * steps * step))
+
+
+def build(path=TABLE_PATH, fuels=POPULAR_FUELS, owners=POPULAR_OWNERS,
+          colors=POPULAR_COLORS, engine_steps=ENGINE_STEPS, current_year=CURRENT_YEAR):
+    forest = get_forest()
+    encoder = get_encoder(load_model_columns())
+    pos = encoder.numeric_positions
+
+    years = np.arange(MIN_YEAR, current_year + 1)
+    km_start, km_stop, km_step = KM_RANGE
+    kms = np.arange(km_start, km_stop + 1, km_step)
+    n_engine = 2 * engine_steps + 1
+    engine_step = ENGINE_RANGE[2]
+
+    segments = list(iter_segments(fuels, owners, colors))
+    values_file = os.path.splitext(os.path.basename(path))[0] + ".npy"
+    values_path = os.path.join(os.path.dirname(path), values_file)
+    values = np.lib.format.open_memmap(
+        values_path, mode="w+", dtype=np.float32,
+        shape=(len(segments), len(years), len(kms), n_engine, 3),
+    )
+
+    start = time.perf_counter()
+    header_segments = []
+    for i, (fields, default_engine) in enumerate(segments):
+        engine_start = engine_axis_start(default_engine, engine_steps)
+        engines = engine_start + engine_step * np.arange(n_engine)
+        base, _ = encoder.encode_one(dict(fields, year=0, km=0, engine_cc=0))
+
+        grid = np.stack(np.meshgrid(years, kms, engines, indexing="ij"), -1).reshape(-1, 3)
+        X = np.repeat(base, len(grid), axis=0)
+        X[:, pos["year"]] = grid[:, 0]
+        X[:, pos["km"]] = grid[:, 1]
+        X[:, pos["engine_cc"]] = grid[:, 2]
+
+        stats = predict_interval(forest, X)
+        values[i] = np.stack(
+            [stats["mean"], stats["low"], stats["high"]], -1
+        ).reshape(values.shape[1:])
+        header_segments.append({
+            "key": list(segment_key(fields)),
+            "engine_start": engine_start,
+        })
+    values.flush()
+    build_seconds = time.perf_counter() - start
+
+    method, levels = interval_spec(forest)
+    header = {
+        "model_version": serving_version(),
+        "interval": {"method": method, "levels": levels},
+        "values_file": values_file,
+        "year_start": int(years[0]),
+        "n_years": len(years),
+        "km_start": int(kms[0]),
+        "km_step": km_step,
+        "n_km": len(kms),
+        "engine_step": engine_step,
+        "n_engine": n_engine,
+        "segments": header_segments,
+        "build_seconds": round(build_seconds, 2),
+        "cells": int(np.prod(values.shape[:-1])),
+        "bytes": int(values.nbytes),
+    }
+    # The header is written last: it is what the app watches for changes.
+    with open(path, "w") as fh:
+        json.dump(header, fh)
+    return header
+
+
+def interpolation_error(table, n=2000, seed=0, current_year=CURRENT_YEAR):
+    """Calibrated mean from the table vs the live forest at random off-grid points."""
+    rng = np.random.default_rng(seed)
+    forest = get_forest()
+    encoder = get_encoder(load_model_columns())
+    segments = table.header["segments"]
+
+    listings, rows = [], []
+    for _ in range(n):
+        seg = segments[rng.integers(len(segments))]
+        brand, model_name, transmission, fuel, owner, color, power, tank = seg["key"]
+        engine_span = table.engine_step * (table.n_engine - 1)
+        listing = {
+            "brand": brand, "model": model_name, "transmission": transmission,
+            "fuel": fuel, "owner": owner, "color": color,
+            "max_power": power, "fuel_tank": tank,
+            "year": int(rng.integers(table.year_start, table.year_start + table.n_years)),
+            "km": float(rng.uniform(0, table.km_step * (table.n_km - 1))),
+            "engine_cc": float(seg["engine_start"] + rng.uniform(0, engine_span)),
+        }
+        listings.append(listing)
+        rows.append(encoder.encode_one(listing)[0][0])
+
+    stats = predict_interval(forest, np.array(rows))
+    looked_up = np.array([table.lookup(listing) for listing in listings])
+    args = (
+        [l["brand"] for l in listings], [l["year"] for l in listings],
+        [l["km"] for l in listings], [l["engine_cc"] for l in listings], current_year,
+    )
+    live = calibrate(stats["mean"], stats["low"], stats["high"], *args)[0]
+    approx = calibrate(looked_up[:, 0], looked_up[:, 1], looked_up[:, 2], *args)[0]
+
+    error = np.abs(approx - live)
+    raw_error = np.abs(looked_up[:, 0] - stats["mean"]) / np.maximum(stats["mean"], 1)
+    return {
+        "points": n,
+        "raw_mean_rel": float(raw_error.mean()),
+        "mae_usd": float(error.mean()),
+        "p99_abs_usd": float(np.percentile(error, 99)),
+        "max_abs_usd": float(error.max()),
+        "mean_rel": float((error / np.maximum(live, 1)).mean()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the precomputed price table.")
+    parser.add_argument("command", choices=["build", "check"])
+    parser.add_argument("--path", default=TABLE_PATH)
+    parser.add_argument("--fuels", nargs="+", default=POPULAR_FUELS)
+    parser.add_argument("--owners", nargs="+", default=POPULAR_OWNERS)
+    parser.add_argument("--colors", nargs="+", default=POPULAR_COLORS)
+    parser.add_argument("--engine-steps", type=int, default=ENGINE_STEPS)
+    parser.add_argument("--samples", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        header = build(args.path, args.fuels, args.owners, args.colors, args.engine_steps)
+        print(f"Segments:   {len(header['segments'])}")
+        print(f"Cells:      {header['cells']:,}")
+        print(f"Table size: {header['bytes'] / 1e6:.1f} MB")
+        print(f"Build time: {header['build_seconds']:.1f}s")
+
+    table = PriceTable.load(args.path)
+    error = interpolation_error(table, n=args.samples)
+    print(
+        f"Interpolation error over {error['points']} off-grid points: "
+        f"MAE ${error['mae_usd']:,.0f}, p99 ${error['p99_abs_usd']:,.0f}, "
+        f"max ${error['max_abs_usd']:,.0f} ({error['mean_rel']:.2%} mean relative)"
+    )
+    print(f"Raw forest mean, before calibration: {error['raw_mean_rel']:.2%} mean relative")
+
+    segment, default_engine = next(iter_segments())
+    listing = dict(segment, year=2018, km=52_500, engine_cc=default_engine - 50)
+    start = time.perf_counter()
+    for _ in range(1000):
+        table.lookup(listing)
+    print(f"Lookup: {(time.perf_counter() - start) * 1e3:.1f} µs per call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Pricing rules shared by the Streamlit UI and the batch tools.
+
+Everything here works on NumPy arrays, so one call calibrates a single
+prediction or a whole inventory. The rule values themselves (depreciation,
+km tiers, price caps, floors) are in calibration.json; see calibration.py.
+"""
+from datetime import datetime
+
+from calibration import Calibrator, get_calibrator
+
+CURRENT_YEAR = datetime.now().year
+
+LUXURY_BRANDS = Calibrator.load().luxury_brands
+
+
+def interval_spec(forest):
+    """(method, levels) of the price band served for ``forest``.
+
+    "qrf" needs leaf quantiles from the flat export; a forest compiled
+    straight from the pickle falls back to per-tree quantiles.
+    """
+    calibrator = get_calibrator()
+    method, levels = calibrator.interval_method, calibrator.interval_levels
+    if method == "qrf" and not forest.has_leaf_quantiles(levels):
+        method = "trees"
+    return method, levels
+
+
+def predict_interval(forest, X):
+    """Raw forest mean, std, low and high per row for the configured band."""
+    method, levels = interval_spec(forest)
+    return forest.predict_interval(X, method, levels)
+
+
+def calibrate(mean, low, high, brand, year, km, engine_cc, current_year=CURRENT_YEAR):
+    """Raw forest mean and band -> calibrated (mean, lower, upper) USD prices."""
+    return get_calibrator().apply(mean, low, high, brand, year, km, engine_cc, current_year)
+
+
+def is_unrealistic(brand, engine_cc):
+    """Inputs the UI refuses to price (tiny engines on luxury brands)."""
+    return get_calibrator().is_unrealistic(brand, engine_cc)
@@ -0,0 +1,384 @@
+"""
+Per-segment forests behind the same serving interface as the global one.
+
+    python segments.py build                 # train + export one forest per segment
+    python segments.py build --trees 100 --min-rows 150
+    python segments.py show                  # manifest, hold-out and latency report
+
+Segments follow the calibration rules: luxury brands (``luxury_brands``)
+form one segment and every other listing goes to its ``engine_caps`` tier
+(<= 1200 cc, <= 2000 cc, <= 3500 cc, above). Each segment with enough
+training rows gets its own smaller forest, exported in the flat format with
+leaf quantiles under segments/, next to a manifest.json. A segment forest is
+only served if it beats the global model on the segment's hold-out rows;
+segments that are too small or not more accurate stay on the global model,
+with the reason recorded in the manifest.
+
+Routing is done on the encoded row (the engine_cc column and the Make_*
+one-hot columns), so every caller that already holds X - the micro-batcher,
+batch valuation, the price table - is routed without changes: once a
+manifest matching the current model_columns exists, ``forest.get_forest()``
+returns a ``SegmentedForest``. A row with no Make column set is routed as
+``reference_brand``, the make training dropped as the reference category:
+to the luxury segment when that make is a luxury brand (Audi in the bundled
+data). A make the model does not know encodes the same way and goes with it.
+
+Segment forests are memory-mapped on first use and the least recently used
+ones are dropped once the loaded files exceed CAR_PRICE_SEGMENT_BUDGET_MB.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from forest import FlatForest, load_flat, save_flat
+from model_registry import BASE_DIR, COLUMNS_PATH, ModelRegistry, file_digest, registry
+
+SEGMENTS_DIR = os.path.join(BASE_DIR, "segments")
+SEGMENTS_PATH = os.environ.get(
+    "CAR_PRICE_SEGMENTS_PATH", os.path.join(SEGMENTS_DIR, "manifest.json")
+)
+MEMORY_BUDGET_MB = float(os.environ.get("CAR_PRICE_SEGMENT_BUDGET_MB", 256))
+DEFAULT_TREES = 100
+MIN_SEGMENT_ROWS = 150
+LUXURY = "luxury"
+
+
+# ==================================================
+# Segments
+# ==================================================
+def segment_names(engine_thresholds):
+    tiers = [f"engine-{int(t)}" for t in engine_thresholds]
+    return [LUXURY] + tiers + [f"engine-over-{int(engine_thresholds[-1])}"]
+
+
+def reference_brand(makes, columns):
+    """The make get_dummies(drop_first=True) dropped: the first one, in
+    sorted order, without a Make column. Its rows encode with no Make
+    column set."""
+    columns = set(columns)
+    return next(m for m in sorted(set(makes)) if f"Make_{m}" not in columns)
+
+
+def routing_spec(columns, calibrator, reference_brand):
+    """What ``route`` needs to know about the encoded columns."""
+    from encoder import normalize_category
+
+    positions = {column: i for i, column in enumerate(columns)}
+    # Calibration spells brands "BMW"; the columns are title-cased ("Make_Bmw")
+    luxury = [normalize_category(b) for b in calibrator.luxury_brands]
+    return {
+        "engine_column": positions["engine_cc"],
+        "engine_thresholds": [float(t) for t in calibrator.engine_thresholds],
+        "luxury_columns": [positions[f"Make_{b}"] for b in luxury
+                           if f"Make_{b}" in positions],
+        "make_columns": [i for c, i in positions.items() if c.startswith("Make_")],
+        "reference_brand": reference_brand,
+        "reference_is_luxury": normalize_category(reference_brand) in luxury,
+    }
+
+
+def route(X, spec):
+    """Segment index per row of the encoded matrix (see ``segment_names``)."""
+    X = np.asarray(X)
+    luxury = X[:, spec["luxury_columns"]].any(axis=1)
+    if spec["reference_is_luxury"]:
+        luxury |= ~X[:, spec["make_columns"]].any(axis=1)
+    tier = np.searchsorted(spec["engine_thresholds"], X[:, spec["engine_column"]])
+    return np.where(luxury, 0, 1 + tier)
+
+
+# ==================================================
+# Serving
+# ==================================================
+class SegmentedForest:
+    """Routes rows to their segment's flat forest, the rest to ``fallback``.
+
+    Offers the parts of the FlatForest interface the serving path uses
+    (``predict_interval``, ``predict``, ``has_leaf_quantiles``).
+    """
+
+    def __init__(self, manifest, fallback, directory, budget_bytes=MEMORY_BUDGET_MB * 1e6):
+        self.manifest = manifest
+        self.version = manifest["version"]
+        self.fallback = fallback
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self.spec = manifest["routing"]
+        self.names = segment_names(self.spec["engine_thresholds"])
+        self.segments = manifest["segments"]
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"loads": 0, "evictions": 0, "rows": {}}
+
+    def forest_for(self, name):
+        """The segment's forest (loaded on demand) or the fallback."""
+        info = self.segments.get(name)
+        if info is None:
+            return self.fallback
+        with self._lock:
+            forest = self._loaded.get(name)
+            if forest is not None:
+                self._loaded.move_to_end(name)
+                return forest
+            forest = load_flat(os.path.join(self.directory, info["file"]))
+            self._loaded[name] = forest
+            self._counters["loads"] += 1
+            # Least recently used first; the segment just loaded always stays.
+            while len(self._loaded) > 1 and self.loaded_bytes() > self.budget_bytes:
+                self._loaded.popitem(last=False)
+                self._counters["evictions"] += 1
+            return forest
+
+    def loaded_bytes(self):
+        return sum(self.segments[name]["bytes"] for name in self._loaded)
+
+    def predict_interval(self, X, method="std", levels=(10, 90)):
+        X = np.asarray(X, dtype=np.float32)
+        codes = route(X, self.spec)
+        if len(X) and (codes == codes[0]).all():
+            # Common case (single rows, homogeneous batches): no scatter.
+            return self._predict_segment(self.names[codes[0]], X, method, levels)
+
+        out = {key: np.empty(len(X)) for key in ("mean", "std", "low", "high")}
+        for code in np.unique(codes):
+            rows = np.flatnonzero(codes == code)
+            part = self._predict_segment(self.names[code], X[rows], method, levels)
+            for key in out:
+                out[key][rows] = part[key]
+        return out
+
+    def _predict_segment(self, name, X, method, levels):
+        with self._lock:
+            rows = self._counters["rows"]
+            rows[name] = rows.get(name, 0) + len(X)
+        return self.forest_for(name).predict_interval(X, method, levels)
+
+    def predict(self, X):
+        return self.predict_interval(X)["mean"]
+
+    def has_leaf_quantiles(self, levels):
+        levels = [float(level) for level in levels]
+        return self.fallback.has_leaf_quantiles(levels) and all(
+            all(level in info["quantile_levels"] for level in levels)
+            for info in self.segments.values()
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "loaded": list(self._loaded),
+                "loaded_bytes": self.loaded_bytes(),
+                "budget_bytes": self.budget_bytes,
+                "loads": self._counters["loads"],
+                "evictions": self._counters["evictions"],
+                "rows": dict(self._counters["rows"]),
+            }
+
+
+def load_manifest(path):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+manifests = ModelRegistry(loader=load_manifest)
+_router = None
+_router_lock = threading.Lock()
+
+
+def is_current(path=SEGMENTS_PATH):
+    """True if segment models exist and were built for the current columns."""
+    return (os.path.exists(path)
+            and manifests.get(path)["columns_version"] == registry.version(COLUMNS_PATH))
+
+
+def routed_forest(fallback, path=SEGMENTS_PATH):
+    """``fallback`` wrapped in the segment router when the manifest is current."""
+    global _router
+    if not is_current(path):
+        return fallback
+    manifest = manifests.get(path)
+    router = _router
+    if router is None or router.manifest is not manifest or router.fallback is not fallback:
+        with _router_lock:
+            router = _router
+            if (router is None or router.manifest is not manifest
+                    or router.fallback is not fallback):
+                router = _router = SegmentedForest(
+                    manifest, fallback, os.path.dirname(os.path.abspath(path))
+                )
+    return router
+
+
+def segments_version(base_version, path=SEGMENTS_PATH):
+    """``base_version`` extended with the manifest version while it is served."""
+    if not is_current(path):
+        return base_version
+    return f"{base_version}+{manifests.get(path)['version']}"
+
+
+# ==================================================
+# Build
+# ==================================================
+def build(trees=DEFAULT_TREES, min_rows=MIN_SEGMENT_ROWS, directory=SEGMENTS_DIR,
+          verbose=True):
+    """Train, export and evaluate one forest per segment; returns the manifest."""
+    from calibration import get_calibrator
+    from compress import single_row_latency
+    from forest import global_forest
+    from model_registry import load_model_columns
+    from train import (
+        DATA_PATH, DEFAULT_PARAMS, fit_forest, holdout_split, load_encoded, parse_listings,
+    )
+
+    columns = list(load_model_columns())
+    X, y = load_encoded()
+    X = X.reindex(columns=columns, fill_value=0)
+    X_train, X_test, y_train, y_test = holdout_split(X, y)
+    X_train = X_train.to_numpy(dtype=np.float32)
+    X_test = X_test.to_numpy(dtype=np.float32)
+    y_train, y_test = y_train.to_numpy(), y_test.to_numpy()
+
+    import pandas as pd
+
+    calibrator = get_calibrator()
+    makes = parse_listings(pd.read_csv(DATA_PATH))["Make"].dropna()
+    spec = routing_spec(columns, calibrator, reference_brand(makes, columns))
+    names = segment_names(spec["engine_thresholds"])
+    train_codes, test_codes = route(X_train, spec), route(X_test, spec)
+    single = global_forest()
+
+    os.makedirs(directory, exist_ok=True)
+    segments, report = {}, []
+    for code, name in enumerate(names):
+        train_rows = np.flatnonzero(train_codes == code)
+        test_rows = np.flatnonzero(test_codes == code)
+        entry = {"segment": name, "train_rows": len(train_rows), "test_rows": len(test_rows)}
+        report.append(entry)
+        path = os.path.join(directory, f"{name}.forest")
+        if len(train_rows) < min_rows:
+            entry.update(model="global", reason=f"fewer than {min_rows} training rows")
+            _remove(path)
+            continue
+        if not len(test_rows):
+            entry.update(model="global", reason="no hold-out rows to compare on")
+            _remove(path)
+            continue
+
+        start = time.perf_counter()
+        model = fit_forest(X_train[train_rows], y_train[train_rows],
+                           dict(DEFAULT_PARAMS, n_estimators=trees))
+        forest = FlatForest.from_sklearn(model)
+        forest.fit_leaf_quantiles(X_train[train_rows], y_train[train_rows])
+        entry["fit_seconds"] = time.perf_counter() - start
+
+        X_seg, y_seg = X_test[test_rows], y_test[test_rows]
+        entry.update(
+            n_trees=forest.n_trees,
+            holdout=_scores(forest, X_seg, y_seg),
+            global_holdout=_scores(single, X_seg, y_seg),
+            p50_ms=single_row_latency(forest, X_seg)[0],
+            global_p50_ms=single_row_latency(single, X_seg)[0],
+        )
+        mae, global_mae = entry["holdout"]["mae_usd"], entry["global_holdout"]["mae_usd"]
+        if mae >= global_mae:
+            entry.update(model="global", reason=f"hold-out MAE {mae:,.0f} not below "
+                                                f"global {global_mae:,.0f}")
+            _remove(path)
+            continue
+
+        filename = os.path.basename(path)
+        save_flat(forest, path, columns)
+        entry.update(model="segment", file=filename, bytes=os.path.getsize(path),
+                     reason=f"hold-out MAE {mae:,.0f} below global {global_mae:,.0f}")
+        segments[name] = {
+            "file": filename,
+            "bytes": entry["bytes"],
+            "n_trees": forest.n_trees,
+            "train_rows": len(train_rows),
+            "quantile_levels": [float(q) for q in forest.quantile_levels],
+        }
+
+    manifest = {
+        "columns_version": registry.version(COLUMNS_PATH),
+        "routing": spec,
+        "segments": segments,
+        "report": report,
+        "created": time.time(),
+    }
+    manifest["version"] = "seg-" + _content_version(manifest, directory)
+    path = os.path.join(directory, "manifest.json")
+    with open(path + ".tmp", "w") as fh:
+        json.dump(manifest, fh, indent=2)
+    os.replace(path + ".tmp", path)
+    if verbose:
+        print_report(manifest)
+    return manifest
+
+
+def _remove(path):
+    # A segment served by an earlier build that no longer is
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _scores(forest, X, y):
+    from sklearn.metrics import mean_absolute_error, r2_score
+
+    y_pred = forest.predict(X)
+    return {
+        "r2": float(r2_score(y, y_pred)) if len(y) > 1 else None,
+        "mae_usd": float(mean_absolute_error(y, y_pred)),
+    }
+
+
+def _content_version(manifest, directory):
+    import hashlib
+
+    digest = hashlib.sha256(json.dumps(manifest["routing"], sort_keys=True).encode())
+    for name in sorted(manifest["segments"]):
+        digest.update(file_digest(os.path.join(directory, manifest["segments"][name]["file"])).encode())
+    return digest.hexdigest()[:12]
+
+
+def print_report(manifest):
+    print(f"Segments {manifest['version']} (columns {manifest['columns_version']}, "
+          f"rows without a Make column route as {manifest['routing']['reference_brand']})")
+    print(f"  {'segment':<18} {'train':>6} {'test':>5} {'model':>8} {'trees':>5} "
+          f"{'MB':>6} {'MAE $':>14} {'global MAE $':>14} {'p50 ms':>7} {'global':>7}")
+    for e in manifest["report"]:
+        line = (f"  {e['segment']:<18} {e['train_rows']:>6} {e['test_rows']:>5} "
+                f"{e['model']:>8}")
+        if "holdout" in e:
+            size = f"{e['bytes'] / 1e6:>6.1f}" if "bytes" in e else f"{'-':>6}"
+            line += (f" {e['n_trees']:>5} {size} "
+                     f"{e['holdout']['mae_usd']:>14,.0f} "
+                     f"{e['global_holdout']['mae_usd']:>14,.0f} "
+                     f"{e['p50_ms']:>7.3f} {e['global_p50_ms']:>7.3f}")
+        print(line)
+        if e.get("reason"):
+            print(f"  {'':<18} {e['reason']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-segment models.")
+    parser.add_argument("command", choices=["build", "show"])
+    parser.add_argument("--trees", type=int, default=DEFAULT_TREES)
+    parser.add_argument("--min-rows", type=int, default=MIN_SEGMENT_ROWS)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build(args.trees, args.min_rows)
+    else:
+        print_report(load_manifest(SEGMENTS_PATH))
+        if not is_current():
+            print("Stale: model_columns.pkl changed since the build; serving the global model.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+What-if sweeps: the price of one listing as one or two inputs vary.
+
+    from sensitivity import sweep
+    curve = sweep(listing, "km", range(0, 200_001, 10_000))
+    grid = sweep(listing, "km", km_values, "year", year_values)
+
+    python sensitivity.py --brand Honda --model City --year 2017 --km 60000 \
+        --engine-cc 1500 --max-power 119 --fuel-tank 40 --transmission Automatic \
+        --fuel Petrol --owner First --color White --field horizon
+
+Sweepable fields:
+
+* km, year, engine_cc - the listing's own inputs;
+* horizon             - years from now: the car keeps its model year, is
+                        valued ``h`` years later and has driven
+                        ``annual_km * h`` more kilometres (the
+                        depreciation curve).
+
+The listing is encoded once. Every point of the sweep becomes a row of one
+matrix, which gets a single forest pass (``pricing.predict_interval``) and
+one vectorized calibration call. A 30-point curve therefore costs about
+as much as one prediction.
+"""
+import argparse
+import json
+
+import numpy as np
+
+from catalogue import ENGINE_RANGE, KM_RANGE, MIN_YEAR
+from pricing import CURRENT_YEAR, calibrate, is_unrealistic, predict_interval
+
+SWEEP_FIELDS = ("km", "year", "engine_cc", "horizon")
+SWEEP_LABELS = {
+    "km": "Kilometers driven",
+    "year": "Model year",
+    "engine_cc": "Engine capacity (CC)",
+    "horizon": "Years from now",
+}
+DEFAULT_POINTS = 31
+MAX_POINTS = 10_000
+DEFAULT_ANNUAL_KM = 12_000
+MAX_HORIZON_YEARS = 10
+
+
+def default_values(field, points=DEFAULT_POINTS, current_year=CURRENT_YEAR):
+    """The range the form allows for ``field`` (``points`` values at most)."""
+    if field == "km":
+        return np.linspace(KM_RANGE[0], KM_RANGE[1], points).round(-3)
+    if field == "year":
+        return np.arange(max(MIN_YEAR, current_year - points + 1), current_year + 1)
+    if field == "engine_cc":
+        return np.linspace(ENGINE_RANGE[0], ENGINE_RANGE[1], points).round(-2)
+    if field == "horizon":
+        return np.arange(0, MAX_HORIZON_YEARS + 1)
+    raise ValueError(f"Cannot sweep {field!r}; choose from {', '.join(SWEEP_FIELDS)}")
+
+
+def annual_km(listing, current_year=CURRENT_YEAR):
+    """The listing's own km per year so far, or a typical figure for a new car."""
+    age = current_year - listing["year"]
+    return listing["km"] / age if age > 0 and listing["km"] > 0 else DEFAULT_ANNUAL_KM
+
+
+def sweep(listing, field, values, field2=None, values2=None, forest=None,
+          encoder=None, current_year=CURRENT_YEAR, km_per_year=None):
+    """Calibrated prices of ``listing`` over ``values`` (x ``values2``).
+
+    Returns ``{"fields", "values", "mean", "low", "high", "rejected"}``;
+    prices have shape (len(values),) or (len(values), len(values2)) and are
+    NaN where the UI would refuse to price the inputs.
+    """
+    from encoder import get_encoder
+    from forest import get_forest
+    from model_registry import load_model_columns
+
+    fields = [field] if field2 is None else [field, field2]
+    for name in fields:
+        if name not in SWEEP_FIELDS:
+            raise ValueError(f"Cannot sweep {name!r}; choose from {', '.join(SWEEP_FIELDS)}")
+    if len(set(fields)) != len(fields):
+        raise ValueError("The two sweep fields must differ")
+    axes = [np.asarray(values, dtype=float)]
+    if field2 is not None:
+        axes.append(np.asarray(values2, dtype=float))
+    shape = tuple(len(axis) for axis in axes)
+    n = int(np.prod(shape))
+    if not 0 < n <= MAX_POINTS:
+        raise ValueError(f"A sweep needs between 1 and {MAX_POINTS:,} points")
+
+    encoder = encoder if encoder is not None else get_encoder(load_model_columns())
+    forest = forest if forest is not None else get_forest()
+
+    # Per-point inputs, starting from the listing as entered
+    points = {name: grid.ravel() for name, grid in
+              zip(fields, np.meshgrid(*axes, indexing="ij"))}
+    inputs = {
+        name: points.get(name, np.full(n, float(listing[name])))
+        for name in ("year", "km", "engine_cc")
+    }
+    valued_in = current_year
+    if "horizon" in points:
+        valued_in = current_year + points["horizon"]
+        if "km" not in points:
+            # Still driven until then (a swept km is the km at that date)
+            if km_per_year is None:
+                km_per_year = annual_km(listing, current_year)
+            inputs["km"] = inputs["km"] + km_per_year * points["horizon"]
+
+    row, _ = encoder.encode_one(listing)
+    X = np.repeat(row, n, axis=0)
+    for name in ("year", "km", "engine_cc"):
+        X[:, encoder.numeric_positions[name]] = inputs[name]
+
+    stats = predict_interval(forest, X)
+    brands = np.full(n, listing["brand"], dtype=object)
+    mean, low, high = calibrate(
+        stats["mean"], stats["low"], stats["high"],
+        brands, inputs["year"], inputs["km"], inputs["engine_cc"], valued_in,
+    )
+    rejected = is_unrealistic(brands, inputs["engine_cc"])
+    for prices in (mean, low, high):
+        prices[rejected] = np.nan
+    return {
+        "fields": fields,
+        "values": [axis.tolist() for axis in axes],
+        "mean": mean.reshape(shape),
+        "low": low.reshape(shape),
+        "high": high.reshape(shape),
+        "rejected": rejected.reshape(shape),
+    }
+
+
+def as_json(result):
+    """``sweep`` output with arrays as (nested) lists and NaN as null."""
+    def clean(array):
+        return np.where(np.isnan(array), None, array.astype(object)).tolist()
+
+    return {
+        "fields": result["fields"],
+        "values": result["values"],
+        "mean_price": clean(result["mean"]),
+        "low_price": clean(result["low"]),
+        "high_price": clean(result["high"]),
+    }
+
+
+def main(argv=None):
+    from encoder import LISTING_FIELDS, NUMERIC_FIELDS
+
+    parser = argparse.ArgumentParser(description="Sweep one or two inputs of a listing.")
+    for field in LISTING_FIELDS:
+        parser.add_argument("--" + field.replace("_", "-"),
+                            type=float if field in NUMERIC_FIELDS else str, required=True)
+    parser.add_argument("--field", choices=SWEEP_FIELDS, default="km")
+    parser.add_argument("--field2", choices=SWEEP_FIELDS)
+    parser.add_argument("--points", type=int, default=DEFAULT_POINTS)
+    args = parser.parse_args(argv)
+
+    listing = {field: getattr(args, field) for field in LISTING_FIELDS}
+    values = default_values(args.field, args.points)
+    values2 = None if args.field2 is None else default_values(args.field2, args.points)
+    print(json.dumps(as_json(sweep(listing, args.field, values, args.field2, values2)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+HTTP prediction service for machine-to-machine pricing.
+
+    python service.py --port 8080
+
+Endpoints (JSON):
+
+    POST /predict          one listing -> {mean_price, low_price, high_price, ...}
+    POST /predict/batch    {"listings": [...]} -> {"predictions": [...]}
+    POST /sensitivity      {"listing": {...}, "field": "km", "values": [...]}
+                           -> the price curve (see sensitivity.py)
+    GET  /health           model version and micro-batcher counters
+    GET  /metrics          Prometheus text: stage / request latency histograms
+
+Listings use the batch field names (brand, model, year, km, engine_cc,
+max_power, fuel_tank, transmission, fuel, owner, color). Pricing goes through
+batch.price_records, i.e. the same encoder, forest, depreciation and price
+caps as the app.
+
+The forest is loaded once at startup. Single-listing requests go through
+batching.MicroBatcher, so concurrent callers share one forest pass; batch
+requests run in a thread pool. Neither blocks the event loop.
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from batch import check_record, encode_records, price_records, records_from_stats
+from batching import (
+    DEFAULT_MAX_BATCH,
+    DEFAULT_MAX_QUEUE,
+    DEFAULT_MAX_WAIT_MS,
+    MicroBatcher,
+    QueueFull,
+    set_batcher,
+)
+from encoder import get_encoder
+from forest import get_forest, serving_version
+from metrics import metrics
+from model_registry import load_model_columns
+from sensitivity import as_json, default_values, sweep
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+MAX_REQUEST_LISTINGS = 10_000
+
+
+# ==================================================
+# Handlers
+# ==================================================
+def bad_request(message):
+    return web.json_response({"error": message}, status=400)
+
+
+async def read_json(request):
+    """Parsed JSON body, or None if it is not valid JSON."""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def predict(request):
+    record = await read_json(request)
+    if not isinstance(record, dict):
+        return bad_request("Expected a JSON object with the listing fields")
+    try:
+        with metrics.timed("encode"):
+            X, unknown = encode_records([record])
+    except (TypeError, ValueError) as exc:
+        return bad_request(str(exc))
+
+    start = time.perf_counter()
+    try:
+        future = request.app["batcher"].submit(X)
+    except QueueFull as exc:
+        return web.json_response({"error": str(exc)}, status=503)
+    with metrics.timed("infer"):
+        stats = await asyncio.wrap_future(future)
+    metrics.inc("predictions_total", source="forest")
+    with metrics.timed("calibrate"):
+        result = records_from_stats([record], stats, unknown)[0]
+    result["latency_ms"] = round((time.perf_counter() - start) * 1e3, 3)
+    return web.json_response(result)
+
+
+async def predict_batch(request):
+    body = await read_json(request)
+    records = body.get("listings") if isinstance(body, dict) else None
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        return bad_request('Expected {"listings": [ {...}, ... ]}')
+    if len(records) > MAX_REQUEST_LISTINGS:
+        return bad_request(f"At most {MAX_REQUEST_LISTINGS} listings per request")
+    try:
+        for i, record in enumerate(records):
+            check_record(record)
+    except ValueError as exc:
+        return bad_request(f"Listing {i}: {exc}")
+
+    loop = asyncio.get_running_loop()
+    results = await loop.run_in_executor(
+        request.app["executor"], price_records, records
+    )
+    metrics.inc("predictions_total", len(records), source="forest")
+    return web.json_response({"predictions": results})
+
+
+def sweep_request(body):
+    """sensitivity.sweep for a /sensitivity body; ValueError if invalid."""
+    listing = body.get("listing")
+    if not isinstance(listing, dict):
+        raise ValueError('Expected {"listing": {...}, "field": ..., "values": [...]}')
+    check_record(listing)
+    field, field2 = body.get("field", "km"), body.get("field2")
+    values = body.get("values") or default_values(field)
+    values2 = None if field2 is None else body.get("values2") or default_values(field2)
+    with metrics.timed("sensitivity"):
+        return as_json(sweep(listing, field, values, field2, values2))
+
+
+async def sensitivity(request):
+    body = await read_json(request)
+    if not isinstance(body, dict):
+        return bad_request("Expected a JSON object")
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(request.app["executor"], sweep_request, body)
+    except (TypeError, ValueError) as exc:
+        return bad_request(str(exc))
+    return web.json_response(result)
+
+
+async def health(request):
+    return web.json_response({
+        "status": "ok",
+        "model_version": serving_version(),
+        "batcher": request.app["batcher"].stats(),
+    })
+
+
+async def metrics_endpoint(request):
+    return web.Response(
+        text=metrics.render(), content_type="text/plain", charset="utf-8",
+        headers={"X-Prometheus-Format": "0.0.4"},
+    )
+
+
+@web.middleware
+async def record_latency(request, handler):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as exc:
+        status = exc.status
+        raise
+    finally:
+        route = request.match_info.route.resource
+        metrics.observe(
+            "request_seconds", time.perf_counter() - start,
+            endpoint=route.canonical if route is not None else "unmatched",
+            status=status,
+        )
+
+
+def create_app(workers=DEFAULT_WORKERS, window_ms=DEFAULT_MAX_WAIT_MS,
+               max_batch=DEFAULT_MAX_BATCH, max_queue=DEFAULT_MAX_QUEUE):
+    app = web.Application(client_max_size=32 * 1024 * 1024, middlewares=[record_latency])
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="predict")
+    app["executor"] = executor
+    batcher = MicroBatcher(max_wait_ms=window_ms, max_batch=max_batch,
+                           max_queue=max_queue)
+    app["batcher"] = batcher
+    # Process-wide, so get_batcher() callers share it and /metrics reports it once
+    set_batcher(batcher)
+
+    async def warm_up(app):
+        # Load model and encoder before the first request arrives.
+        await asyncio.get_running_loop().run_in_executor(
+            executor, lambda: (get_forest(), get_encoder(load_model_columns()))
+        )
+
+    async def shut_down(app):
+        batcher.close(timeout=1)
+        set_batcher(None)
+        executor.shutdown(wait=False)
+
+    app.on_startup.append(warm_up)
+    app.on_cleanup.append(shut_down)
+    app.router.add_post("/predict", predict)
+    app.router.add_post("/predict/batch", predict_batch)
+    app.router.add_post("/sensitivity", sensitivity)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics_endpoint)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the car price HTTP service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--window-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE)
+    args = parser.parse_args(argv)
+
+    web.run_app(
+        create_app(args.workers, args.window_ms, args.max_batch, args.max_queue),
+        host=args.host,
+        port=args.port,
+    )
+
+
+if __name__ == "__main__":
+    main()
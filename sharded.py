@@ -0,0 +1,247 @@
+"""
+Sharded batch valuation over a process pool.
+
+    python sharded.py listings.csv -o priced.csv --workers 4 --chunk-size 8192
+    python sharded.py --scaling 1,2,4,8 --rows 200000   # throughput per worker count
+
+The input is read in chunks of ``--chunk-size`` rows and the chunks are
+priced by ``--workers`` processes (``batch.price_chunk``: same encoding,
+forest, depreciation and caps as batch.py). Every worker attaches the
+model once in its initializer. ``get_forest`` memory-maps the flat export
+(and the segment forests), so all workers read the same page-cache pages
+and only the listing chunks travel between processes, never the model.
+Without a current flat export each worker compiles the pickle itself;
+run ``python forest.py export`` first.
+
+Results come back in input order and are written chunk by chunk. At most
+``IN_FLIGHT_PER_WORKER`` chunks per worker are queued, so memory stays
+bounded by the chunk size, not by the input. The report gives rows/s
+overall (wall clock, including pool start-up) and per worker;
+``--scaling`` repeats one synthetic input at each worker count and prints
+speedup and efficiency against one worker.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from batch import PRICE_COLUMNS, check_listings, price_chunk, report_unknown
+from pricing import CURRENT_YEAR
+
+DEFAULT_CHUNK_SIZE = 8192
+IN_FLIGHT_PER_WORKER = 2
+SCALING_WORKERS = (1, 2, 4, 8)
+SCALING_ROWS = 200_000
+
+# Set in each worker by _attach_model.
+_worker = {}
+
+
+# ==================================================
+# Workers
+# ==================================================
+def _attach_model(chunk_size, current_year):
+    from encoder import get_encoder
+    from forest import get_forest
+    from model_registry import load_model_columns
+
+    encoder = get_encoder(load_model_columns())
+    _worker.update(
+        forest=get_forest(),
+        encoder=encoder,
+        buffer=np.empty((chunk_size, encoder.n_columns), dtype=np.float32),
+        current_year=current_year,
+        pid=os.getpid(),
+    )
+
+
+def _price_shard(listings):
+    """(prices (n, 3), unknown categories, seconds, worker pid) for one chunk."""
+    start = time.perf_counter()
+    prices, unknown = price_chunk(
+        listings, _worker["forest"], _worker["encoder"], _worker["current_year"],
+        out=_worker["buffer"],
+    )
+    return np.column_stack(prices), unknown, time.perf_counter() - start, _worker["pid"]
+
+
+# ==================================================
+# Ordered streaming
+# ==================================================
+def price_sharded(chunks, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                  current_year=CURRENT_YEAR, stats=None):
+    """Yield each DataFrame of ``chunks`` with the price columns added, in
+    input order. ``chunks`` may be any iterable (e.g. a chunked reader) and
+    is consumed lazily; chunks may not exceed ``chunk_size`` rows.
+
+    ``stats``, if given, is filled with rows, chunks, seconds and per-worker
+    busy time / rows as the chunks complete.
+    """
+    workers = workers or os.cpu_count()
+    stats = stats if stats is not None else {}
+    stats.update(rows=0, chunks=0, seconds=0.0, workers={})
+    pending = deque()
+    chunks = iter(chunks)
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(workers, initializer=_attach_model,
+                             initargs=(chunk_size, current_year)) as pool:
+        def submit():
+            for chunk in chunks:
+                if len(chunk) > chunk_size:
+                    raise ValueError(f"Chunk of {len(chunk):,} rows exceeds "
+                                     f"chunk_size={chunk_size:,}")
+                check_listings(chunk)
+                pending.append((chunk, pool.submit(_price_shard, chunk)))
+                return True
+            return False
+
+        while len(pending) < workers * IN_FLIGHT_PER_WORKER and submit():
+            pass
+        while pending:
+            chunk, future = pending.popleft()
+            prices, unknown, seconds, pid = future.result()
+            submit()
+
+            priced = chunk.copy()
+            priced[PRICE_COLUMNS] = prices
+            priced.attrs["unknown_categories"] = unknown
+            busy = stats["workers"].setdefault(pid, {"rows": 0, "seconds": 0.0})
+            busy["rows"] += len(chunk)
+            busy["seconds"] += seconds
+            stats["rows"] += len(chunk)
+            stats["chunks"] += 1
+            stats["seconds"] = time.perf_counter() - start
+            yield priced
+
+
+# ==================================================
+# Files
+# ==================================================
+def iter_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """DataFrames of at most ``chunk_size`` rows from a CSV or Parquet file."""
+    if os.path.splitext(path)[1].lower() in (".parquet", ".pq"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+class ChunkWriter:
+    """Appends priced chunks to a CSV or Parquet file (one row group each)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = os.path.splitext(path)[1].lower() in (".parquet", ".pq")
+        self._writer = None
+
+    def write(self, frame):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode="a" if self._writer else "w",
+                         header=not self._writer, index=False)
+            self._writer = True
+
+    def close(self):
+        if self.parquet and self._writer is not None:
+            self._writer.close()
+
+
+def price_file(path, output, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Price ``path`` into ``output``; returns the stats of ``price_sharded``
+    plus the unknown categories seen."""
+    stats, unknown = {}, {}
+    writer = ChunkWriter(output)
+    try:
+        for priced in price_sharded(iter_chunks(path, chunk_size), workers, chunk_size,
+                                    stats=stats):
+            writer.write(priced)
+            for field, values in priced.attrs["unknown_categories"].items():
+                unknown.setdefault(field, set()).update(values)
+    finally:
+        writer.close()
+    stats["unknown_categories"] = {f: sorted(v) for f, v in unknown.items()}
+    return stats
+
+
+def report(stats, file=sys.stderr):
+    seconds = stats["seconds"] or float("inf")
+    print(f"Priced {stats['rows']:,} listings in {stats['chunks']:,} chunks on "
+          f"{len(stats['workers'])} workers in {stats['seconds']:.2f}s "
+          f"({stats['rows'] / seconds:,.0f} rows/s)", file=file)
+    for pid, busy in sorted(stats["workers"].items()):
+        rate = busy["rows"] / busy["seconds"] if busy["seconds"] else float("inf")
+        print(f"  worker {pid}: {busy['rows']:>10,} rows, busy {busy['seconds']:6.2f}s "
+              f"({rate:,.0f} rows/s)", file=file)
+
+
+# ==================================================
+# Scaling
+# ==================================================
+def scaling(worker_counts=SCALING_WORKERS, rows=SCALING_ROWS,
+            chunk_size=DEFAULT_CHUNK_SIZE, seed=0):
+    """[(workers, seconds, rows/s, speedup, efficiency)] on one synthetic input
+    (catalogue and CSV listings, see benchmark.make_listings)."""
+    from benchmark import make_listings
+
+    listings = pd.DataFrame(make_listings(rows, seed))
+    chunks = [listings.iloc[i:i + chunk_size] for i in range(0, rows, chunk_size)]
+    results = []
+    for workers in worker_counts:
+        stats = {}
+        for _ in price_sharded(chunks, workers, chunk_size, stats=stats):
+            pass
+        rate = stats["rows"] / stats["seconds"]
+        base = results[0][2] if results else rate
+        results.append((workers, stats["seconds"], rate, rate / base,
+                        rate / base / (workers / worker_counts[0])))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Price a file of listings on a process pool.")
+    parser.add_argument("listings", nargs="?", help="CSV or Parquet file of listings")
+    parser.add_argument("-o", "--output", help="CSV or Parquet output")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--scaling", help="comma-separated worker counts to compare, "
+                                          "e.g. 1,2,4,8 (synthetic input)")
+    parser.add_argument("--rows", type=int, default=SCALING_ROWS,
+                        help="synthetic rows for --scaling")
+    args = parser.parse_args(argv)
+
+    if args.scaling:
+        counts = [int(n) for n in args.scaling.split(",")]
+        print(f"{args.rows:,} rows, chunks of {args.chunk_size:,}, "
+              f"{os.cpu_count()} CPUs available")
+        print(f"  {'workers':>7} {'seconds':>8} {'rows/s':>10} {'speedup':>8} {'efficiency':>10}")
+        for workers, seconds, rate, speedup, efficiency in scaling(
+            counts, args.rows, args.chunk_size
+        ):
+            print(f"  {workers:>7} {seconds:>8.2f} {rate:>10,.0f} "
+                  f"{speedup:>7.2f}x {efficiency:>10.0%}")
+        return
+    if not args.listings or not args.output:
+        parser.error("listings and --output are required unless --scaling is given")
+
+    stats = price_file(args.listings, args.output, args.workers, args.chunk_size)
+    report_unknown(stats["unknown_categories"])
+    report(stats)
+
+
+if __name__ == "__main__":
+    main()
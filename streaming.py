@@ -0,0 +1,267 @@
+"""
+Streaming batch valuation with bounded memory.
+
+    python streaming.py listings.csv -o priced.csv
+    python streaming.py listings.jsonl -o priced.jsonl --chunk-size 2048
+    cat listings.jsonl | python streaming.py - --format jsonl -o - > priced.jsonl
+    python streaming.py --bench-rss 10000,100000,1000000   # peak RSS vs input size
+
+A chain of generators, one record at a time:
+
+    read_records -> price_stream (encode / infer / calibrate) -> write_records
+
+Records are parsed lazily from CSV or JSON Lines, or from stdin with ``-``.
+Every ``--chunk-size`` records are encoded into one float32 buffer that
+is allocated once and reused. The chunk is priced with a single forest
+pass and calibration call, and written out before the next one is read.
+No DataFrame and no one-hot matrix of the whole input ever exists, so the
+peak RSS is the model plus one chunk, whatever the input size.
+``--bench-rss`` measures this against batch.py, which loads the whole file.
+"""
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import cycle, islice
+
+import numpy as np
+
+from batch import PRICE_COLUMNS, check_record, report_unknown
+from encoder import LISTING_FIELDS, NUMERIC_FIELDS
+from pricing import CURRENT_YEAR, calibrate, is_unrealistic, predict_interval
+
+DEFAULT_CHUNK_SIZE = 4096
+FORMATS = ("csv", "jsonl")
+RSS_SIZES = (10_000, 100_000, 1_000_000)
+
+
+def file_format(path, default="csv"):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if ext == ".csv":
+        return "csv"
+    return default
+
+
+# ==================================================
+# Reading
+# ==================================================
+def _number(field, value):
+    if value is None or value == "":
+        return np.nan
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            raise ValueError(f"{field} must be a number, got {value!r}") from None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def read_records(stream, fmt="csv"):
+    """Listing dicts from an open text stream, numeric fields as numbers."""
+    if fmt == "jsonl":
+        rows = (json.loads(line) for line in stream if line.strip())
+    else:
+        rows = csv.DictReader(stream)
+    for line, record in enumerate(rows, 1):
+        try:
+            for field in NUMERIC_FIELDS:
+                if field in record:
+                    record[field] = _number(field, record[field])
+            check_record(record)
+        except ValueError as exc:
+            raise ValueError(f"Record {line}: {exc}") from None
+        yield record
+
+
+def chunked(records, size):
+    """Lists of at most ``size`` consecutive records."""
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# ==================================================
+# Pricing
+# ==================================================
+def price_stream(records, forest=None, encoder=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 current_year=CURRENT_YEAR, unknown=None):
+    """Yield every record with mean_price, low_price and high_price added
+    (None where the UI would refuse to price it), in input order.
+
+    Unrecognised categories are collected per field into ``unknown``.
+    """
+    from encoder import get_encoder
+    from forest import get_forest
+    from model_registry import load_model_columns
+
+    encoder = encoder if encoder is not None else get_encoder(load_model_columns())
+    forest = forest if forest is not None else get_forest()
+    unknown = unknown if unknown is not None else {}
+    buffer = np.empty((chunk_size, encoder.n_columns), dtype=np.float32)
+
+    for chunk in chunked(records, chunk_size):
+        X = buffer[:len(chunk)]
+        for i, record in enumerate(chunk):
+            for field, value in encoder.encode_one(record, out=X[i:i + 1])[1]:
+                unknown.setdefault(field, set()).add(value)
+
+        stats = predict_interval(forest, X)
+        brand = [r["brand"] for r in chunk]
+        engine_cc = [r["engine_cc"] for r in chunk]
+        prices = calibrate(
+            stats["mean"], stats["low"], stats["high"],
+            brand, [r["year"] for r in chunk], [r["km"] for r in chunk], engine_cc,
+            current_year,
+        )
+        rejected = is_unrealistic(brand, engine_cc)
+        for i, record in enumerate(chunk):
+            for column, values in zip(PRICE_COLUMNS, prices):
+                record[column] = None if rejected[i] else round(float(values[i]), 2)
+            yield record
+
+
+# ==================================================
+# Writing
+# ==================================================
+def write_records(records, stream, fmt="csv"):
+    """Write records as they come; returns how many were written."""
+    n = 0
+    writer = None
+    for record in records:
+        # Missing numbers were NaN for pricing; written out as empty / null
+        record = {k: None if isinstance(v, float) and v != v else v
+                  for k, v in record.items()}
+        if fmt == "jsonl":
+            stream.write(json.dumps(record, allow_nan=False, default=_json_value) + "\n")
+        else:
+            if writer is None:
+                writer = csv.DictWriter(stream, fieldnames=list(record),
+                                        extrasaction="ignore")
+                writer.writeheader()
+            writer.writerow(record)
+        n += 1
+    return n
+
+
+def _json_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _open(path, mode):
+    if path == "-":
+        stream = sys.stdin if "r" in mode else sys.stdout
+        return open(stream.fileno(), mode, newline="", closefd=False)
+    return open(path, mode, newline="")
+
+
+def stream_file(path, output, fmt=None, out_fmt=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Price ``path`` into ``output`` (either may be "-"); returns
+    (rows, seconds, unknown categories)."""
+    fmt = fmt or file_format(path)
+    out_fmt = out_fmt or file_format(output, fmt)
+    unknown = {}
+    start = time.perf_counter()
+    with _open(path, "r") as source, _open(output, "w") as sink:
+        priced = price_stream(read_records(source, fmt), chunk_size=chunk_size,
+                              unknown=unknown)
+        rows = write_records(priced, sink, out_fmt)
+    unknown = {field: sorted(values) for field, values in unknown.items()}
+    return rows, time.perf_counter() - start, unknown
+
+
+# ==================================================
+# Peak RSS against input size
+# ==================================================
+RSS_SNIPPET = """
+import json, resource, sys
+mode, path, out = sys.argv[1:]
+if mode == "streaming":
+    from streaming import stream_file
+    stream_file(path, out)
+else:
+    from batch import price_listings, read_listings, write_prices
+    write_prices(price_listings(read_listings(path)), out)
+print(json.dumps(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+"""
+
+
+def write_synthetic(path, rows, seed=0):
+    """CSV of ``rows`` listings cycling over a seeded sample (benchmark.py)."""
+    from benchmark import make_listings
+
+    sample = make_listings(min(rows, 10_000), seed)
+    with open(path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=LISTING_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(islice(cycle(sample), rows))
+
+
+def peak_rss_mb(mode, path):
+    """Peak RSS (MB) of a fresh process pricing ``path`` with ``mode``
+    ("streaming" or "batch")."""
+    with tempfile.TemporaryDirectory() as tmp:
+        out = subprocess.run(
+            [sys.executable, "-c", RSS_SNIPPET, mode, path, os.path.join(tmp, "out.csv")],
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+            capture_output=True, text=True,
+        ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def bench_rss(sizes=RSS_SIZES, modes=("streaming", "batch")):
+    """[(rows, input MB, {mode: peak RSS MB})]"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            path = os.path.join(tmp, f"listings-{rows}.csv")
+            write_synthetic(path, rows)
+            size_mb = os.path.getsize(path) / 1e6
+            results.append((rows, size_mb, {mode: peak_rss_mb(mode, path) for mode in modes}))
+            os.remove(path)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream listings through the pricer.")
+    parser.add_argument("listings", nargs="?", help="CSV / JSONL file, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="CSV / JSONL file, or - for stdout")
+    parser.add_argument("--format", choices=FORMATS, help="input format (default: by extension)")
+    parser.add_argument("--output-format", choices=FORMATS,
+                        help="output format (default: by extension, else the input's)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--bench-rss", help="comma-separated input sizes (rows) to measure")
+    args = parser.parse_args(argv)
+
+    if args.bench_rss:
+        sizes = [int(n) for n in args.bench_rss.split(",")]
+        print(f"  {'rows':>10} {'input MB':>9} {'streaming MB':>13} {'batch.py MB':>12}")
+        for rows, size_mb, peaks in bench_rss(sizes):
+            print(f"  {rows:>10,} {size_mb:>9.1f} {peaks['streaming']:>13,.0f} "
+                  f"{peaks['batch']:>12,.0f}")
+        return
+    if not args.listings:
+        parser.error("listings is required unless --bench-rss is given")
+
+    rows, seconds, unknown = stream_file(
+        args.listings, args.output, args.format, args.output_format, args.chunk_size
+    )
+    report_unknown(unknown)
+    rate = rows / seconds if seconds else float("inf")
+    print(f"Priced {rows:,} listings in {seconds:.2f}s ({rate:,.0f} rows/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Reproducible training pipeline (the stages of notebook.ipynb as a command).
+
+    python train.py
+    python train.py --n-estimators 300 --max-depth 18
+
+Stages: load -> parse -> encode -> fit -> evaluate -> export. The parsed
+frame and the encoded matrix are cached on disk under a content hash of the
+raw CSV plus the stage version. Changing only hyperparameters therefore
+skips straight to fitting. The exported car_price_model.pkl and
+model_columns.pkl are the same artifacts the notebook wrote.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+
+import joblib
+import pandas as pd
+
+from model_registry import BASE_DIR, COLUMNS_PATH, MODEL_PATH, file_digest
+
+DATA_PATH = os.path.join(BASE_DIR, "Data", "car details v4 (2).csv")
+CACHE_DIR = os.path.join(BASE_DIR, ".cache", "train")
+
+# Bump when a stage's logic changes so stale cache entries are not reused.
+PARSE_VERSION = 1
+ENCODE_VERSION = 1
+
+INR_TO_USD = 83
+LAKH = 100_000
+
+# Leading number of a unit string ("88.5 bhp@4000rpm" -> 88.5), compiled once.
+NUMBER_PATTERN = re.compile(r"(\d+\.?\d*)")
+
+UNIT_COLUMNS = {
+    # parsed column: raw column
+    "max_power": "Max Power",
+    "Fuel_Tank_Capacity": "Fuel Tank Capacity",
+    "engine_cc": "Engine",
+    "max_torque": "Max Torque",
+}
+TITLE_COLUMNS = ["Make", "Model", "Color", "Fuel Type", "Transmission", "Owner"]
+COLUMNS_TO_DROP = [
+    "Max Power",
+    "Max Torque",
+    "Fuel Tank Capacity",
+    "Engine",
+    "Drivetrain",
+    "Location",
+]
+FINAL_FEATURES = [
+    "Make",
+    "Model",
+    "Year",
+    "Kilometer",
+    "Fuel Type",
+    "Transmission",
+    "Owner",
+    "Seller Type",
+    "Color",
+    "engine_cc",
+    "max_power",
+    "max_torque",
+    "Fuel_Tank_Capacity",
+    "Length",
+    "Width",
+    "Height",
+    "Seating Capacity",
+    "Price",
+]
+CATEGORICAL_COLUMNS = [
+    "Make",
+    "Model",
+    "Fuel Type",
+    "Transmission",
+    "Owner",
+    "Seller Type",
+    "Color",
+]
+
+DEFAULT_PARAMS = {
+    "n_estimators": 500,
+    "max_depth": 22,
+    "min_samples_split": 5,
+    "min_samples_leaf": 2,
+    "random_state": 42,
+    "n_jobs": -1,
+}
+TEST_SIZE = 0.2
+SPLIT_SEED = 42
+
+
+# ==================================================
+# Stages
+# ==================================================
+def parse_listings(df):
+    """Raw CSV frame -> numeric features, tidy categories, price in USD."""
+    df = df.copy()
+    for column, raw in UNIT_COLUMNS.items():
+        df[column] = df[raw].astype(str).str.extract(NUMBER_PATTERN)[0].astype(float)
+    df = df.dropna(subset=["max_power", "Fuel_Tank_Capacity"])
+
+    for column in TITLE_COLUMNS:
+        df[column] = df[column].str.strip().str.title()
+
+    df = df.drop(columns=COLUMNS_TO_DROP)
+    df["Price"] = (df["Price"] * LAKH / INR_TO_USD).round(2)
+    return df.reset_index(drop=True)
+
+
+def encode_listings(df):
+    """Parsed frame -> (X, y) with get_dummies(drop_first=True) as in training."""
+    encoded = pd.get_dummies(
+        df[FINAL_FEATURES], columns=CATEGORICAL_COLUMNS, drop_first=True
+    )
+    return encoded.drop("Price", axis=1), encoded["Price"]
+
+
+def holdout_split(X, y):
+    """The notebook's 80/20 split."""
+    from sklearn.model_selection import train_test_split
+
+    return train_test_split(X, y, test_size=TEST_SIZE, random_state=SPLIT_SEED)
+
+
+def fit_forest(X_train, y_train, params=None):
+    from sklearn.ensemble import RandomForestRegressor
+
+    return RandomForestRegressor(**dict(DEFAULT_PARAMS, **(params or {}))).fit(
+        X_train, y_train
+    )
+
+
+def evaluate(model, X_test, y_test):
+    from sklearn.metrics import mean_absolute_error, r2_score
+
+    y_pred = model.predict(X_test)
+    return {
+        "r2": float(r2_score(y_test, y_pred)),
+        "mae_usd": float(mean_absolute_error(y_test, y_pred)),
+    }
+
+
+# ==================================================
+# Stage cache
+# ==================================================
+def stage_key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class StageCache:
+    """Joblib files under ``cache_dir`` named ``<stage>-<content hash>.pkl``."""
+
+    def __init__(self, cache_dir=CACHE_DIR, enabled=True):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+
+    def path(self, stage, key):
+        return os.path.join(self.cache_dir, f"{stage}-{key}.pkl")
+
+    def has(self, stage, key):
+        return self.enabled and os.path.exists(self.path(stage, key))
+
+    def run(self, stage, key, compute):
+        """(value, was_cached) for ``stage``; computes and stores on a miss."""
+        path = self.path(stage, key)
+        if self.has(stage, key):
+            return joblib.load(path), True
+        value = compute()
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = path + ".tmp"
+            joblib.dump(value, tmp)
+            os.replace(tmp, path)
+        return value, False
+
+
+class Timings:
+    def __init__(self, verbose=True):
+        self.verbose = verbose
+        self.stages = []
+
+    def record(self, stage, seconds, cached=False):
+        self.stages.append({"stage": stage, "seconds": seconds, "cached": cached})
+        if self.verbose:
+            note = " (cached)" if cached else ""
+            print(f"  {stage:<10} {seconds:8.2f}s{note}")
+
+
+def load_encoded(data_path=DATA_PATH, cache=None, timings=None):
+    """Cached (X, y) for a raw CSV; runs load/parse/encode only on a miss."""
+    cache = cache or StageCache()
+    timings = timings or Timings(verbose=False)
+
+    def timed(stage, key, compute):
+        start = time.perf_counter()
+        value, cached = cache.run(stage, key, compute)
+        timings.record(stage, time.perf_counter() - start, cached)
+        return value
+
+    start = time.perf_counter()
+    parse_key = stage_key(file_digest(data_path), PARSE_VERSION)
+    encode_key = stage_key(parse_key, ENCODE_VERSION)
+    timings.record("hash", time.perf_counter() - start)
+
+    if cache.has("encode", encode_key):
+        return timed("encode", encode_key, None)
+
+    if cache.has("parse", parse_key):
+        frame = timed("parse", parse_key, None)
+    else:
+        start = time.perf_counter()
+        raw = pd.read_csv(data_path)
+        timings.record("load", time.perf_counter() - start)
+        frame = timed("parse", parse_key, lambda: parse_listings(raw))
+
+    return timed("encode", encode_key, lambda: encode_listings(frame))
+
+
+def train(data_path=DATA_PATH, params=None, model_path=MODEL_PATH,
+          columns_path=COLUMNS_PATH, cache=None, verbose=True):
+    timings = Timings(verbose)
+    X, y = load_encoded(data_path, cache, timings)
+
+    start = time.perf_counter()
+    X_train, X_test, y_train, y_test = holdout_split(X, y)
+    model = fit_forest(X_train, y_train, params)
+    timings.record("fit", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    metrics = evaluate(model, X_test, y_test)
+    timings.record("evaluate", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    joblib.dump(model, model_path)
+    joblib.dump(X.columns.tolist(), columns_path)
+    timings.record("export", time.perf_counter() - start)
+
+    return model, metrics, timings.stages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the car price model.")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--model-out", default=MODEL_PATH)
+    parser.add_argument("--columns-out", default=COLUMNS_PATH)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true")
+    for name, default in DEFAULT_PARAMS.items():
+        parser.add_argument("--" + name.replace("_", "-"), type=int, default=default)
+    args = parser.parse_args(argv)
+
+    params = {name: getattr(args, name) for name in DEFAULT_PARAMS}
+    print("Stage timings:")
+    _, metrics, stages = train(
+        args.data,
+        params,
+        args.model_out,
+        args.columns_out,
+        StageCache(args.cache_dir, enabled=not args.no_cache),
+    )
+    print(f"  {'total':<10} {sum(s['seconds'] for s in stages):8.2f}s")
+    print("FINAL R² Score:", metrics["r2"])
+    print("FINAL MAE (USD):", metrics["mae_usd"])
+
+
+if __name__ == "__main__":
+    main()
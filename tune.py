@@ -0,0 +1,284 @@
+"""
+Hyperparameter search with k-fold cross-validation.
+
+    python tune.py --trials 20                        # random search, 5 folds
+    python tune.py --search halving --trials 27 --eta 3
+    python tune.py --trials 40 --workers 8 --out tuning.json
+
+Runs on the cached encoded matrix from ``train.load_encoded`` and only on
+the notebook's training split, so the 80/20 hold-out stays untouched. The
+notebook's own configuration is always trial 0 for reference.
+
+Trials are spread over a process pool. X and y are copied once into shared
+memory and every worker maps them, instead of each task pickling its own
+copy of the matrix. Every fit uses one core (``n_jobs=1``); the pool
+provides the parallelism.
+
+Each trial records its mean CV MAE / R², fit time per fold, single-row
+predict latency of the flat forest (what the app serves), node count and
+flat size. Trials not beaten on both MAE and p50 latency by another trial
+form the Pareto front; pick from it rather than on R² alone.
+
+``halving`` is successive halving on training rows: all candidates start on
+a small sample of each fold, and the best 1/eta move on to eta times more
+rows until the survivors use the full folds.
+"""
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from train import DEFAULT_PARAMS, holdout_split, load_encoded
+
+SEARCH_SPACE = {
+    "n_estimators": [50, 100, 200, 300, 500],
+    "max_depth": [10, 14, 18, 22, None],
+    "min_samples_split": [2, 5, 10],
+    "min_samples_leaf": [1, 2, 4],
+    "max_features": [1.0, 0.5, 0.3, "sqrt"],
+}
+DEFAULT_FOLDS = 5
+DEFAULT_ETA = 3
+MIN_HALVING_ROWS = 100
+LATENCY_REPEAT = 100
+
+# Set in each worker by _attach_data.
+_data = {}
+
+
+# ==================================================
+# Shared training data
+# ==================================================
+def share_arrays(arrays):
+    """Copy arrays into new shared-memory blocks -> (blocks, specs)."""
+    from multiprocessing import shared_memory
+
+    blocks, specs = [], {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+
+def _attach_data(specs):
+    from multiprocessing import shared_memory
+
+    # Pool workers share the parent's resource tracker, so attaching here
+    # does not schedule a second unlink; the parent unlinks after the search.
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _data[name] = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+        _data[name + "_block"] = block
+
+
+# ==================================================
+# Trials
+# ==================================================
+def sample_params(rng, n, space=SEARCH_SPACE):
+    """The notebook's configuration followed by n - 1 distinct random ones."""
+    notebook = {k: DEFAULT_PARAMS[k] for k in space if k in DEFAULT_PARAMS}
+    notebook.setdefault("max_features", 1.0)
+    candidates, seen = [notebook], {json.dumps(notebook, sort_keys=True)}
+    size = math.prod(len(values) for values in space.values())
+    while len(candidates) < min(n, size):
+        params = {k: values[rng.integers(len(values))] for k, values in space.items()}
+        key = json.dumps(params, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            candidates.append(params)
+    return candidates
+
+
+def kfold_indices(n_rows, folds, seed):
+    """[(train_idx, val_idx)]; train indices are shuffled so that a prefix
+    is a random sample (used by successive halving)."""
+    from sklearn.model_selection import KFold
+
+    rng = np.random.default_rng(seed)
+    splits = []
+    for train_idx, val_idx in KFold(folds, shuffle=True, random_state=seed).split(
+        np.empty(n_rows)
+    ):
+        splits.append((rng.permutation(train_idx), val_idx))
+    return splits
+
+
+def run_trial(trial, params, splits, max_rows=None, seed=DEFAULT_PARAMS["random_state"]):
+    """Cross-validate one configuration on the worker's shared X / y."""
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.metrics import mean_absolute_error, r2_score
+
+    from compress import byte_model, single_row_latency
+    from forest import FlatForest
+
+    X, y = _data["X"], _data["y"]
+    maes, r2s, fit_seconds, p50s, p99s, nodes, sizes = [], [], [], [], [], [], []
+    for train_idx, val_idx in splits:
+        if max_rows is not None:
+            train_idx = train_idx[:max_rows]
+        model = RandomForestRegressor(**params, random_state=seed, n_jobs=1)
+        start = time.perf_counter()
+        model.fit(X[train_idx], y[train_idx])
+        fit_seconds.append(time.perf_counter() - start)
+
+        forest = FlatForest.from_sklearn(model)
+        X_val = X[val_idx]
+        y_pred = forest.predict(X_val)
+        maes.append(mean_absolute_error(y[val_idx], y_pred))
+        r2s.append(r2_score(y[val_idx], y_pred))
+        p50, p99 = single_row_latency(forest, X_val, LATENCY_REPEAT)
+        p50s.append(p50)
+        p99s.append(p99)
+        nodes.append(forest.node_count)
+        # Exported size, leaf quantiles included (the --max-bytes model)
+        fixed, per_node, per_leaf = byte_model(forest)
+        sizes.append(fixed + per_node * forest.node_count
+                     + per_leaf * int(forest.is_leaf.sum()))
+
+    return {
+        "trial": trial,
+        "params": params,
+        "rows": int(len(splits[0][0]) if max_rows is None
+                    else min(max_rows, len(splits[0][0]))),
+        "cv_mae_usd": float(np.mean(maes)),
+        "cv_mae_std": float(np.std(maes)),
+        "cv_r2": float(np.mean(r2s)),
+        "fit_seconds": float(np.mean(fit_seconds)),
+        "p50_ms": float(np.median(p50s)),
+        "p99_ms": float(np.median(p99s)),
+        "nodes": int(np.mean(nodes)),
+        "flat_bytes": int(np.mean(sizes)),
+    }
+
+
+# ==================================================
+# Search
+# ==================================================
+def pareto_front(results, objectives=("cv_mae_usd", "p50_ms")):
+    """Trials no other trial beats or matches on every objective."""
+    front = []
+    for r in results:
+        dominated = any(
+            all(o[k] <= r[k] for k in objectives)
+            and any(o[k] < r[k] for k in objectives)
+            for o in results
+        )
+        if not dominated:
+            front.append(r)
+    return sorted(front, key=lambda r: r["cv_mae_usd"])
+
+
+def _run_rung(pool, candidates, splits, max_rows, rung):
+    futures = [pool.submit(run_trial, trial, params, splits, max_rows)
+               for trial, params in candidates]
+    results = []
+    for future in futures:
+        result = future.result()
+        result["rung"] = rung
+        results.append(result)
+        print(f"  trial {result['trial']:>3} rung {rung} rows {result['rows']:>6,}  "
+              f"MAE ${result['cv_mae_usd']:>12,.0f}  R² {result['cv_r2']:.4f}  "
+              f"fit {result['fit_seconds']:6.2f}s  p50 {result['p50_ms']:.3f}ms")
+    return results
+
+
+def search(X, y, method="random", trials=20, folds=DEFAULT_FOLDS, workers=None,
+           eta=DEFAULT_ETA, seed=0, space=SEARCH_SPACE):
+    """All trial results (every rung for halving), in submission order."""
+    if method not in ("random", "halving"):
+        raise ValueError(f"Unknown search method {method!r}")
+    rng = np.random.default_rng(seed)
+    candidates = list(enumerate(sample_params(rng, trials, space)))
+    splits = kfold_indices(len(X), folds, seed)
+    fold_rows = len(splits[0][0])
+
+    blocks, specs = share_arrays({
+        "X": np.asarray(X, dtype=np.float32),
+        "y": np.asarray(y, dtype=np.float64),
+    })
+    try:
+        with ProcessPoolExecutor(workers or os.cpu_count(), initializer=_attach_data,
+                                 initargs=(specs,)) as pool:
+            if method == "random":
+                return _run_rung(pool, candidates, splits, None, 0)
+
+            rungs = max(1, math.ceil(math.log(len(candidates), eta)))
+            rows = max(MIN_HALVING_ROWS, fold_rows // eta ** (rungs - 1))
+            results = []
+            for rung in range(rungs):
+                last = rung == rungs - 1 or rows >= fold_rows
+                rung_results = _run_rung(pool, candidates, splits,
+                                         None if last else rows, rung)
+                results.extend(rung_results)
+                if last:
+                    break
+                keep = max(1, len(candidates) // eta)
+                best = sorted(rung_results, key=lambda r: r["cv_mae_usd"])[:keep]
+                survivors = {r["trial"] for r in best}
+                candidates = [(t, p) for t, p in candidates if t in survivors]
+                rows *= eta
+            return results
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def final_results(results):
+    """Latest (full-rows) result per trial for trials that reached it."""
+    top = max(r["rung"] for r in results)
+    return [r for r in results if r["rung"] == top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune the forest's hyperparameters.")
+    parser.add_argument("--search", choices=["random", "halving"], default="random")
+    parser.add_argument("--trials", type=int, default=20)
+    parser.add_argument("--folds", type=int, default=DEFAULT_FOLDS)
+    parser.add_argument("--eta", type=int, default=DEFAULT_ETA)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write all trial results to this JSON file")
+    args = parser.parse_args(argv)
+
+    X, y = load_encoded()
+    X_train, _, y_train, _ = holdout_split(X, y)
+    print(f"{args.search} search: {args.trials} trials, {args.folds}-fold CV "
+          f"on {len(X_train):,} rows")
+    start = time.perf_counter()
+    results = search(X_train, y_train, args.search, args.trials, args.folds,
+                     args.workers, args.eta, args.seed)
+    elapsed = time.perf_counter() - start
+
+    final = final_results(results)
+    front = pareto_front(final)
+    on_front = {r["trial"] for r in front}
+    print(f"\nFinished in {elapsed:.1f}s. Full-data trials by CV MAE "
+          f"(* = Pareto front on MAE / p50 latency):")
+    print(f"  {'':1} {'trial':>5} {'MAE $':>12} {'R²':>7} {'fit s':>7} {'p50 ms':>7} "
+          f"{'p99 ms':>7} {'flat MB':>8}  params")
+    for r in sorted(final, key=lambda r: r["cv_mae_usd"]):
+        mark = "*" if r["trial"] in on_front else ""
+        print(f"  {mark:1} {r['trial']:>5} {r['cv_mae_usd']:>12,.0f} {r['cv_r2']:>7.4f} "
+              f"{r['fit_seconds']:>7.2f} {r['p50_ms']:>7.3f} {r['p99_ms']:>7.3f} "
+              f"{r['flat_bytes'] / 1e6:>8.1f}  {json.dumps(r['params'])}")
+
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump({
+                "search": args.search, "trials": args.trials, "folds": args.folds,
+                "eta": args.eta, "seed": args.seed, "seconds": elapsed,
+                "rows": len(X_train), "results": results,
+                "pareto_front": [r["trial"] for r in front],
+            }, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
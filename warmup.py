@@ -0,0 +1,71 @@
+"""
+Background warm-up of the prediction stack for fast cold starts.
+
+On a fresh process, importing the model stack and loading the artifacts
+(columns, forest, price table) takes far longer than painting the form.
+``start()`` does that work once per process on a daemon thread. The app
+calls it before rendering and only ``wait()``s when a prediction is
+requested before the load has finished.
+
+None of the prediction modules are imported here at module level: the
+point is that ``import warmup`` stays cheap.
+"""
+import threading
+import time
+
+_lock = threading.Lock()
+_ready = threading.Event()
+_thread = None
+_status = {"started_at": None, "seconds": None, "error": None}
+
+
+def load_prediction_stack():
+    """Import and load everything a prediction needs; safe to call twice."""
+    from batching import get_batcher
+    from encoder import get_encoder
+    from forest import get_forest
+    from model_registry import load_model_columns
+    from price_table import get_price_table
+
+    get_encoder(load_model_columns())
+    get_forest()
+    get_price_table()
+    get_batcher()
+
+
+def _run():
+    start = time.perf_counter()
+    try:
+        load_prediction_stack()
+    except Exception as exc:
+        # Surfaced again by the caller's own load on the prediction path.
+        _status["error"] = repr(exc)
+    finally:
+        _status["seconds"] = time.perf_counter() - start
+        _ready.set()
+
+
+def start():
+    """Begin loading in the background (no-op if already started)."""
+    global _thread
+    if _thread is not None:
+        return
+    with _lock:
+        if _thread is None:
+            _status["started_at"] = time.time()
+            _thread = threading.Thread(target=_run, name="warm-up", daemon=True)
+            _thread.start()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def wait(timeout=None):
+    """Block until the warm-up has finished; True unless it timed out."""
+    start()
+    return _ready.wait(timeout)
+
+
+def status():
+    return dict(_status, ready=is_ready())